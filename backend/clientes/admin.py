@@ -1,6 +1,34 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.core.paginator import Paginator
+from django.http import HttpResponseRedirect
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .busqueda import filtrar_por_terminos, terminos_consulta
+from .db import filas_estimadas
 from .models import TipoDocumento, Cliente, Compra
 
+LIMITE_CONTEO_EXACTO = 10000
+
+
+class PaginadorConteoEstimado(Paginator):
+    """
+    Paginator del admin que no hace COUNT(*) sobre toda la tabla: cuenta
+    como máximo LIMITE_CONTEO_EXACTO filas y, si hay más y el listado no
+    está filtrado, usa las filas estimadas por el motor. Con filtros el
+    total se queda en el límite.
+    """
+
+    @cached_property
+    def count(self):
+        conteo = self.object_list.order_by()[:LIMITE_CONTEO_EXACTO + 1].count()
+        if conteo > LIMITE_CONTEO_EXACTO and not self.object_list.query.where:
+            estimado = filas_estimadas(self.object_list.model, self.object_list.db)
+            if estimado:
+                return max(estimado, conteo)
+        return conteo
+
 
 @admin.register(TipoDocumento)
 class TipoDocumentoAdmin(admin.ModelAdmin):
@@ -15,12 +43,37 @@ class ClienteAdmin(admin.ModelAdmin):
     list_filter = ['tipo_documento', 'activo', 'fecha_registro']
     search_fields = ['numero_documento', 'nombre', 'apellido', 'correo']
     readonly_fields = ['fecha_registro']
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Prefijos sobre el índice de búsqueda en lugar de icontains en cuatro
+        # columnas; también lo usa el autocompletado del cliente en Compra
+        if terminos_consulta(search_term):
+            return filtrar_por_terminos(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
 
 
 @admin.register(Compra)
 class CompraAdmin(admin.ModelAdmin):
     list_display = ['numero_factura', 'cliente', 'fecha_compra', 'monto', 'estado']
     list_filter = ['estado', 'fecha_compra']
+    list_select_related = ['cliente']
     search_fields = ['numero_factura', 'cliente__nombre', 'cliente__apellido', 'cliente__numero_documento']
+    autocomplete_fields = ['cliente']
     date_hierarchy = 'fecha_compra'
+    paginator = PaginadorConteoEstimado
+    show_full_result_count = False
 
+    def changelist_view(self, request, extra_context=None):
+        # Sin un rango de fechas el date_hierarchy agrupa toda la tabla; si no
+        # hay filtro de fecha ni búsqueda, el listado abre en el mes actual
+        parametros = request.GET
+        if (request.method == 'GET' and not parametros.get(SEARCH_VAR)
+                and not any(nombre.startswith(f'{self.date_hierarchy}__') for nombre in parametros)):
+            hoy = timezone.localdate()
+            parametros = parametros.copy()
+            parametros[f'{self.date_hierarchy}__year'] = hoy.year
+            parametros[f'{self.date_hierarchy}__month'] = hoy.month
+            return HttpResponseRedirect(f'{request.path}?{parametros.urlencode()}')
+        return super().changelist_view(request, extra_context)
@@ -5,3 +5,10 @@ class ClientesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clientes'
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .db import aplicar_pragmas_sqlite
+
+        connection_created.connect(aplicar_pragmas_sqlite, dispatch_uid='clientes_pragmas_sqlite')
@@ -0,0 +1,91 @@
+"""
+Archivo de compras antiguas.
+
+archivar_lote mueve compras de Compra a CompraArchivada en transacciones
+cortas: cada lote se confirma por separado, así que el proceso puede
+interrumpirse y retomarse sin perder ni duplicar compras.
+
+Antes de mover compras se avanza la fecha de corte de EstadoArchivo. Los
+lectores usan compras_en_rango: si el rango pedido empieza en o después de
+la fecha de corte consultan solo Compra; si no, la vista CompraHistorica
+(Compra UNION ALL CompraArchivada).
+
+Las compras archivadas siguen contando en el resumen diario, que se
+reconstruye y verifica sobre la vista. Mientras archivar_lote borra las
+compras movidas, archivando() es verdadero y las señales de Compra no las
+descuentan del resumen ni las registran como eliminadas.
+"""
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Compra, CompraArchivada, CompraHistorica, EstadoArchivo
+
+TAMANO_LOTE_ARCHIVO = 5000
+CAMPOS_ARCHIVO = ['id', 'cliente_id', 'numero_factura', 'fecha_compra', 'monto', 'descripcion', 'estado']
+
+_archivando = ContextVar('archivando', default=False)
+
+
+def archivando():
+    """Indica si las compras que se eliminan ahora se están moviendo al archivo"""
+    return _archivando.get()
+
+
+def fecha_corte():
+    """Fecha de corte vigente o None si nunca se ha archivado"""
+    return EstadoArchivo.objects.filter(pk=1).values_list('fecha_corte', flat=True).first()
+
+
+def requiere_archivo(desde=None):
+    """Indica si un rango que empieza en `desde` (None = sin inicio) puede incluir compras archivadas"""
+    corte = fecha_corte()
+    return corte is not None and (desde is None or desde < corte)
+
+
+def compras_en_rango(desde=None):
+    """Queryset de compras para un rango que empieza en `desde`"""
+    if requiere_archivo(desde):
+        return CompraHistorica.objects.all()
+    return Compra.objects.all()
+
+
+def fijar_corte(corte):
+    """
+    Avanza la fecha de corte (nunca la retrocede) y la retorna. Se llama
+    antes de mover compras para que los lectores ya incluyan el archivo.
+    """
+    with transaction.atomic():
+        estado, _ = EstadoArchivo.objects.select_for_update().get_or_create(pk=1)
+        if estado.fecha_corte is None or corte > estado.fecha_corte:
+            estado.fecha_corte = corte
+            estado.save(update_fields=['fecha_corte', 'fecha_actualizacion'])
+    return estado.fecha_corte
+
+
+def archivar_lote(corte, tamano_lote=TAMANO_LOTE_ARCHIVO):
+    """Mueve hasta `tamano_lote` compras anteriores a `corte`. Retorna cuántas movió"""
+    with transaction.atomic():
+        filas = list(
+            Compra.objects.filter(fecha_compra__lt=corte)
+            .order_by('id')
+            .values(*CAMPOS_ARCHIVO)[:tamano_lote]
+        )
+        if not filas:
+            return 0
+
+        CompraArchivada.objects.bulk_create([CompraArchivada(**fila) for fila in filas])
+        # La compra no desaparece del resumen diario ni de los reportes, solo
+        # cambia de tabla: las señales de eliminación la ignoran
+        marca = _archivando.set(True)
+        try:
+            Compra.objects.filter(id__in=[fila['id'] for fila in filas]).delete()
+        finally:
+            _archivando.reset(marca)
+        EstadoArchivo.objects.filter(pk=1).update(
+            compras_archivadas=F('compras_archivadas') + len(filas),
+            fecha_actualizacion=timezone.now()
+        )
+    return len(filas)
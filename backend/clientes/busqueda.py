@@ -0,0 +1,198 @@
+"""
+Búsqueda rápida y autocompletado de clientes por nombre, apellido, correo,
+teléfono o número de documento.
+
+Cada cliente se indexa como palabras normalizadas (minúsculas, sin tildes
+ni signos) en TokenBusquedaCliente. Un término encuentra las palabras que
+empiezan por él con un rango [término, sucesor) sobre el índice de `token`,
+un recorrido acotado del índice en lugar de un icontains sobre la tabla.
+El rango sigue el orden por bytes: en SQLite es el orden por defecto y en
+PostgreSQL requiere una base o columna con collation "C".
+
+Con varios términos la intersección se hace en la base: se parte del
+término menos frecuente y sus tokens se filtran con un EXISTS por cada uno
+de los demás. Solo después se leen como máximo LIMITE_CANDIDATOS tokens, lo
+que acota la latencia aun para prefijos muy comunes sin perder los clientes
+que coinciden con todos los términos. El índice se mantiene con señales
+sobre Cliente; las cargas masivas deben llamar a indexar_clientes.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .models import Cliente, TokenBusquedaCliente
+
+LONGITUD_MAXIMA_TOKEN = 50
+LONGITUD_MINIMA_TERMINO = 2
+LONGITUD_MAXIMA_CONSULTA = 100
+MAXIMO_TERMINOS = 5
+LIMITE_CANDIDATOS = 5000
+LIMITE_RESULTADOS_DEFAULT = 10
+LIMITE_RESULTADOS_MAXIMO = 50
+TAMANO_LOTE_INDICE = 2000
+CAMPOS_INDEXADOS = ['numero_documento', 'nombre', 'apellido', 'correo', 'telefono']
+
+# Puntos por campo; una coincidencia exacta vale el doble que una por prefijo
+PESOS_CAMPO = {'documento': 5, 'apellido': 4, 'nombre': 4, 'correo': 2, 'telefono': 2}
+
+_SEPARADORES = re.compile(r'[^a-z0-9]+')
+_SOLO_NUMEROS = re.compile(r'^[\d\s+().-]+$')
+
+
+def normalizar(texto):
+    """'Muñoz-Peña' -> 'munoz-pena': minúsculas y sin tildes"""
+    descompuesto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    return descompuesto.encode('ascii', 'ignore').decode('ascii')
+
+
+def palabras(texto):
+    """Palabras normalizadas de un texto, solo letras y dígitos"""
+    return [palabra[:LONGITUD_MAXIMA_TOKEN] for palabra in _SEPARADORES.split(normalizar(texto)) if palabra]
+
+
+def _digitos(texto):
+    return ''.join(palabras(texto))
+
+
+def tokens_cliente(cliente):
+    """Pares (token, campo) sin repetir de un cliente"""
+    telefono = _digitos(cliente.telefono)
+    tokens = {
+        ('documento', _digitos(cliente.numero_documento)),
+        ('telefono', telefono),
+        # Sin indicativo de país, para buscar por el número local
+        ('telefono', telefono[-10:]),
+    }
+    for campo in ('nombre', 'apellido'):
+        tokens.update((campo, palabra) for palabra in palabras(getattr(cliente, campo)))
+    # El dominio de nivel superior (com, co) coincidiría con casi todos los clientes
+    usuario, _, dominio = str(cliente.correo or '').partition('@')
+    tokens.update(('correo', palabra) for palabra in palabras(usuario) + palabras(dominio)[:-1])
+    return {(token[:LONGITUD_MAXIMA_TOKEN], campo) for campo, token in tokens if token}
+
+
+def indexar_clientes(cliente_ids=None):
+    """
+    Regenera los tokens de los clientes indicados, o de todos. Retorna el
+    número de tokens escritos.
+    """
+    clientes = Cliente.objects.order_by('id').only('id', *CAMPOS_INDEXADOS)
+    if cliente_ids is not None:
+        cliente_ids = list(cliente_ids)
+
+    total = 0
+    with transaction.atomic():
+        if cliente_ids is None:
+            TokenBusquedaCliente.objects.all().delete()
+            lotes = [clientes]
+        else:
+            lotes = [
+                clientes.filter(id__in=cliente_ids[inicio:inicio + TAMANO_LOTE_INDICE])
+                for inicio in range(0, len(cliente_ids), TAMANO_LOTE_INDICE)
+            ]
+
+        nuevos = []
+        for lote in lotes:
+            if cliente_ids is not None:
+                TokenBusquedaCliente.objects.filter(cliente_id__in=lote.values('id')).delete()
+            for cliente in lote.iterator(chunk_size=TAMANO_LOTE_INDICE):
+                nuevos.extend(
+                    TokenBusquedaCliente(token=token, campo=campo, cliente_id=cliente.pk)
+                    for token, campo in tokens_cliente(cliente)
+                )
+                if len(nuevos) >= TAMANO_LOTE_INDICE:
+                    TokenBusquedaCliente.objects.bulk_create(nuevos)
+                    total += len(nuevos)
+                    nuevos = []
+        TokenBusquedaCliente.objects.bulk_create(nuevos)
+        total += len(nuevos)
+    return total
+
+
+def terminos_consulta(consulta):
+    """Términos normalizados de la consulta; un teléfono con espacios es un solo término"""
+    consulta = str(consulta or '')[:LONGITUD_MAXIMA_CONSULTA]
+    if _SOLO_NUMEROS.match(consulta):
+        terminos = [_digitos(consulta)]
+    else:
+        terminos = palabras(consulta)
+    terminos = [termino for termino in terminos if len(termino) >= LONGITUD_MINIMA_TERMINO]
+    return list(dict.fromkeys(terminos))[:MAXIMO_TERMINOS]
+
+
+def rango_prefijo(termino):
+    """Filtro de los tokens que empiezan por `termino`"""
+    return {'token__gte': termino, 'token__lt': termino[:-1] + chr(ord(termino[-1]) + 1)}
+
+
+def filtrar_por_terminos(queryset, consulta):
+    """
+    Restringe un queryset de clientes a los que coinciden con todos los
+    términos de la consulta, sin puntaje ni límite de candidatos
+    """
+    for termino in terminos_consulta(consulta):
+        tokens = TokenBusquedaCliente.objects.filter(**rango_prefijo(termino))
+        queryset = queryset.filter(id__in=tokens.values('cliente_id'))
+    return queryset
+
+
+def _tokens_termino(termino):
+    return TokenBusquedaCliente.objects.filter(**rango_prefijo(termino))
+
+
+def _frecuencia(termino):
+    """Tokens que empiezan por `termino`, contados hasta LIMITE_CANDIDATOS"""
+    return _tokens_termino(termino).order_by()[:LIMITE_CANDIDATOS].count()
+
+
+def _puntajes(termino, filas):
+    """{cliente_id: puntos} del mejor token de cada cliente para `termino`"""
+    puntajes = {}
+    for cliente_id, token, campo in filas:
+        puntos = PESOS_CAMPO[campo] * (2 if token == termino else 1)
+        if puntos > puntajes.get(cliente_id, 0):
+            puntajes[cliente_id] = puntos
+    return puntajes
+
+
+def buscar_clientes(consulta, limite=LIMITE_RESULTADOS_DEFAULT):
+    """
+    Clientes activos que coinciden con todos los términos de la consulta,
+    ordenados por puntaje. Cada cliente trae su puntaje en `puntaje`.
+    """
+    terminos = terminos_consulta(consulta)
+    if not terminos:
+        return []
+    if len(terminos) > 1:
+        terminos.sort(key=_frecuencia)
+    primero, *resto = terminos
+
+    filas = _tokens_termino(primero).filter(cliente__activo=True)
+    for termino in resto:
+        filas = filas.filter(Exists(_tokens_termino(termino).filter(cliente_id=OuterRef('cliente_id'))))
+    puntajes = _puntajes(
+        primero, filas.order_by('token').values_list('cliente_id', 'token', 'campo')[:LIMITE_CANDIDATOS]
+    )
+    # Los demás términos solo suman puntos a los candidatos ya intersecados
+    for termino in resto:
+        if not puntajes:
+            break
+        del_termino = _puntajes(
+            termino,
+            _tokens_termino(termino).filter(cliente_id__in=list(puntajes)).values_list('cliente_id', 'token', 'campo')
+        )
+        for cliente_id, puntos in del_termino.items():
+            puntajes[cliente_id] += puntos
+    if not puntajes:
+        return []
+
+    mejores = sorted(puntajes.items(), key=lambda item: (-item[1], item[0]))[:limite]
+    clientes = Cliente.objects.select_related('tipo_documento').in_bulk([cliente_id for cliente_id, _ in mejores])
+    resultados = []
+    for cliente_id, puntaje in mejores:
+        cliente = clientes[cliente_id]
+        cliente.puntaje = puntaje
+        resultados.append(cliente)
+    return resultados
@@ -0,0 +1,267 @@
+"""
+Cachés de la aplicación de clientes.
+
+CacheLocal es un caché LRU con expiración en la memoria de cada proceso,
+usado para el catálogo de tipos de documento y las respuestas de buscar.
+Las respuestas de buscar crecen con el historial del cliente, así que ese
+caché también se acota por tamaño (el de su JSON): el total no pasa de
+MAX_BYTES y las respuestas mayores que MAX_BYTES_ENTRADA no se guardan.
+Las señales lo invalidan en el proceso que escribe; en los demás procesos
+las entradas expiran según su TTL.
+
+El caché de reportes guarda en disco los libros Excel generados. La clave
+incluye los parámetros del reporte y la versión de datos (VersionDatos),
+que las señales incrementan con cada cambio en Cliente o Compra, de modo
+que una entrada deja de usarse en cuanto los datos cambian.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TipoDocumento, VersionDatos
+from .segmentacion import DIAS_RFM_DEFAULT
+from .snapshot import SnapshotCompras, usar_snapshot_por_defecto
+
+VERSION_CLIENTES = 'clientes'
+
+CONFIGURACION_CACHE_LOCAL = {
+    'catalogo': {'MAX_ENTRADAS': 32, 'TTL': 300},
+    'buscar': {'MAX_ENTRADAS': 1000, 'TTL': 60, 'MAX_BYTES': 32 * 1024 * 1024, 'MAX_BYTES_ENTRADA': 256 * 1024},
+    'segmentacion': {'MAX_ENTRADAS': 4, 'TTL': 300},
+}
+
+
+class CacheLocal:
+    """
+    Caché LRU acotado a `max_entradas` cuyas entradas expiran a los `ttl`
+    segundos. Es seguro entre hilos. Con `ttl` o `max_entradas` en 0 no
+    guarda nada. Con `max_bytes` o `max_bytes_entrada` (0 = sin límite) los
+    valores, que deben ser serializables a JSON, se miden por el tamaño de
+    su JSON: el total se acota a `max_bytes` y los valores mayores que
+    `max_bytes_entrada` no se guardan.
+    """
+    _AUSENTE = object()
+
+    def __init__(self, max_entradas, ttl, max_bytes=0, max_bytes_entrada=0):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_bytes_entrada = max_bytes_entrada
+        self.bytes = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, default=None):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return default
+            expira, valor, _ = entrada
+            if expira < time.monotonic():
+                self._quitar(clave)
+                return default
+            self._entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        if self.max_entradas <= 0 or self.ttl <= 0:
+            return
+        tamano = 0
+        if self.max_bytes or self.max_bytes_entrada:
+            tamano = len(json.dumps(valor, cls=DjangoJSONEncoder).encode())
+        with self._lock:
+            self._quitar(clave)
+            if self.max_bytes_entrada and tamano > self.max_bytes_entrada:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, valor, tamano)
+            self.bytes += tamano
+            while len(self._entradas) > self.max_entradas or (self.max_bytes and self.bytes > self.max_bytes):
+                self._quitar(next(iter(self._entradas)))
+
+    def _quitar(self, clave):
+        entrada = self._entradas.pop(clave, None)
+        if entrada is not None:
+            self.bytes -= entrada[2]
+
+    def obtener_o_calcular(self, clave, funcion):
+        valor = self.obtener(clave, self._AUSENTE)
+        if valor is self._AUSENTE:
+            valor = funcion()
+            self.guardar(clave, valor)
+        return valor
+
+    def invalidar(self, clave=None):
+        """Elimina una entrada, o todas si no se indica clave"""
+        with self._lock:
+            if clave is None:
+                self._entradas.clear()
+                self.bytes = 0
+            else:
+                self._quitar(clave)
+
+    def invalidar_si(self, condicion):
+        """Elimina las entradas cuyo valor cumple `condicion(valor)`"""
+        with self._lock:
+            for clave in [clave for clave, (_, valor, _) in self._entradas.items() if condicion(valor)]:
+                self._quitar(clave)
+
+
+_caches_locales = {}
+_caches_locales_lock = threading.Lock()
+
+
+def cache_local(nombre):
+    """
+    Instancia de CacheLocal del proceso para `nombre` ('catalogo', 'buscar'
+    o 'segmentacion'),
+    configurada con settings.CLIENTES_CACHE_LOCAL
+    """
+    with _caches_locales_lock:
+        if nombre not in _caches_locales:
+            configuracion = dict(CONFIGURACION_CACHE_LOCAL[nombre])
+            configuracion.update(getattr(settings, 'CLIENTES_CACHE_LOCAL', {}).get(nombre, {}))
+            _caches_locales[nombre] = CacheLocal(
+                configuracion['MAX_ENTRADAS'],
+                configuracion['TTL'],
+                configuracion.get('MAX_BYTES', 0),
+                configuracion.get('MAX_BYTES_ENTRADA', 0),
+            )
+        return _caches_locales[nombre]
+
+
+def tipos_documento_activos():
+    """Tipos de documento activos indexados por id, leídos del caché del catálogo"""
+    return cache_local('catalogo').obtener_o_calcular(
+        'tipos_documento_activos',
+        lambda: {tipo.pk: tipo for tipo in TipoDocumento.objects.filter(activo=True)}
+    )
+
+
+def version_datos(nombre=VERSION_CLIENTES):
+    """Versión actual de los datos de clientes y compras"""
+    version = VersionDatos.objects.filter(nombre=nombre).values_list('version', flat=True).first()
+    return version or 0
+
+
+def marca_snapshot():
+    """Marca del snapshot columnar si los reportes lo usan; cambia con cada refresco"""
+    return SnapshotCompras().marca() if usar_snapshot_por_defecto() else ''
+
+
+def incrementar_version_datos(nombre=VERSION_CLIENTES):
+    """Marca que los datos cambiaron, invalidando las entradas de caché previas"""
+    if not VersionDatos.objects.filter(nombre=nombre).update(version=F('version') + 1):
+        VersionDatos.objects.get_or_create(nombre=nombre, defaults={'version': 1})
+
+
+class CacheReportes:
+    """
+    Caché en disco de reportes generados, acotado por tamaño total.
+
+    Al superar `max_bytes` se eliminan primero las entradas usadas hace más
+    tiempo (cada acierto actualiza la fecha de modificación del archivo).
+    Los contadores de aciertos y fallos se llevan en el caché de Django.
+    """
+    CLAVE_ACIERTOS = 'clientes:cache_reportes:aciertos'
+    CLAVE_FALLOS = 'clientes:cache_reportes:fallos'
+    EXTENSION = '.xlsx'
+
+    def __init__(self, directorio=None, max_bytes=None):
+        self.directorio = Path(directorio or getattr(
+            settings, 'CLIENTES_CACHE_REPORTES_DIR', settings.BASE_DIR / 'cache_reportes'
+        ))
+        self.max_bytes = max_bytes if max_bytes is not None else getattr(
+            settings, 'CLIENTES_CACHE_REPORTES_MAX_BYTES', 200 * 1024 * 1024
+        )
+        self.directorio.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def clave(*partes):
+        """Clave estable a partir de los parámetros del reporte y la versión de datos"""
+        return hashlib.sha256('|'.join(str(parte) for parte in partes).encode()).hexdigest()
+
+    def clave_fidelizacion(self, dias, monto_minimo, segmentacion=False):
+        """
+        Clave del reporte de fidelización. La ventana es relativa a hoy, por
+        lo que la fecha también forma parte de la clave
+        """
+        return self.clave(
+            dias,
+            monto_minimo.normalize(),
+            DIAS_RFM_DEFAULT if segmentacion else None,
+            getattr(settings, 'CLIENTES_REPORTE_USAR_RESUMEN', False),
+            marca_snapshot(),
+            timezone.localdate(),
+            version_datos()
+        )
+
+    def _ruta(self, clave):
+        return self.directorio / f'{clave}{self.EXTENSION}'
+
+    def obtener(self, clave):
+        """Retorna la ruta de la entrada si existe, o None"""
+        ruta = self._ruta(clave)
+        try:
+            os.utime(ruta)
+        except FileNotFoundError:
+            self._incrementar(self.CLAVE_FALLOS)
+            return None
+        self._incrementar(self.CLAVE_ACIERTOS)
+        return ruta
+
+    def archivo_temporal(self):
+        """Archivo temporal en el directorio del caché, para poder moverlo con guardar()"""
+        return tempfile.NamedTemporaryFile(dir=self.directorio, suffix='.tmp', delete=False)
+
+    def guardar(self, clave, ruta_temporal):
+        """Mueve un archivo generado al caché y aplica el límite de tamaño"""
+        ruta = self._ruta(clave)
+        os.replace(ruta_temporal, ruta)
+        self._expulsar()
+        return ruta
+
+    def _entradas(self):
+        entradas = []
+        for ruta in self.directorio.glob(f'*{self.EXTENSION}'):
+            try:
+                info = ruta.stat()
+            except FileNotFoundError:
+                continue
+            entradas.append((info.st_mtime, info.st_size, ruta))
+        return entradas
+
+    def _expulsar(self):
+        entradas = sorted(self._entradas())
+        total = sum(tamano for _, tamano, _ in entradas)
+        for _, tamano, ruta in entradas:
+            if total <= self.max_bytes:
+                break
+            ruta.unlink(missing_ok=True)
+            total -= tamano
+
+    def _incrementar(self, clave):
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.set(clave, 1, timeout=None)
+
+    def estadisticas(self):
+        entradas = self._entradas()
+        return {
+            'aciertos': cache.get(self.CLAVE_ACIERTOS, 0),
+            'fallos': cache.get(self.CLAVE_FALLOS, 0),
+            'entradas': len(entradas),
+            'bytes': sum(tamano for _, tamano, _ in entradas),
+            'max_bytes': self.max_bytes,
+        }
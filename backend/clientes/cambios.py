@@ -0,0 +1,111 @@
+"""
+Registro de cambios de clientes y compras para la sincronización
+incremental de los sistemas externos.
+
+Cada alta, modificación o eliminación agrega una fila a Cambio; su id es
+la secuencia del feed /api/cambios/?desde=<cursor>, que se lee por rango
+sobre la llave primaria en lotes acotados. Las eliminaciones quedan como
+marcas (operación "eliminado") y archivar una compra no es un cambio: la
+compra sigue existiendo en CompraArchivada.
+
+registrar_cambios incrementa VersionDatos en la misma transacción antes de
+insertar. La actualización bloquea esa fila hasta el commit, así que las
+transacciones que escriben se serializan y las secuencias se confirman en
+orden: un lector nunca ve la secuencia n + 1 antes que la n. Las señales
+registran los cambios de save() y delete(); las escrituras masivas deben
+llamar a registrar_cambios.
+"""
+from django.db import transaction
+
+from .cache import incrementar_version_datos
+from .models import Cambio, Cliente, Compra, CompraArchivada
+
+LIMITE_CAMBIOS_DEFAULT = 500
+LIMITE_CAMBIOS_MAXIMO = 5000
+TAMANO_LOTE_CAMBIOS = 5000
+# Las compras archivadas se publican como compras
+MODELO_CAMBIO = {Cliente: 'cliente', Compra: 'compra', CompraArchivada: 'compra'}
+
+
+def registrar_cambios(modelo, objeto_ids, operacion):
+    """Registra la misma operación para varios objetos de `modelo` ('cliente' o 'compra')"""
+    objeto_ids = list(objeto_ids)
+    with transaction.atomic():
+        incrementar_version_datos()
+        for inicio in range(0, len(objeto_ids), TAMANO_LOTE_CAMBIOS):
+            Cambio.objects.bulk_create([
+                Cambio(modelo=modelo, objeto_id=objeto_id, operacion=operacion)
+                for objeto_id in objeto_ids[inicio:inicio + TAMANO_LOTE_CAMBIOS]
+            ])
+
+
+def parametros_cambios(parametros):
+    """
+    Lee el cursor, el límite y el modelo desde los query params. Lanza
+    ValueError si alguno no es válido.
+    """
+    try:
+        desde = int(parametros.get('desde', 0))
+    except (TypeError, ValueError):
+        raise ValueError('El parámetro desde debe ser un número entero')
+    try:
+        limite = int(parametros.get('limite', LIMITE_CAMBIOS_DEFAULT))
+    except (TypeError, ValueError):
+        raise ValueError('El parámetro limite debe ser un número entero')
+
+    if desde < 0:
+        raise ValueError('El parámetro desde no puede ser negativo')
+    modelo = parametros.get('modelo') or None
+    if modelo is not None and modelo not in dict(Cambio.MODELOS):
+        raise ValueError(f"Modelo no válido. Opciones: {', '.join(dict(Cambio.MODELOS))}")
+    return desde, max(1, min(limite, LIMITE_CAMBIOS_MAXIMO)), modelo
+
+
+def leer_cambios(desde=0, limite=LIMITE_CAMBIOS_DEFAULT, modelo=None):
+    """
+    Cambios posteriores al cursor `desde`, como máximo `limite` filas del
+    registro. Retorna (cambios, cursor, hay_mas).
+
+    Varios cambios de un mismo objeto en el lote se reducen al último. Cada
+    cambio que no es una eliminación trae el objeto actual en `objeto`; los
+    que ya no existen se omiten, porque su eliminación llega en este lote o
+    en uno siguiente. El cursor es la secuencia de la última fila leída.
+    """
+    filas = Cambio.objects.filter(id__gt=desde)
+    if modelo is not None:
+        filas = filas.filter(modelo=modelo)
+    filas = list(filas.order_by('id')[:limite + 1])
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    cursor = filas[-1].id if filas else desde
+
+    ultimos = {}
+    for cambio in filas:
+        ultimos.pop((cambio.modelo, cambio.objeto_id), None)
+        ultimos[(cambio.modelo, cambio.objeto_id)] = cambio
+
+    vigentes = {
+        nombre: [
+            objeto_id for (modelo_cambio, objeto_id), cambio in ultimos.items()
+            if modelo_cambio == nombre and cambio.operacion != Cambio.ELIMINADO
+        ]
+        for nombre in dict(Cambio.MODELOS)
+    }
+    objetos = {
+        'cliente': Cliente.objects.select_related('tipo_documento').in_bulk(vigentes['cliente']),
+        'compra': Compra.objects.in_bulk(vigentes['compra']),
+    }
+    archivadas = set(vigentes['compra']) - set(objetos['compra'])
+    if archivadas:
+        objetos['compra'].update(CompraArchivada.objects.in_bulk(archivadas))
+
+    cambios = []
+    for (nombre, objeto_id), cambio in ultimos.items():
+        if cambio.operacion != Cambio.ELIMINADO:
+            cambio.objeto = objetos[nombre].get(objeto_id)
+            if cambio.objeto is None:
+                continue
+        else:
+            cambio.objeto = None
+        cambios.append(cambio)
+    return cambios, cursor, hay_mas
@@ -0,0 +1,51 @@
+"""
+Ajustes de la conexión a la base de datos.
+
+En SQLite se aplican los PRAGMA de CLIENTES_SQLITE_PRAGMAS al abrir cada
+conexión: con WAL los lectores (buscar, reportes) no bloquean al escritor
+ni al revés, y busy_timeout hace que una escritura espere en lugar de
+fallar con "database is locked". Como las conexiones son persistentes
+(CONN_MAX_AGE), el costo se paga una vez por conexión y no por solicitud.
+
+filas_estimadas lee el número de filas de una tabla de las estadísticas
+del motor, sin recorrerla.
+"""
+from django.conf import settings
+from django.db import connections
+
+
+def aplicar_pragmas_sqlite(sender, connection, **kwargs):
+    """Receptor de connection_created; no hace nada en otros motores"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'CLIENTES_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for nombre, valor in pragmas.items():
+            cursor.execute(f'PRAGMA {nombre} = {valor}')
+
+
+def filas_estimadas(modelo, using='default'):
+    """
+    Filas aproximadas de la tabla del modelo según las estadísticas del
+    motor (sqlite_stat1 tras ANALYZE, pg_class.reltuples en PostgreSQL), o
+    None si no hay estadísticas
+    """
+    connection = connections[using]
+    tabla = modelo._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [tabla])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [tabla])
+        else:
+            return None
+        fila = cursor.fetchone()
+
+    if fila is None or fila[0] is None:
+        return None
+    # En sqlite_stat1 el primer número de `stat` es el total de filas
+    filas = int(str(fila[0]).split()[0])
+    return filas if filas >= 0 else None
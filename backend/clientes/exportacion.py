@@ -0,0 +1,241 @@
+"""
+Exportación masiva de clientes con sus compras.
+
+Los clientes y las compras se leen con dos iteradores por lotes
+(`iterator(chunk_size=...)`), ambos ordenados por cliente, y se combinan
+como un merge ordenado. Así la memoria depende del tamaño del lote y no
+del número de clientes o compras. Si hay compras archivadas, se leen con
+un tercer iterador que se combina de la misma forma.
+"""
+import csv
+import heapq
+import json
+from datetime import datetime, time, timedelta
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .archivo import compras_en_rango, requiere_archivo
+from .models import Cliente, Compra, CompraArchivada
+
+TAMANO_LOTE_EXPORTACION = 2000
+FORMATOS_EXPORTACION = ('csv', 'ndjson')
+
+CAMPOS_CLIENTE = [
+    'id',
+    'tipo_documento__codigo',
+    'numero_documento',
+    'nombre',
+    'apellido',
+    'correo',
+    'telefono',
+    'fecha_registro',
+    'activo',
+]
+CAMPOS_COMPRA = ['id', 'numero_factura', 'fecha_compra', 'monto', 'descripcion', 'estado']
+
+ENCABEZADOS_CSV = [
+    'cliente_id',
+    'tipo_documento',
+    'numero_documento',
+    'nombre',
+    'apellido',
+    'correo',
+    'telefono',
+    'fecha_registro',
+    'activo',
+    'compra_id',
+    'numero_factura',
+    'fecha_compra',
+    'monto',
+    'descripcion',
+    'estado',
+]
+
+
+class Eco:
+    """Objeto tipo archivo que retorna lo escrito, para usar csv.writer en un generador"""
+
+    def write(self, valor):
+        return valor
+
+
+def _inicio_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def leer_booleano(parametros, nombre):
+    """
+    Lee un parámetro sí/no recibido como texto. Retorna None si no viene y
+    lanza ValueError si no es un valor reconocido.
+    """
+    valor = parametros.get(nombre)
+    if valor in (None, ''):
+        return None
+    if str(valor).lower() in ('1', 'true', 'si', 'sí'):
+        return True
+    if str(valor).lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'El parámetro {nombre} debe ser true o false')
+
+
+def parametros_exportacion(parametros):
+    """
+    Convierte los filtros recibidos como texto (query params u opciones de
+    comando) en argumentos para filtrar_clientes. Lanza ValueError si alguno
+    no es válido.
+    """
+    filtros = {}
+
+    activo = leer_booleano(parametros, 'activo')
+    if activo is not None:
+        filtros['activo'] = activo
+
+    tipo_documento_id = parametros.get('tipo_documento_id')
+    if tipo_documento_id not in (None, ''):
+        try:
+            filtros['tipo_documento_id'] = int(tipo_documento_id)
+        except (TypeError, ValueError):
+            raise ValueError('El parámetro tipo_documento_id debe ser un número entero')
+
+    filtros.update(_leer_fechas(parametros, ('registro_desde', 'registro_hasta')))
+    return filtros
+
+
+def parametros_rango_fechas(parametros):
+    """Lee el rango opcional ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD para compras_de_cliente"""
+    return _leer_fechas(parametros, ('desde', 'hasta'))
+
+
+def _leer_fechas(parametros, nombres):
+    fechas = {}
+    for nombre in nombres:
+        valor = parametros.get(nombre)
+        if valor in (None, ''):
+            continue
+        try:
+            fecha = parse_date(str(valor))
+        except ValueError:
+            fecha = None
+        if fecha is None:
+            raise ValueError(f'El parámetro {nombre} debe tener formato AAAA-MM-DD')
+        fechas[nombre] = fecha
+    return fechas
+
+
+def filtrar_clientes(activo=None, tipo_documento_id=None, registro_desde=None, registro_hasta=None):
+    """Clientes a exportar; las fechas de registro son inclusivas"""
+    clientes = Cliente.objects.all()
+    if activo is not None:
+        clientes = clientes.filter(activo=activo)
+    if tipo_documento_id is not None:
+        clientes = clientes.filter(tipo_documento_id=tipo_documento_id)
+    if registro_desde is not None:
+        clientes = clientes.filter(fecha_registro__gte=_inicio_dia(registro_desde))
+    if registro_hasta is not None:
+        clientes = clientes.filter(fecha_registro__lt=_inicio_dia(registro_hasta + timedelta(days=1)))
+    return clientes
+
+
+def filtrar_compras_cliente(cliente, desde=None, hasta=None):
+    """
+    Compras de un cliente en el rango de fechas (inclusivo). Incluye las
+    compras archivadas solo si el rango empieza antes de la fecha de corte.
+    """
+    inicio = _inicio_dia(desde) if desde is not None else None
+    compras = compras_en_rango(inicio).filter(cliente=cliente)
+    if inicio is not None:
+        compras = compras.filter(fecha_compra__gte=inicio)
+    if hasta is not None:
+        compras = compras.filter(fecha_compra__lt=_inicio_dia(hasta + timedelta(days=1)))
+    return compras
+
+
+def compras_de_cliente(cliente, desde=None, hasta=None, tamano_lote=TAMANO_LOTE_EXPORTACION):
+    """Compras de un cliente, de la más reciente a la más antigua, leídas por lotes"""
+    return (
+        filtrar_compras_cliente(cliente, desde, hasta)
+        .order_by('-fecha_compra', '-id')
+        .iterator(chunk_size=tamano_lote)
+    )
+
+
+def _compras_ordenadas(modelo, clientes, tamano_lote):
+    return (
+        modelo.objects.filter(cliente__in=clientes.values('id'))
+        .order_by('cliente_id', 'id')
+        .values('cliente_id', *CAMPOS_COMPRA)
+        .iterator(chunk_size=tamano_lote)
+    )
+
+
+def clientes_con_compras(clientes, tamano_lote=TAMANO_LOTE_EXPORTACION):
+    """
+    Genera (cliente, [compras]) para cada cliente del queryset, en orden de id.
+    Solo las compras de un cliente están en memoria a la vez.
+    """
+    filas_clientes = clientes.order_by('id').values(*CAMPOS_CLIENTE).iterator(chunk_size=tamano_lote)
+    filas_compras = _compras_ordenadas(Compra, clientes, tamano_lote)
+    if requiere_archivo():
+        # Cada tabla se lee en el orden de su índice y se combinan en memoria
+        filas_compras = heapq.merge(
+            filas_compras,
+            _compras_ordenadas(CompraArchivada, clientes, tamano_lote),
+            key=itemgetter('cliente_id', 'id')
+        )
+
+    compra = next(filas_compras, None)
+    for cliente in filas_clientes:
+        compras = []
+        while compra is not None and compra['cliente_id'] <= cliente['id']:
+            if compra['cliente_id'] == cliente['id']:
+                compras.append(compra)
+            compra = next(filas_compras, None)
+        yield cliente, compras
+
+
+def _fecha_iso(valor):
+    return timezone.localtime(valor).isoformat() if isinstance(valor, datetime) else valor
+
+
+def _valor_csv(valor):
+    return '' if valor is None else _fecha_iso(valor)
+
+
+def exportar_csv(clientes, tamano_lote=TAMANO_LOTE_EXPORTACION):
+    """Genera líneas CSV: una por compra, o una sin compra para clientes sin compras"""
+    writer = csv.writer(Eco())
+    yield writer.writerow(ENCABEZADOS_CSV)
+    vacia = [''] * len(CAMPOS_COMPRA)
+
+    for cliente, compras in clientes_con_compras(clientes, tamano_lote):
+        datos_cliente = [_valor_csv(cliente[campo]) for campo in CAMPOS_CLIENTE]
+        if not compras:
+            yield writer.writerow(datos_cliente + vacia)
+        for compra in compras:
+            yield writer.writerow(datos_cliente + [_valor_csv(compra[campo]) for campo in CAMPOS_COMPRA])
+
+
+def exportar_ndjson(clientes, tamano_lote=TAMANO_LOTE_EXPORTACION):
+    """Genera una línea JSON por cliente con sus compras anidadas"""
+    for cliente, compras in clientes_con_compras(clientes, tamano_lote):
+        documento = {
+            campo.replace('__codigo', ''): _fecha_iso(cliente[campo])
+            for campo in CAMPOS_CLIENTE
+        }
+        documento['compras'] = [
+            {campo: _fecha_iso(compra[campo]) for campo in CAMPOS_COMPRA}
+            for compra in compras
+        ]
+        yield json.dumps(documento, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def exportar(clientes, formato, tamano_lote=TAMANO_LOTE_EXPORTACION):
+    """Generador de la exportación en el formato indicado"""
+    if formato == 'csv':
+        return exportar_csv(clientes, tamano_lote)
+    if formato == 'ndjson':
+        return exportar_ndjson(clientes, tamano_lote)
+    raise ValueError(f"Formato no válido. Use: {', '.join(FORMATOS_EXPORTACION)}")
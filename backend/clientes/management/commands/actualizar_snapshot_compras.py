@@ -0,0 +1,45 @@
+"""
+Comando de Django para refrescar el snapshot columnar de compras
+
+Pensado para ejecutarse periódicamente (cron): cada ejecución solo lee las
+compras nuevas o modificadas desde la anterior.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clientes.snapshot import SnapshotCompras
+
+
+class Command(BaseCommand):
+    help = 'Agrega al snapshot columnar las compras nuevas o modificadas desde el último refresco'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--completo',
+            action='store_true',
+            help='Reconstruye el snapshot desde cero'
+        )
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Compara cantidad y monto del snapshot con la base después de refrescar'
+        )
+
+    def handle(self, *args, **options):
+        snapshot = SnapshotCompras()
+        inicio = time.monotonic()
+        resultado = snapshot.actualizar(completo=options['completo'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Snapshot actualizado en {time.monotonic() - inicio:.1f} s: "
+            f"{resultado['nuevas']} nuevas, {resultado['modificadas']} modificadas, "
+            f"{resultado['eliminadas']} eliminadas ({resultado['filas']} filas)"
+        ))
+
+        if options['verificar']:
+            diferencias = snapshot.verificar()
+            if diferencias:
+                for diferencia in diferencias:
+                    self.stderr.write(f'  Diferencia: {diferencia}')
+                raise CommandError('El snapshot no coincide con la base; ejecute con --completo')
+            self.stdout.write(self.style.SUCCESS('✓ El snapshot coincide con la base'))
@@ -0,0 +1,78 @@
+"""
+Comando de Django para mover las compras antiguas a la tabla de archivo
+
+Cada lote se mueve en su propia transacción; si el comando se interrumpe,
+basta con ejecutarlo de nuevo para continuar donde quedó.
+"""
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from clientes.archivo import TAMANO_LOTE_ARCHIVO, archivar_lote, fijar_corte
+from clientes.models import Compra
+
+
+class Command(BaseCommand):
+    help = 'Mueve por lotes las compras anteriores al horizonte a la tabla de archivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=getattr(settings, 'CLIENTES_ARCHIVO_DIAS', 730),
+            help='Horizonte: se archivan las compras de hace más de estos días (default: CLIENTES_ARCHIVO_DIAS)'
+        )
+        parser.add_argument(
+            '--tamano-lote',
+            type=int,
+            default=TAMANO_LOTE_ARCHIVO,
+            help=f'Compras por lote y transacción (default: {TAMANO_LOTE_ARCHIVO})'
+        )
+        parser.add_argument(
+            '--maximo',
+            type=int,
+            default=0,
+            help='Máximo de compras a mover en esta ejecución; 0 = sin límite'
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo cuenta las compras que se archivarían'
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser mayor que cero')
+        if options['tamano_lote'] <= 0:
+            raise CommandError('--tamano-lote debe ser mayor que cero')
+
+        # El corte cae al inicio de un día local para no partir los días del resumen
+        dia_corte = timezone.localdate() - timedelta(days=options['dias'])
+        corte = timezone.make_aware(datetime.combine(dia_corte, dt_time.min))
+        pendientes = Compra.objects.filter(fecha_compra__lt=corte).count()
+
+        if options['simular']:
+            self.stdout.write(f'{pendientes} compras anteriores a {dia_corte} se archivarían')
+            return
+
+        fijar_corte(corte)
+        maximo = options['maximo'] or pendientes
+        movidas = 0
+        inicio = time.monotonic()
+        while movidas < maximo:
+            cantidad = archivar_lote(corte, min(options['tamano_lote'], maximo - movidas))
+            if not cantidad:
+                break
+            movidas += cantidad
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'  {movidas}/{maximo} compras archivadas')
+
+        restantes = Compra.objects.filter(fecha_compra__lt=corte).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {movidas} compras anteriores a {dia_corte} archivadas en {time.monotonic() - inicio:.1f} s'
+        ))
+        if restantes:
+            self.stdout.write(f'  Quedan {restantes} por archivar; ejecute el comando de nuevo para continuar')
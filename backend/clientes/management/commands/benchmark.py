@@ -0,0 +1,330 @@
+"""
+Comando de Django para medir los endpoints más usados de la API
+
+Crea una base de datos temporal (la misma que usan las pruebas de Django),
+la puebla con seed_data y mide cada endpoint con el cliente de pruebas:
+número de consultas SQL, tiempo y memoria pico (tracemalloc). El resultado
+se emite en JSON y puede compararse contra una línea base guardada.
+
+Con --concurrencia también compara, bajo ráfagas de solicitudes
+simultáneas por ASGI, las vistas sync con sus versiones de views_async.
+"""
+import asyncio
+import io
+import json
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from clientes.cache import cache_local
+from clientes.models import Cliente
+from clientes.views import PRESUPUESTO_CONSULTAS_BUSCAR
+
+# Máximo de consultas SQL permitido por endpoint, sin importar la línea base
+PRESUPUESTOS_CONSULTAS = {
+    'buscar': PRESUPUESTO_CONSULTAS_BUSCAR,
+    'buscar_lote': PRESUPUESTO_CONSULTAS_BUSCAR,
+    'listado': 1,
+}
+
+
+class Command(BaseCommand):
+    help = 'Mide tiempo, consultas y memoria de los endpoints principales sobre una base temporal'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clientes',
+            type=int,
+            default=1000,
+            help='Clientes a generar en la base temporal (default: 1000)'
+        )
+        parser.add_argument(
+            '--compras-por-cliente',
+            type=float,
+            default=5.5,
+            help='Promedio de compras por cliente (default: 5.5)'
+        )
+        parser.add_argument(
+            '--ballenas',
+            type=float,
+            default=0.01,
+            help='Fracción de clientes con muchas compras (default: 0.01)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Semilla de los datos (default: 42)'
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=5,
+            help='Repeticiones por endpoint (default: 5)'
+        )
+        parser.add_argument(
+            '--salida',
+            help='Archivo donde guardar el resultado en JSON (default: salida estándar)'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Archivo JSON de una ejecución previa contra el cual comparar'
+        )
+        parser.add_argument(
+            '--concurrencia',
+            type=int,
+            default=0,
+            help='Además envía ráfagas de N solicitudes simultáneas por ASGI a las vistas sync y async'
+        )
+        parser.add_argument(
+            '--umbral',
+            type=float,
+            default=0.20,
+            help='Aumento relativo de tiempo o memoria tolerado frente a la línea base (default: 0.20)'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser mayor que cero')
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as archivo:
+                baseline = json.load(archivo)
+
+        directorio_cache = tempfile.mkdtemp(prefix='benchmark_cache_')
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(CLIENTES_CACHE_REPORTES_DIR=directorio_cache):
+                call_command(
+                    'seed_data',
+                    clientes=options['clientes'],
+                    compras_por_cliente=options['compras_por_cliente'],
+                    ballenas=options['ballenas'],
+                    seed=options['seed'],
+                    stdout=io.StringIO()
+                )
+                resultados = self._medir_endpoints(options['repeticiones'], directorio_cache)
+                concurrencia = None
+                if options['concurrencia'] > 0:
+                    concurrencia = self._medir_concurrencia(
+                        options['concurrencia'], options['repeticiones'], directorio_cache
+                    )
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            shutil.rmtree(directorio_cache, ignore_errors=True)
+
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'parametros': {
+                'clientes': options['clientes'],
+                'compras_por_cliente': options['compras_por_cliente'],
+                'ballenas': options['ballenas'],
+                'seed': options['seed'],
+                'repeticiones': options['repeticiones'],
+            },
+            'endpoints': resultados,
+        }
+        if concurrencia is not None:
+            informe['parametros']['concurrencia'] = options['concurrencia']
+            informe['concurrencia'] = concurrencia
+
+        contenido = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(contenido)
+            self.stderr.write(self.style.SUCCESS(f"✓ Resultado guardado en {options['salida']}"))
+        else:
+            self.stdout.write(contenido)
+
+        problemas = self._revisar_presupuestos(resultados)
+        if baseline is not None:
+            problemas += self._comparar(resultados, baseline['endpoints'], options['umbral'])
+        if problemas:
+            for problema in problemas:
+                self.stderr.write(self.style.ERROR(f'  {problema}'))
+            raise CommandError(f'{len(problemas)} regresiones de rendimiento')
+        self.stderr.write(self.style.SUCCESS('✓ Sin regresiones de rendimiento'))
+
+    def _casos(self):
+        """(nombre, método, url, cuerpo) de cada endpoint a medir"""
+        # El cliente con más compras representa a los clientes corporativos grandes
+        mayor = Cliente.objects.con_totales_compras().order_by('-total_compras_completadas').first()
+        tipico = Cliente.objects.order_by('id').first()
+        lote = [
+            {'tipo_documento_id': tipo_id, 'numero_documento': numero}
+            for tipo_id, numero in Cliente.objects.order_by('id').values_list(
+                'tipo_documento_id', 'numero_documento'
+            )[:100]
+        ]
+        return [
+            ('buscar', 'get', f'/api/clientes/buscar/?tipo_documento_id={tipico.tipo_documento_id}'
+                              f'&numero_documento={tipico.numero_documento}', None),
+            ('buscar_mayor', 'get', f'/api/clientes/buscar/?tipo_documento_id={mayor.tipo_documento_id}'
+                                    f'&numero_documento={mayor.numero_documento}', None),
+            ('buscar_lote', 'post', '/api/clientes/buscar-lote/', {'documentos': lote}),
+            ('listado', 'get', '/api/clientes/?page_size=100', None),
+            ('exportar_csv', 'get', f'/api/clientes/{mayor.pk}/exportar/?formato=csv', None),
+            ('exportar_excel', 'get', f'/api/clientes/{mayor.pk}/exportar/?formato=excel', None),
+            ('exportar_txt', 'get', f'/api/clientes/{mayor.pk}/exportar/?formato=txt', None),
+            ('reporte_fidelizacion', 'get', '/api/reporte-fidelizacion/generar/', None),
+            ('segmentacion_rfm', 'get', '/api/reporte-fidelizacion/segmentacion/?segmento=Campeones', None),
+        ]
+
+    def _limpiar_caches(self, directorio_cache):
+        """Cada repetición mide el camino completo, no una respuesta en caché"""
+        cache_local('buscar').invalidar()
+        cache_local('segmentacion').invalidar()
+        shutil.rmtree(directorio_cache, ignore_errors=True)
+
+    def _ejecutar(self, cliente_http, metodo, url, cuerpo):
+        if metodo == 'post':
+            respuesta = cliente_http.post(url, cuerpo, content_type='application/json')
+        else:
+            respuesta = cliente_http.get(url)
+        # Consumir el contenido para incluir la generación de respuestas en streaming
+        contenido = b''.join(respuesta.streaming_content) if respuesta.streaming else respuesta.content
+        return respuesta.status_code, len(contenido)
+
+    def _medir_endpoints(self, repeticiones, directorio_cache):
+        cliente_http = Client()
+        resultados = {}
+
+        for nombre, metodo, url, cuerpo in self._casos():
+            tiempos = []
+            for _ in range(repeticiones):
+                self._limpiar_caches(directorio_cache)
+                # El registro de consultas tiene un máximo; vaciarlo evita que quede lleno tras seed_data
+                reset_queries()
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    estado, tamano = self._ejecutar(cliente_http, metodo, url, cuerpo)
+                    tiempos.append(time.perf_counter() - inicio)
+
+            # La memoria se mide aparte porque tracemalloc hace más lenta la ejecución
+            self._limpiar_caches(directorio_cache)
+            tracemalloc.start()
+            try:
+                self._ejecutar(cliente_http, metodo, url, cuerpo)
+                _, memoria_pico = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            resultados[nombre] = {
+                'estado': estado,
+                'bytes_respuesta': tamano,
+                'consultas': len(consultas),
+                'tiempo_mediana_ms': round(statistics.median(tiempos) * 1000, 3),
+                'tiempo_min_ms': round(min(tiempos) * 1000, 3),
+                'tiempo_max_ms': round(max(tiempos) * 1000, 3),
+                'memoria_pico_kb': round(memoria_pico / 1024, 1),
+            }
+            self.stderr.write(
+                f"  {nombre}: {resultados[nombre]['tiempo_mediana_ms']} ms, "
+                f"{resultados[nombre]['consultas']} consultas, {resultados[nombre]['memoria_pico_kb']} KB"
+            )
+        return resultados
+
+    def _medir_concurrencia(self, concurrencia, repeticiones, directorio_cache):
+        """
+        Compara la vista sync de DRF con su versión async bajo carga: cada
+        ráfaga envía `concurrencia` solicitudes distintas a la vez por el
+        manejador ASGI (AsyncClient), sin caché
+        """
+        documentos = list(
+            Cliente.objects.order_by('id').values_list('id', 'tipo_documento_id', 'numero_documento')[:concurrencia]
+        )
+        rutas = {
+            'buscar': [
+                f'clientes/buscar/?tipo_documento_id={tipo_id}&numero_documento={numero}'
+                for _, tipo_id, numero in documentos
+            ],
+            'compras': [f'clientes/{cliente_id}/compras/?page_size=100' for cliente_id, _, _ in documentos],
+            # Un monto distinto por solicitud para que ninguna salga del caché de reportes
+            'reporte_fidelizacion': [
+                f'reporte-fidelizacion/generar/?monto_minimo={1000000 + indice}'
+                for indice in range(concurrencia)
+            ],
+        }
+
+        resultados = {}
+        for nombre, rutas_caso in rutas.items():
+            resultados[nombre] = {}
+            for variante, prefijo in (('sync', '/api/'), ('async', '/api/async/')):
+                resultados[nombre][variante] = asyncio.run(
+                    self._rafagas([prefijo + ruta for ruta in rutas_caso], repeticiones, directorio_cache)
+                )
+            self.stderr.write(
+                f"  {nombre} x{concurrencia}: sync {resultados[nombre]['sync']['solicitudes_por_segundo']} sol/s, "
+                f"async {resultados[nombre]['async']['solicitudes_por_segundo']} sol/s"
+            )
+        return resultados
+
+    async def _rafagas(self, urls, repeticiones, directorio_cache):
+        cliente_http = AsyncClient()
+        latencias, errores, duracion = [], 0, 0.0
+        for _ in range(repeticiones):
+            self._limpiar_caches(directorio_cache)
+            inicio = time.perf_counter()
+            respuestas = await asyncio.gather(*(self._solicitud_async(cliente_http, url) for url in urls))
+            duracion += time.perf_counter() - inicio
+            for estado, latencia in respuestas:
+                errores += estado >= 400
+                latencias.append(latencia)
+
+        latencias.sort()
+        return {
+            'solicitudes_por_segundo': round(len(latencias) / duracion, 1),
+            'latencia_mediana_ms': round(statistics.median(latencias) * 1000, 3),
+            'latencia_p95_ms': round(latencias[int(len(latencias) * 0.95) - 1] * 1000, 3),
+            'errores': errores,
+        }
+
+    async def _solicitud_async(self, cliente_http, url):
+        inicio = time.perf_counter()
+        respuesta = await cliente_http.get(url)
+        if respuesta.streaming and respuesta.is_async:
+            async for _ in respuesta.streaming_content:
+                pass
+        elif respuesta.streaming:
+            for _ in respuesta.streaming_content:
+                pass
+        return respuesta.status_code, time.perf_counter() - inicio
+
+    def _revisar_presupuestos(self, resultados):
+        problemas = []
+        for nombre, presupuesto in PRESUPUESTOS_CONSULTAS.items():
+            if nombre in resultados and resultados[nombre]['consultas'] > presupuesto:
+                problemas.append(
+                    f"{nombre}: {resultados[nombre]['consultas']} consultas, presupuesto {presupuesto}"
+                )
+        for nombre, resultado in resultados.items():
+            if resultado['estado'] >= 400:
+                problemas.append(f"{nombre}: respondió {resultado['estado']}")
+        return problemas
+
+    def _comparar(self, resultados, baseline, umbral):
+        problemas = []
+        for nombre, base in baseline.items():
+            actual = resultados.get(nombre)
+            if actual is None:
+                continue
+            if actual['consultas'] > base['consultas']:
+                problemas.append(f"{nombre}: consultas {base['consultas']} -> {actual['consultas']}")
+            for metrica in ('tiempo_mediana_ms', 'memoria_pico_kb'):
+                if base[metrica] and actual[metrica] > base[metrica] * (1 + umbral):
+                    problemas.append(
+                        f'{nombre}: {metrica} {base[metrica]} -> {actual[metrica]} '
+                        f'(+{(actual[metrica] / base[metrica] - 1) * 100:.0f}%)'
+                    )
+        return problemas
@@ -0,0 +1,56 @@
+"""
+Comando de Django para exportar todos los clientes con sus compras,
+pensado para la carga nocturna a la bodega de datos
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clientes.exportacion import (
+    FORMATOS_EXPORTACION,
+    TAMANO_LOTE_EXPORTACION,
+    exportar,
+    filtrar_clientes,
+    parametros_exportacion
+)
+
+
+class Command(BaseCommand):
+    help = 'Exporta todos los clientes con sus compras en CSV o NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--formato',
+            choices=FORMATOS_EXPORTACION,
+            default='ndjson',
+            help='Formato de salida (default: ndjson)'
+        )
+        parser.add_argument(
+            '--salida',
+            help='Archivo de salida (default: salida estándar)'
+        )
+        parser.add_argument('--activo', help='Filtrar por clientes activos: true o false')
+        parser.add_argument('--tipo-documento-id', help='Filtrar por tipo de documento')
+        parser.add_argument('--registro-desde', help='Fecha de registro inicial (AAAA-MM-DD)')
+        parser.add_argument('--registro-hasta', help='Fecha de registro final (AAAA-MM-DD)')
+        parser.add_argument(
+            '--tamano-lote',
+            type=int,
+            default=TAMANO_LOTE_EXPORTACION,
+            help=f'Filas leídas por lote (default: {TAMANO_LOTE_EXPORTACION})'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            filtros = parametros_exportacion(options)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        lineas = exportar(filtrar_clientes(**filtros), options['formato'], options['tamano_lote'])
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8', newline='') as archivo:
+                archivo.writelines(lineas)
+            self.stderr.write(self.style.SUCCESS(f"✓ Exportación generada en {options['salida']}"))
+        else:
+            sys.stdout.writelines(lineas)
@@ -0,0 +1,284 @@
+"""
+Comando de Django para importar compras desde archivos CSV o XLSX
+(volcados diarios de los puntos de venta)
+
+El archivo se lee en streaming y se procesa por lotes: los clientes y las
+facturas existentes de cada lote se resuelven con una consulta IN y las
+compras se escriben con bulk_create/bulk_update dentro de una transacción,
+así que la memoria depende del tamaño del lote y no del archivo.
+"""
+import csv
+import time
+from datetime import datetime, time as dt_time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from openpyxl import load_workbook
+
+from clientes.cache import cache_local
+from clientes.cambios import registrar_cambios
+from clientes.models import ESTADOS_COMPRA, Cambio, Cliente, Compra, CompraArchivada
+from clientes.resumen import aplicar_deltas_resumen, sumar_deltas
+
+COLUMNAS_REQUERIDAS = ['numero_factura', 'numero_documento', 'fecha_compra', 'monto']
+# bulk_update no aplica auto_now, así que fecha_actualizacion se asigna a mano
+CAMPOS_ACTUALIZABLES = ['cliente', 'fecha_compra', 'monto', 'descripcion', 'estado', 'fecha_actualizacion']
+ESTADOS_VALIDOS = {estado for estado, _ in ESTADOS_COMPRA}
+MONTO_MAXIMO = Decimal(10) ** 13  # Compra.monto tiene 15 dígitos con 2 decimales
+
+
+class FilaRechazada(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Importa compras desde un archivo CSV o XLSX por lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx')
+        parser.add_argument(
+            '--tamano-lote',
+            type=int,
+            default=5000,
+            help='Filas por lote y transacción (default: 5000)'
+        )
+        parser.add_argument(
+            '--actualizar',
+            action='store_true',
+            help='Actualiza las facturas existentes en lugar de omitirlas'
+        )
+        parser.add_argument(
+            '--delimitador',
+            default=',',
+            help='Delimitador del CSV (default: ,)'
+        )
+        parser.add_argument(
+            '--rechazos',
+            help='Archivo CSV donde escribir las filas rechazadas y el motivo'
+        )
+
+    def handle(self, *args, **options):
+        ruta = Path(options['archivo'])
+        if not ruta.exists():
+            raise CommandError(f'No existe el archivo {ruta}')
+        if options['tamano_lote'] <= 0:
+            raise CommandError('--tamano-lote debe ser mayor que cero')
+
+        self.actualizar = options['actualizar']
+        self.verbosity = options['verbosity']
+        self.totales = {'leidas': 0, 'creadas': 0, 'actualizadas': 0, 'omitidas': 0, 'rechazadas': 0}
+        archivo_rechazos = open(options['rechazos'], 'w', encoding='utf-8', newline='') if options['rechazos'] else None
+        self.rechazos = csv.writer(archivo_rechazos) if archivo_rechazos else None
+        if self.rechazos:
+            self.rechazos.writerow(['fila', 'numero_factura', 'motivo'])
+
+        inicio = time.monotonic()
+        try:
+            lote = []
+            for numero_fila, fila in self._leer_filas(ruta, options['delimitador']):
+                self.totales['leidas'] += 1
+                lote.append((numero_fila, fila))
+                if len(lote) >= options['tamano_lote']:
+                    self._procesar_lote(lote)
+                    lote = []
+                    self._informar_avance(inicio)
+            if lote:
+                self._procesar_lote(lote)
+        finally:
+            if archivo_rechazos:
+                archivo_rechazos.close()
+
+        # Las escrituras masivas no disparan las señales que invalidan los cachés
+        cache_local('buscar').invalidar()
+
+        duracion = max(time.monotonic() - inicio, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {self.totales['leidas']} filas en {duracion:.1f} s "
+            f"({self.totales['leidas'] / duracion:,.0f} filas/s)"
+        ))
+        self.stdout.write(
+            f"  Creadas: {self.totales['creadas']}  Actualizadas: {self.totales['actualizadas']}  "
+            f"Omitidas (ya existían): {self.totales['omitidas']}  Rechazadas: {self.totales['rechazadas']}"
+        )
+
+    def _leer_filas(self, ruta, delimitador):
+        """Genera (número de fila, dict) leyendo el archivo en streaming"""
+        if ruta.suffix.lower() == '.xlsx':
+            yield from self._leer_xlsx(ruta)
+        elif ruta.suffix.lower() == '.csv':
+            yield from self._leer_csv(ruta, delimitador)
+        else:
+            raise CommandError('Formato no soportado. Use un archivo .csv o .xlsx')
+
+    def _leer_csv(self, ruta, delimitador):
+        with open(ruta, encoding='utf-8-sig', newline='') as archivo:
+            lector = csv.DictReader(archivo, delimiter=delimitador)
+            self._validar_encabezados(lector.fieldnames or [])
+            for numero_fila, fila in enumerate(lector, start=2):
+                yield numero_fila, fila
+
+    def _leer_xlsx(self, ruta):
+        wb = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            filas = wb.active.iter_rows(values_only=True)
+            encabezados = [str(valor).strip() if valor is not None else '' for valor in next(filas, ())]
+            self._validar_encabezados(encabezados)
+            for numero_fila, valores in enumerate(filas, start=2):
+                if all(valor is None for valor in valores):
+                    continue
+                yield numero_fila, dict(zip(encabezados, valores))
+        finally:
+            wb.close()
+
+    def _validar_encabezados(self, encabezados):
+        faltantes = [columna for columna in COLUMNAS_REQUERIDAS if columna not in encabezados]
+        if faltantes:
+            raise CommandError(f"Faltan columnas en el archivo: {', '.join(faltantes)}")
+
+    def _normalizar(self, fila):
+        """Valida una fila y retorna sus valores convertidos"""
+        numero_factura = str(fila.get('numero_factura') or '').strip()
+        numero_documento = str(fila.get('numero_documento') or '').strip()
+        if not numero_factura:
+            raise FilaRechazada('numero_factura vacío')
+        if not numero_documento:
+            raise FilaRechazada('numero_documento vacío')
+
+        fecha_compra = self._fecha(fila.get('fecha_compra'))
+        try:
+            monto = Decimal(str(fila.get('monto')).strip())
+        except (InvalidOperation, ValueError):
+            raise FilaRechazada('monto no numérico')
+        if not monto.is_finite() or monto < 0 or monto >= MONTO_MAXIMO:
+            raise FilaRechazada('monto negativo o fuera de rango')
+
+        estado = str(fila.get('estado') or 'completada').strip().lower()
+        if estado not in ESTADOS_VALIDOS:
+            raise FilaRechazada(f'estado no válido: {estado}')
+
+        return {
+            'numero_factura': numero_factura,
+            'numero_documento': numero_documento,
+            'tipo_documento': str(fila.get('tipo_documento') or '').strip().upper(),
+            'fecha_compra': fecha_compra,
+            'monto': monto.quantize(Decimal('0.01')),
+            'estado': estado,
+            'descripcion': str(fila.get('descripcion') or '').strip() or None,
+        }
+
+    def _fecha(self, valor):
+        if isinstance(valor, datetime):
+            fecha = valor
+        else:
+            texto = str(valor or '').strip()
+            try:
+                fecha = parse_datetime(texto)
+                if fecha is None:
+                    solo_fecha = parse_date(texto) if texto else None
+                    if solo_fecha is None:
+                        raise ValueError
+                    fecha = datetime.combine(solo_fecha, dt_time.min)
+            except ValueError:
+                raise FilaRechazada('fecha_compra no válida')
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        return fecha
+
+    def _rechazar(self, numero_fila, numero_factura, motivo):
+        self.totales['rechazadas'] += 1
+        if self.rechazos:
+            self.rechazos.writerow([numero_fila, numero_factura, motivo])
+        elif self.totales['rechazadas'] <= 20:
+            self.stderr.write(f'  Fila {numero_fila} rechazada: {motivo}')
+
+    def _procesar_lote(self, lote):
+        # Validar y quedarse con la última aparición de cada factura del lote
+        filas = {}
+        for numero_fila, fila in lote:
+            try:
+                datos = self._normalizar(fila)
+            except FilaRechazada as exc:
+                self._rechazar(numero_fila, fila.get('numero_factura'), str(exc))
+                continue
+            filas[datos['numero_factura']] = (numero_fila, datos)
+
+        clientes = {
+            numero_documento: (cliente_id, codigo)
+            for numero_documento, cliente_id, codigo in Cliente.objects.filter(
+                numero_documento__in={datos['numero_documento'] for _, datos in filas.values()}
+            ).values_list('numero_documento', 'id', 'tipo_documento__codigo')
+        }
+        # Con los valores anteriores se descuentan del resumen las compras modificadas
+        existentes = {
+            numero_factura: (compra_id, cliente_id, fecha_compra, estado, monto)
+            for numero_factura, compra_id, cliente_id, fecha_compra, estado, monto in Compra.objects.filter(
+                numero_factura__in=filas.keys()
+            ).values_list('numero_factura', 'id', 'cliente_id', 'fecha_compra', 'estado', 'monto')
+        }
+        # Las facturas archivadas no se pueden volver a crear ni modificar
+        archivadas = set(
+            CompraArchivada.objects.filter(numero_factura__in=filas.keys()).values_list('numero_factura', flat=True)
+        )
+
+        nuevas, modificadas, deltas = [], [], {}
+        for numero_fila, datos in filas.values():
+            cliente = clientes.get(datos['numero_documento'])
+            if cliente is None:
+                self._rechazar(numero_fila, datos['numero_factura'], 'cliente no encontrado')
+                continue
+            if datos['numero_factura'] in archivadas:
+                self._rechazar(numero_fila, datos['numero_factura'], 'factura archivada')
+                continue
+            cliente_id, codigo = cliente
+            if datos['tipo_documento'] and datos['tipo_documento'] != codigo:
+                self._rechazar(numero_fila, datos['numero_factura'], 'tipo_documento no coincide con el cliente')
+                continue
+
+            compra = Compra(
+                cliente_id=cliente_id,
+                numero_factura=datos['numero_factura'],
+                fecha_compra=datos['fecha_compra'],
+                monto=datos['monto'],
+                estado=datos['estado'],
+                descripcion=datos['descripcion'],
+            )
+            existente = existentes.get(datos['numero_factura'])
+            if existente is None:
+                nuevas.append(compra)
+            elif self.actualizar:
+                compra_id, *anterior, monto_anterior = existente
+                compra.pk = compra_id
+                compra.fecha_actualizacion = timezone.now()
+                modificadas.append(compra)
+                sumar_deltas(deltas, *anterior, -1, -monto_anterior)
+            else:
+                self.totales['omitidas'] += 1
+                continue
+            sumar_deltas(deltas, cliente_id, compra.fecha_compra, compra.estado, 1, compra.monto)
+
+        if not nuevas and not modificadas:
+            return
+
+        with transaction.atomic():
+            Compra.objects.bulk_create(nuevas)
+            Compra.objects.bulk_update(modificadas, CAMPOS_ACTUALIZABLES)
+            # bulk_create y bulk_update no disparan las señales del resumen
+            # ni las del feed de cambios; el resumen recibe solo los deltas del lote
+            aplicar_deltas_resumen(deltas)
+            registrar_cambios('compra', [compra.pk for compra in nuevas], Cambio.CREADO)
+            registrar_cambios('compra', [compra.pk for compra in modificadas], Cambio.ACTUALIZADO)
+
+        self.totales['creadas'] += len(nuevas)
+        self.totales['actualizadas'] += len(modificadas)
+
+    def _informar_avance(self, inicio):
+        if self.verbosity < 2:
+            return
+        duracion = max(time.monotonic() - inicio, 1e-9)
+        self.stdout.write(
+            f"  {self.totales['leidas']} filas ({self.totales['leidas'] / duracion:,.0f} filas/s)"
+        )
@@ -0,0 +1,54 @@
+"""
+Comando de Django que actúa como worker de la cola de trabajos de reporte
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from clientes.trabajos import ejecutar_trabajo, limpiar_trabajos, tomar_siguiente_trabajo
+
+
+class Command(BaseCommand):
+    help = 'Procesa los trabajos de reporte encolados y limpia los vencidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa los trabajos pendientes y termina en lugar de quedarse escuchando'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos de espera cuando la cola está vacía (default: 2)'
+        )
+        parser.add_argument(
+            '--intervalo-limpieza',
+            type=float,
+            default=300.0,
+            help='Segundos entre limpiezas de trabajos vencidos (default: 300)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Worker de reportes iniciado'))
+        ultima_limpieza = None
+
+        while True:
+            ahora = time.monotonic()
+            if ultima_limpieza is None or ahora - ultima_limpieza >= options['intervalo_limpieza']:
+                eliminados = limpiar_trabajos()
+                if eliminados:
+                    self.stdout.write(f'  Trabajos vencidos eliminados: {eliminados}')
+                ultima_limpieza = ahora
+
+            trabajo = tomar_siguiente_trabajo()
+            if trabajo is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            trabajo = ejecutar_trabajo(trabajo)
+            estilo = self.style.SUCCESS if trabajo.estado == trabajo.ESTADO_COMPLETADO else self.style.ERROR
+            self.stdout.write(estilo(f'  {trabajo}'))
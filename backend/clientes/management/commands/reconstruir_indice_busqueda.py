@@ -0,0 +1,19 @@
+"""
+Comando de Django para reconstruir el índice de búsqueda de clientes
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from clientes.busqueda import indexar_clientes
+
+
+class Command(BaseCommand):
+    help = 'Regenera desde cero los tokens de búsqueda y autocompletado de todos los clientes'
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        total_tokens = indexar_clientes()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Índice de búsqueda reconstruido ({total_tokens} tokens en {time.monotonic() - inicio:.1f} s)'
+        ))
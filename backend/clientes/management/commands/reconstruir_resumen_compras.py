@@ -0,0 +1,30 @@
+"""
+Comando de Django para reconstruir y verificar el resumen diario de compras
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from clientes.resumen import reconstruir_resumen, verificar_resumen
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero el resumen diario de compras por cliente y lo verifica'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solo-verificar',
+            action='store_true',
+            help='No reconstruye, solo compara el resumen contra las compras'
+        )
+
+    def handle(self, *args, **options):
+        if not options['solo_verificar']:
+            total_filas = reconstruir_resumen()
+            self.stdout.write(self.style.SUCCESS(f'✓ Resumen reconstruido ({total_filas} filas)'))
+
+        diferencias = verificar_resumen()
+        if diferencias:
+            for cliente_id, fecha, estado in diferencias[:20]:
+                self.stderr.write(f'  Diferencia: cliente={cliente_id} fecha={fecha} estado={estado}')
+            raise CommandError(f'El resumen tiene {len(diferencias)} diferencias con las compras')
+
+        self.stdout.write(self.style.SUCCESS('✓ El resumen coincide con las compras'))
@@ -0,0 +1,63 @@
+"""
+Comando de Django para generar el reporte de fidelización en un archivo Excel
+sin pasar por la API
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from clientes.reportes import (
+    DIAS_VENTANA_DEFAULT,
+    MONTO_MINIMO_DEFAULT,
+    generar_reporte_xlsx,
+    parametros_reporte
+)
+
+
+class Command(BaseCommand):
+    help = 'Genera el reporte de fidelización de clientes en un archivo Excel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=DIAS_VENTANA_DEFAULT,
+            help=f'Ventana de días hacia atrás (default: {DIAS_VENTANA_DEFAULT})'
+        )
+        parser.add_argument(
+            '--monto-minimo',
+            type=Decimal,
+            default=MONTO_MINIMO_DEFAULT,
+            help=f'Monto mínimo en COP (default: {MONTO_MINIMO_DEFAULT})'
+        )
+        parser.add_argument(
+            '--segmentacion',
+            action='store_true',
+            help='Incluye la hoja de segmentación RFM'
+        )
+        parser.add_argument(
+            '--salida',
+            help='Ruta del archivo a generar (default: reporte_fidelizacion_<fecha>.xlsx)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            dias, monto_minimo = parametros_reporte(options)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        salida = options['salida'] or (
+            f"reporte_fidelizacion_{timezone.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        )
+
+        total_filas = generar_reporte_xlsx(
+            salida,
+            dias=dias,
+            monto_minimo=monto_minimo,
+            incluir_segmentacion=options['segmentacion']
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Reporte generado en {salida} ({total_filas} clientes elegibles)'
+        ))
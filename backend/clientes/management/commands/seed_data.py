@@ -1,14 +1,44 @@
 """
 Comando de Django para poblar la base de datos con datos de prueba
-Usa pandas para generar datos aleatorios
+Usa NumPy para generar los datos por bloques y los escribe con bulk_create,
+de modo que se puedan producir desde miles hasta millones de compras
 """
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from datetime import timedelta
-import random
-import pandas as pd
+import time
 
-from clientes.models import TipoDocumento, Cliente, Compra
+import numpy as np
+
+from clientes.busqueda import indexar_clientes
+from clientes.cache import cache_local
+from clientes.cambios import registrar_cambios
+from clientes.models import TipoDocumento, Cambio, Cliente, Compra
+from clientes.resumen import reconstruir_resumen
+
+# Nombres y apellidos comunes en Colombia
+NOMBRES = np.array([
+    'Carlos', 'María', 'Juan', 'Ana', 'Luis', 'Laura', 'Pedro', 'Sofía',
+    'Andrés', 'Valentina', 'Diego', 'Isabella', 'Camilo', 'Mariana',
+    'Sebastián', 'Daniela', 'Javier', 'Natalia', 'Felipe', 'Andrea'
+])
+
+APELLIDOS = np.array([
+    'García', 'Rodríguez', 'González', 'Fernández', 'López', 'Martínez',
+    'Sánchez', 'Pérez', 'Gómez', 'Martín', 'Jiménez', 'Ruiz', 'Hernández',
+    'Díaz', 'Moreno', 'Muñoz', 'Álvarez', 'Romero', 'Gutiérrez', 'Navarro'
+])
+
+PREFIJOS_PASAPORTE = np.array(['AB', 'CD', 'EF', 'GH'])
+
+# Los números de documento se obtienen de una permutación afín del rango de
+# 8 dígitos: (desplazamiento + i * PASO) mod ESPACIO no se repite para
+# i < ESPACIO porque PASO es primo y no divide a ESPACIO
+BASE_DOCUMENTO = 10_000_000
+ESPACIO_DOCUMENTO = 90_000_000
+PASO_DOCUMENTO = 48_271
+
+DISTRIBUCIONES = ('uniforme', 'poisson', 'geometrica')
 
 
 class Command(BaseCommand):
@@ -21,28 +51,82 @@ class Command(BaseCommand):
             default=50,
             help='Número de clientes a crear (default: 50)'
         )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Semilla para generar siempre los mismos datos'
+        )
+        parser.add_argument(
+            '--compras-por-cliente',
+            type=float,
+            default=5.5,
+            help='Promedio de compras por cliente (default: 5.5)'
+        )
+        parser.add_argument(
+            '--distribucion',
+            choices=DISTRIBUCIONES,
+            default='uniforme',
+            help='Distribución del número de compras por cliente (default: uniforme)'
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=60,
+            help='Las compras se reparten en los últimos N días (default: 60)'
+        )
+        parser.add_argument(
+            '--ballenas',
+            type=float,
+            default=0.0,
+            help='Fracción de clientes "ballena" con muchas más compras (default: 0)'
+        )
+        parser.add_argument(
+            '--factor-ballena',
+            type=int,
+            default=50,
+            help='Multiplicador de compras de los clientes ballena (default: 50)'
+        )
+        parser.add_argument(
+            '--tamano-lote',
+            type=int,
+            default=5000,
+            help='Filas por bulk_create (default: 5000)'
+        )
 
     def handle(self, *args, **options):
+        if options['compras_por_cliente'] < 1:
+            raise CommandError('--compras-por-cliente debe ser al menos 1')
+        if not 0 <= options['ballenas'] <= 1:
+            raise CommandError('--ballenas debe estar entre 0 y 1')
+        if options['dias'] < 1 or options['tamano_lote'] < 1:
+            raise CommandError('--dias y --tamano-lote deben ser mayores que cero')
+
         self.stdout.write(self.style.SUCCESS('Iniciando población de datos...'))
-        
+        self.rng = np.random.default_rng(options['seed'])
+        self.opciones = options
+        self.ahora = timezone.now()
+        inicio = time.monotonic()
+
         # Crear tipos de documento si no existen
         tipos_doc = self._crear_tipos_documento()
-        
-        # Crear clientes
-        num_clientes = options['clientes']
-        clientes = self._crear_clientes(tipos_doc, num_clientes)
-        
-        # Crear compras
-        self._crear_compras(clientes)
-        
+
+        # Crear clientes y sus compras por bloques
+        num_clientes, num_compras = self._crear_clientes_y_compras(tipos_doc, options['clientes'])
+
         # Asegurar que al menos un cliente cumpla las condiciones de fidelización
         self._crear_cliente_fidelizacion(tipos_doc)
-        
+
+        # bulk_create no dispara las señales que invalidan los cachés; la versión
+        # de datos la incrementa registrar_cambios con cada bloque
+        cache_local('buscar').invalidar()
+
         self.stdout.write(self.style.SUCCESS(f'✓ Se crearon {len(tipos_doc)} tipos de documento'))
-        self.stdout.write(self.style.SUCCESS(f'✓ Se crearon {len(clientes)} clientes'))
-        self.stdout.write(self.style.SUCCESS('✓ Se crearon compras para los clientes'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Se crearon {num_clientes} clientes'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Se crearon {num_compras} compras para los clientes'))
         self.stdout.write(self.style.SUCCESS('✓ Se creó al menos un cliente elegible para fidelización'))
-        self.stdout.write(self.style.SUCCESS('\n¡Datos de prueba creados exitosamente!'))
+        self.stdout.write(self.style.SUCCESS(
+            f'\n¡Datos de prueba creados exitosamente en {time.monotonic() - inicio:.1f} s!'
+        ))
 
     def _crear_tipos_documento(self):
         """Crea los tipos de documento si no existen"""
@@ -51,7 +135,7 @@ class Command(BaseCommand):
             {'codigo': 'CC', 'nombre': 'Cédula', 'descripcion': 'Cédula de Ciudadanía'},
             {'codigo': 'PA', 'nombre': 'Pasaporte', 'descripcion': 'Pasaporte'},
         ]
-        
+
         tipos = []
         for tipo_data in tipos_data:
             tipo, created = TipoDocumento.objects.get_or_create(
@@ -59,104 +143,142 @@ class Command(BaseCommand):
                 defaults=tipo_data
             )
             tipos.append(tipo)
-        
+
         return tipos
 
-    def _crear_clientes(self, tipos_doc, num_clientes):
-        """Crea clientes usando pandas para generar datos aleatorios"""
-        # Nombres y apellidos comunes en Colombia
-        nombres = [
-            'Carlos', 'María', 'Juan', 'Ana', 'Luis', 'Laura', 'Pedro', 'Sofía',
-            'Andrés', 'Valentina', 'Diego', 'Isabella', 'Camilo', 'Mariana',
-            'Sebastián', 'Daniela', 'Javier', 'Natalia', 'Felipe', 'Andrea'
-        ]
-        
-        apellidos = [
-            'García', 'Rodríguez', 'González', 'Fernández', 'López', 'Martínez',
-            'Sánchez', 'Pérez', 'Gómez', 'Martín', 'Jiménez', 'Ruiz', 'Hernández',
-            'Díaz', 'Moreno', 'Muñoz', 'Álvarez', 'Romero', 'Gutiérrez', 'Navarro'
-        ]
-        
-        # Generar datos con pandas
-        df_clientes = pd.DataFrame({
-            'nombre': [random.choice(nombres) for _ in range(num_clientes)],
-            'apellido': [random.choice(apellidos) for _ in range(num_clientes)],
-            'tipo_doc': [random.choice(tipos_doc) for _ in range(num_clientes)],
-        })
-        
+    def _crear_clientes_y_compras(self, tipos_doc, num_clientes):
+        """Genera los clientes por bloques; retorna (clientes creados, compras creadas)"""
+        desplazamiento = int(self.rng.integers(ESPACIO_DOCUMENTO))
+        tamano_lote = self.opciones['tamano_lote']
+        total_clientes = total_compras = 0
+
+        for inicio in range(0, num_clientes, tamano_lote):
+            indices = np.arange(inicio, min(inicio + tamano_lote, num_clientes), dtype=np.int64)
+            bases = BASE_DOCUMENTO + (desplazamiento + indices * PASO_DOCUMENTO) % ESPACIO_DOCUMENTO
+
+            ultimo_cliente = Cliente.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            ultima_compra = Compra.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            clientes_ids, creados = self._crear_bloque_clientes(tipos_doc, bases)
+            total_clientes += creados
+            total_compras += self._crear_bloque_compras(clientes_ids)
+            reconstruir_resumen(clientes_ids.values())
+            indexar_clientes(clientes_ids.values())
+            # bulk_create con ignore_conflicts no retorna los ids: las altas
+            # del bloque son las filas posteriores al último id previo
+            altas_clientes = Cliente.objects.filter(id__gt=ultimo_cliente).order_by('id')
+            altas_compras = Compra.objects.filter(id__gt=ultima_compra).order_by('id')
+            registrar_cambios('cliente', altas_clientes.values_list('id', flat=True), Cambio.CREADO)
+            registrar_cambios('compra', altas_compras.values_list('id', flat=True), Cambio.CREADO)
+
+            if self.opciones['verbosity'] >= 2:
+                self.stdout.write(f'  {inicio + len(indices)} de {num_clientes} clientes procesados')
+
+        return total_clientes, total_compras
+
+    def _crear_bloque_clientes(self, tipos_doc, bases):
+        """Crea un bloque de clientes; retorna ({numero_documento: id}, creados)"""
+        n = len(bases)
+        tipos_idx = self.rng.integers(len(tipos_doc), size=n)
+        nombres = NOMBRES[self.rng.integers(len(NOMBRES), size=n)]
+        apellidos = APELLIDOS[self.rng.integers(len(APELLIDOS), size=n)]
+        telefonos = self.rng.integers(100000000, 999999999, size=n, endpoint=True)
+        prefijos = PREFIJOS_PASAPORTE[bases % len(PREFIJOS_PASAPORTE)]
+
         # Generar números de documento según el tipo
-        def generar_numero_doc(tipo_doc):
-            if tipo_doc.codigo == 'NIT':
-                return f"{random.randint(80000000, 99999999)}-{random.randint(1, 9)}"
-            elif tipo_doc.codigo == 'CC':
-                return str(random.randint(10000000, 99999999))
+        documentos = []
+        for tipo_idx, base, prefijo in zip(tipos_idx, bases, prefijos):
+            codigo = tipos_doc[tipo_idx].codigo
+            if codigo == 'NIT':
+                documentos.append(f'{base}-{base % 9 + 1}')
+            elif codigo == 'CC':
+                documentos.append(str(base))
             else:  # Pasaporte
-                return f"{random.choice(['AB', 'CD', 'EF', 'GH'])}{random.randint(100000, 999999)}"
-        
-        df_clientes['numero_doc'] = df_clientes['tipo_doc'].apply(generar_numero_doc)
-        
-        # Generar correos y teléfonos
-        df_clientes['correo'] = df_clientes.apply(
-            lambda row: f"{row['nombre'].lower()}.{row['apellido'].lower()}@email.com",
-            axis=1
-        )
-        df_clientes['telefono'] = [
-            f"3{random.randint(100000000, 999999999)}" for _ in range(num_clientes)
-        ]
-        
-        # Crear clientes en la base de datos
-        clientes = []
-        for _, row in df_clientes.iterrows():
-            # Verificar si el cliente ya existe
-            cliente, created = Cliente.objects.get_or_create(
-                tipo_documento=row['tipo_doc'],
-                numero_documento=row['numero_doc'],
-                defaults={
-                    'nombre': row['nombre'],
-                    'apellido': row['apellido'],
-                    'correo': row['correo'],
-                    'telefono': row['telefono'],
-                }
+                documentos.append(f'{prefijo}{base}')
+
+        clientes = [
+            Cliente(
+                tipo_documento=tipos_doc[tipo_idx],
+                numero_documento=documento,
+                nombre=nombre,
+                apellido=apellido,
+                correo=f'{nombre.lower()}.{apellido.lower()}@email.com',
+                telefono=f'3{telefono}',
             )
-            clientes.append(cliente)
-        
-        return clientes
-
-    def _crear_compras(self, clientes):
-        """Crea compras aleatorias para los clientes"""
-        fecha_actual = timezone.now()
-        
-        for cliente in clientes:
-            # Cada cliente tendrá entre 1 y 10 compras
-            num_compras = random.randint(1, 10)
-            
-            for i in range(num_compras):
-                # Fechas aleatorias en los últimos 60 días
-                dias_atras = random.randint(0, 60)
-                fecha_compra = fecha_actual - timedelta(days=dias_atras)
-                
-                # Montos aleatorios entre 100.000 y 10.000.000
-                monto = random.randint(100000, 10000000)
-                
-                numero_factura = f"FAC-{cliente.numero_documento}-{i+1:04d}"
-                
-                Compra.objects.get_or_create(
-                    numero_factura=numero_factura,
-                    defaults={
-                        'cliente': cliente,
-                        'fecha_compra': fecha_compra,
-                        'monto': monto,
-                        'descripcion': f'Compra #{i+1} del cliente',
-                        'estado': random.choice(['completada', 'completada', 'completada', 'pendiente']),
-                    }
+            for tipo_idx, documento, nombre, apellido, telefono
+            in zip(tipos_idx, documentos, nombres, apellidos, telefonos)
+        ]
+
+        # Los clientes que ya existen se conservan, igual que con get_or_create
+        existentes = Cliente.objects.filter(numero_documento__in=documentos).count()
+        Cliente.objects.bulk_create(clientes, ignore_conflicts=True)
+        ids = dict(
+            Cliente.objects.filter(numero_documento__in=documentos).values_list('numero_documento', 'id')
+        )
+        return ids, len(ids) - existentes
+
+    def _compras_por_cliente(self, n):
+        media = self.opciones['compras_por_cliente']
+        distribucion = self.opciones['distribucion']
+        if distribucion == 'uniforme':
+            cantidades = self.rng.integers(1, int(round(2 * media - 1)), size=n, endpoint=True)
+        elif distribucion == 'poisson':
+            cantidades = 1 + self.rng.poisson(media - 1, size=n)
+        else:  # geometrica: muchos clientes con pocas compras y una cola larga
+            cantidades = self.rng.geometric(1 / media, size=n)
+
+        ballenas = self.rng.random(n) < self.opciones['ballenas']
+        cantidades[ballenas] *= self.opciones['factor_ballena']
+        return cantidades.astype(np.int64)
+
+    def _crear_bloque_compras(self, clientes_ids):
+        """Crea las compras de un bloque de clientes; retorna cuántas se crearon"""
+        # Ordenar por documento para que la asignación no dependa del orden de la consulta
+        ordenados = sorted(clientes_ids.items())
+        documentos = np.array([documento for documento, _ in ordenados], dtype=object)
+        ids = np.array([cliente_id for _, cliente_id in ordenados], dtype=np.int64)
+        existentes = Compra.objects.filter(cliente_id__in=ids.tolist()).count()
+        cantidades = self._compras_por_cliente(len(ids))
+        total = int(cantidades.sum())
+
+        # Índice de cada compra dentro de su cliente (1, 2, ..., n)
+        posiciones = np.repeat(np.arange(len(ids)), cantidades)
+        consecutivos = np.arange(total) - np.repeat(np.cumsum(cantidades) - cantidades, cantidades) + 1
+
+        # Fechas aleatorias en los últimos N días y montos entre 100.000 y 10.000.000
+        segundos_atras = self.rng.integers(0, self.opciones['dias'] * 86400, size=total)
+        montos = self.rng.integers(100000, 10000000, size=total, endpoint=True)
+        estados = self.rng.choice(['completada', 'pendiente'], size=total, p=[0.75, 0.25])
+
+        tamano_lote = self.opciones['tamano_lote']
+        for inicio in range(0, total, tamano_lote):
+            fin = min(inicio + tamano_lote, total)
+            compras = [
+                Compra(
+                    cliente_id=ids[posicion],
+                    numero_factura=f'FAC-{documentos[posicion]}-{consecutivo:04d}',
+                    fecha_compra=self.ahora - timedelta(seconds=int(segundos)),
+                    monto=int(monto),
+                    descripcion=f'Compra #{consecutivo} del cliente',
+                    estado=estado,
+                )
+                for posicion, consecutivo, segundos, monto, estado in zip(
+                    posiciones[inicio:fin],
+                    consecutivos[inicio:fin],
+                    segundos_atras[inicio:fin],
+                    montos[inicio:fin],
+                    estados[inicio:fin],
                 )
+            ]
+            # Las facturas que ya existen se omiten, igual que con get_or_create
+            Compra.objects.bulk_create(compras, ignore_conflicts=True)
+        return Compra.objects.filter(cliente_id__in=ids.tolist()).count() - existentes
 
     def _crear_cliente_fidelizacion(self, tipos_doc):
         """Crea un cliente específico que cumpla las condiciones de fidelización"""
         # Cliente con compras superiores a 5 millones en el último mes
-        tipo_doc = random.choice(tipos_doc)
-        numero_doc = f"FIDEL-{random.randint(1000, 9999)}"
-        
+        tipo_doc = tipos_doc[self.rng.integers(len(tipos_doc))]
+        numero_doc = f"FIDEL-{self.rng.integers(1000, 9999, endpoint=True)}"
+
         cliente, created = Cliente.objects.get_or_create(
             tipo_documento=tipo_doc,
             numero_documento=numero_doc,
@@ -167,25 +289,24 @@ class Command(BaseCommand):
                 'telefono': '3001234567',
             }
         )
-        
+
         # Crear múltiples compras en el último mes que sumen más de 5 millones
-        fecha_actual = timezone.now()
         monto_total = 0
         objetivo = 6000000  # 6 millones para asegurar que supere los 5
-        
+
         compra_num = 1
         while monto_total < objetivo:
-            dias_atras = random.randint(0, 30)  # Último mes
-            fecha_compra = fecha_actual - timedelta(days=dias_atras)
-            
+            dias_atras = int(self.rng.integers(0, 30, endpoint=True))  # Último mes
+            fecha_compra = self.ahora - timedelta(days=dias_atras)
+
             # Monto entre 500.000 y 2.000.000
-            monto = random.randint(500000, 2000000)
-            
+            monto = int(self.rng.integers(500000, 2000000, endpoint=True))
+
             if monto_total + monto > objetivo:
-                monto = objetivo - monto_total + random.randint(100000, 500000)
-            
+                monto = objetivo - monto_total + int(self.rng.integers(100000, 500000, endpoint=True))
+
             numero_factura = f"FAC-FIDEL-{compra_num:04d}"
-            
+
             Compra.objects.get_or_create(
                 numero_factura=numero_factura,
                 defaults={
@@ -196,14 +317,13 @@ class Command(BaseCommand):
                     'estado': 'completada',
                 }
             )
-            
+
             monto_total += monto
             compra_num += 1
-        
+
         self.stdout.write(
             self.style.SUCCESS(
                 f'  Cliente fidelización creado: {cliente.numero_documento} '
                 f'(Total compras: ${monto_total:,.2f} COP)'
             )
         )
-
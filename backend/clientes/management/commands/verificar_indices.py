@@ -0,0 +1,113 @@
+"""
+Comando de Django para verificar que las consultas frecuentes usan índices
+
+Ejecuta EXPLAIN sobre cada consulta y falla si el plan recorre completa la
+tabla vigilada o no usa ninguno de los índices diseñados para ella. Sirve
+para detectar que un cambio en una consulta o en los índices dejó al motor
+sin un índice adecuado.
+
+Entre los índices diseñados el motor elige según el tamaño de las tablas y
+sus estadísticas, así que cualquiera de ellos es válido. Usar --analizar
+(ANALYZE) en bases recién pobladas para que el plan sea el de producción.
+"""
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from clientes.archivo import compras_en_rango
+from clientes.models import Cliente, Compra, ResumenCompraDiaria
+from clientes.reportes import clientes_fidelizacion
+from clientes.segmentacion import DIAS_RFM_DEFAULT
+
+# Recorridos completos de una tabla en SQLite y PostgreSQL
+RECORRIDO_COMPLETO = r'(SCAN {tabla}\b|Seq Scan on {tabla}\b)'
+
+
+def nombre_indice(modelo, campos=None, nombre=None):
+    """Nombre real del índice de Meta.indexes con esos campos"""
+    for indice in modelo._meta.indexes:
+        if indice.name == nombre or (campos is not None and list(indice.fields) == campos):
+            return indice.name
+    raise CommandError(f'{modelo.__name__} no tiene el índice {nombre or campos}')
+
+
+def consultas_frecuentes():
+    """
+    (nombre, queryset, tabla vigilada, índices diseñados para ella) de cada
+    consulta frecuente; el plan debe usar al menos uno de ellos
+    """
+    tabla_compras = Compra._meta.db_table
+    tabla_resumen = ResumenCompraDiaria._meta.db_table
+    cliente = Cliente.objects.order_by('id').first() or Cliente(pk=0)
+
+    por_estado_fecha = nombre_indice(Compra, ['estado', 'fecha_compra', 'cliente', 'monto'])
+    por_cliente_fecha = nombre_indice(Compra, ['cliente', '-fecha_compra', '-id'])
+    por_cliente_estado = nombre_indice(Compra, ['cliente', 'estado'])
+    # El índice de unique_together (cliente, fecha, estado) tiene nombre generado
+    resumen_por_cliente = f'{tabla_resumen}_cliente_id_fecha_estado'
+    resumen_por_estado_fecha = nombre_indice(ResumenCompraDiaria, ['estado', 'fecha'])
+
+    desde_rfm = timezone.now() - timedelta(days=DIAS_RFM_DEFAULT)
+    compras_segmentacion = (
+        compras_en_rango(desde_rfm)
+        .filter(estado='completada', fecha_compra__gte=desde_rfm)
+        .values_list('cliente_id', 'fecha_compra', 'monto')
+        .order_by()
+    )
+    compras_completadas_cliente = (
+        Compra.objects.filter(cliente=cliente, estado='completada')
+        .values('cliente_id')
+        .annotate(total=Sum('monto'))
+    )
+    return [
+        # Según el volumen el motor recorre la ventana por estado y fecha o
+        # parte de cada cliente activo y lee sus compras completadas
+        ('fidelizacion_compras', clientes_fidelizacion(usar_resumen=False), tabla_compras,
+         [por_estado_fecha, por_cliente_fecha, por_cliente_estado]),
+        ('fidelizacion_resumen', clientes_fidelizacion(usar_resumen=True), tabla_resumen,
+         [resumen_por_estado_fecha, resumen_por_cliente]),
+        # Recorre la ventana sin leer la tabla
+        ('segmentacion_compras', compras_segmentacion, tabla_compras, [por_estado_fecha]),
+        ('compras_completadas_cliente', compras_completadas_cliente, tabla_compras, [por_cliente_estado]),
+        ('historial_cliente', Compra.objects.filter(cliente=cliente).order_by('-fecha_compra', '-id'),
+         tabla_compras, [por_cliente_fecha]),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Verifica con EXPLAIN que las consultas frecuentes usan los índices esperados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analizar',
+            action='store_true',
+            help='Ejecuta ANALYZE antes de obtener los planes'
+        )
+
+    def handle(self, *args, **options):
+        if options['analizar']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        fallas = []
+        for nombre, queryset, tabla, indices in consultas_frecuentes():
+            plan = queryset.explain()
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{nombre}:\n{plan}\n')
+
+            if re.search(RECORRIDO_COMPLETO.format(tabla=tabla), plan):
+                fallas.append(f'{nombre}: recorre completa la tabla {tabla}')
+            elif not any(indice in plan for indice in indices):
+                fallas.append(f"{nombre}: no usa ninguno de {', '.join(indices)}")
+            else:
+                self.stdout.write(f'  {nombre}: OK')
+
+        if fallas:
+            for falla in fallas:
+                self.stderr.write(self.style.ERROR(f'  {falla}'))
+            raise CommandError(f'{len(fallas)} consultas sin el índice esperado')
+        self.stdout.write(self.style.SUCCESS('✓ Todas las consultas usan sus índices'))
@@ -0,0 +1,171 @@
+"""
+Instrumentación por solicitud: consultas SQL, tiempos y tamaño de respuesta.
+
+Se activa con CLIENTES_INSTRUMENTACION['ACTIVA']. Las consultas se miden con
+`connection.execute_wrapper`, así que no depende de DEBUG. Los datos se
+publican en el encabezado Server-Timing y en una línea de log en JSON del
+logger `clientes.instrumentacion`.
+
+Los tiempos se separan en SQL, vista (el Python de la vista sin sus
+consultas, donde corren los serializadores de DRF) y render (la codificación
+de la respuesta por el renderer de DRF). Funciona igual bajo WSGI y ASGI:
+con una cadena de middleware asíncrona la solicitud no pasa a un hilo y
+solo la instalación del registro de consultas corre en el hilo del ORM.
+
+Las respuestas en streaming ejecutan parte de sus consultas después de que
+termina el middleware; para ellas solo se mide la vista.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('clientes.instrumentacion')
+
+CONFIGURACION_DEFAULT = {
+    'ACTIVA': False,
+    'CONSULTA_LENTA_MS': 100,
+    'UMBRAL_DUPLICADAS': 5,
+    'SERVER_TIMING': True,
+}
+
+
+def configuracion_instrumentacion():
+    return {**CONFIGURACION_DEFAULT, **getattr(settings, 'CLIENTES_INSTRUMENTACION', {})}
+
+
+class RegistroConsultas:
+    """execute_wrapper que cuenta y cronometra las consultas de una solicitud"""
+
+    def __init__(self, consulta_lenta_ms):
+        self.consulta_lenta_ms = consulta_lenta_ms
+        self.cantidad = 0
+        self.duracion_ms = 0.0
+        self.por_sql = Counter()
+        self.lentas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            self.cantidad += 1
+            self.duracion_ms += duracion_ms
+            # El SQL con marcadores es el mismo para cada repetición de un N+1
+            self.por_sql[sql] += 1
+            if duracion_ms >= self.consulta_lenta_ms:
+                self.lentas.append((duracion_ms, sql))
+
+    def duplicadas(self, umbral):
+        return [(sql, veces) for sql, veces in self.por_sql.most_common() if veces >= umbral]
+
+
+class InstrumentacionMiddleware:
+    """Mide cada solicitud y registra consultas lentas y duplicadas (N+1)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.configuracion = configuracion_instrumentacion()
+        if not self.configuracion['ACTIVA']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        registro = self._iniciar(request)
+        inicio = time.perf_counter()
+        with self._registrar_consultas(registro):
+            response = self.get_response(request)
+        return self._terminar(request, response, registro, inicio)
+
+    async def __acall__(self, request):
+        registro = self._iniciar(request)
+        inicio = time.perf_counter()
+        # Las conexiones son locales a cada hilo: los wrappers se instalan en
+        # el hilo de sync_to_async (thread_sensitive), el mismo donde corren
+        # las consultas del ORM asíncrono durante la solicitud
+        with await sync_to_async(self._registrar_consultas)(registro):
+            response = await self.get_response(request)
+        return self._terminar(request, response, registro, inicio)
+
+    def _iniciar(self, request):
+        request._instrumentacion_render_ms = None
+        return RegistroConsultas(self.configuracion['CONSULTA_LENTA_MS'])
+
+    def _registrar_consultas(self, registro):
+        pila = ExitStack()
+        for conexion in connections.all():
+            pila.enter_context(conexion.execute_wrapper(registro))
+        return pila
+
+    def _terminar(self, request, response, registro, inicio):
+        total_ms = (time.perf_counter() - inicio) * 1000
+        datos = self._datos(request, response, registro, total_ms)
+        if self.configuracion['SERVER_TIMING']:
+            response['Server-Timing'] = self._server_timing(datos)
+        self._registrar(datos, registro)
+        return response
+
+    def process_template_response(self, request, response):
+        # Las Response de DRF se renderizan justo después de este método
+        inicio = time.perf_counter()
+
+        def fin_render(respuesta_renderizada):
+            request._instrumentacion_render_ms = (time.perf_counter() - inicio) * 1000
+
+        response.add_post_render_callback(fin_render)
+        return response
+
+    def _datos(self, request, response, registro, total_ms):
+        resolver_match = getattr(request, 'resolver_match', None)
+        render_ms = request._instrumentacion_render_ms
+        if response.streaming:
+            tamano = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            tamano = len(response.content)
+        return {
+            'metodo': request.method,
+            'ruta': request.path,
+            'vista': resolver_match.view_name if resolver_match else None,
+            'estado': response.status_code,
+            'consultas': registro.cantidad,
+            'sql_ms': round(registro.duracion_ms, 2),
+            'vista_ms': round(max(total_ms - registro.duracion_ms - (render_ms or 0), 0), 2),
+            'render_ms': round(render_ms, 2) if render_ms is not None else None,
+            'total_ms': round(total_ms, 2),
+            'bytes': tamano,
+            'streaming': response.streaming,
+        }
+
+    def _server_timing(self, datos):
+        metricas = [
+            f'''sql;dur={datos['sql_ms']};desc="{datos['consultas']} consultas"''',
+            f'''vista;dur={datos['vista_ms']};desc="vista y serializadores, sin SQL"''',
+        ]
+        if datos['render_ms'] is not None:
+            metricas.append(f'''render;dur={datos['render_ms']};desc="renderer de DRF"''')
+        metricas.append(f"total;dur={datos['total_ms']}")
+        return ', '.join(metricas)
+
+    def _registrar(self, datos, registro):
+        for duracion_ms, sql in registro.lentas:
+            logger.warning('Consulta lenta (%.1f ms) en %s: %s', duracion_ms, datos['ruta'], sql)
+
+        duplicadas = registro.duplicadas(self.configuracion['UMBRAL_DUPLICADAS'])
+        for sql, veces in duplicadas:
+            logger.warning('Consulta repetida %s veces en %s (posible N+1): %s', veces, datos['ruta'], sql)
+
+        datos['consultas_duplicadas'] = sum(veces for _, veces in duplicadas)
+        logger.info(json.dumps(datos, ensure_ascii=False), extra={'instrumentacion': datos})
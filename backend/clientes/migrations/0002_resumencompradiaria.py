@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCompraDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('completada', 'Completada'), ('cancelada', 'Cancelada')], max_length=20, verbose_name='Estado')),
+                ('cantidad', models.PositiveIntegerField(default=0, verbose_name='Cantidad de Compras')),
+                ('monto_total', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Monto Total (COP)')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_compras', to='clientes.cliente', verbose_name='Cliente')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Compras',
+                'verbose_name_plural': 'Resúmenes Diarios de Compras',
+                'ordering': ['cliente', '-fecha'],
+                'indexes': [models.Index(fields=['estado', 'fecha'], name='clientes_re_estado_46ac6a_idx')],
+                'unique_together': {('cliente', 'fecha', 'estado')},
+            },
+        ),
+    ]
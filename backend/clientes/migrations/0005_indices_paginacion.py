@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0004_versiondatos'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='compra',
+            name='clientes_co_cliente_4591bb_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['apellido', 'nombre', 'id'], name='clientes_cl_apellid_658798_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(fields=['cliente', '-fecha_compra', '-id'], name='clientes_co_cliente_8610be_idx'),
+        ),
+    ]
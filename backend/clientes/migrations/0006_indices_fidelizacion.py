@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0005_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(fields=['estado', 'fecha_compra', 'cliente', 'monto'], name='clientes_co_estado_37b651_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(fields=['cliente', 'estado'], name='clientes_co_cliente_1f9029_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(condition=models.Q(('estado', 'completada')), fields=['fecha_compra', 'cliente', 'monto'], name='compra_completada_fecha_idx'),
+        ),
+    ]
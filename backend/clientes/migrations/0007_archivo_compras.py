@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+VISTA_COMPRA_HISTORICA = '''
+CREATE VIEW clientes_compra_historica AS
+SELECT id, cliente_id, numero_factura, fecha_compra, monto, descripcion, estado, FALSE AS archivada
+FROM clientes_compra
+UNION ALL
+SELECT id, cliente_id, numero_factura, fecha_compra, monto, descripcion, estado, TRUE AS archivada
+FROM clientes_compraarchivada
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0006_indices_fidelizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompraHistorica',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('numero_factura', models.CharField(max_length=50, verbose_name='Número de Factura')),
+                ('fecha_compra', models.DateTimeField(verbose_name='Fecha de Compra')),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Monto (COP)')),
+                ('descripcion', models.TextField(blank=True, null=True, verbose_name='Descripción')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('completada', 'Completada'), ('cancelada', 'Cancelada')], max_length=20, verbose_name='Estado')),
+                ('archivada', models.BooleanField(verbose_name='Archivada')),
+            ],
+            options={
+                'verbose_name': 'Compra Histórica',
+                'verbose_name_plural': 'Compras Históricas',
+                'db_table': 'clientes_compra_historica',
+                'ordering': ['-fecha_compra'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='EstadoArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_corte', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Corte')),
+                ('compras_archivadas', models.PositiveBigIntegerField(default=0, verbose_name='Compras Archivadas')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+            ],
+            options={
+                'verbose_name': 'Estado del Archivo',
+                'verbose_name_plural': 'Estado del Archivo',
+            },
+        ),
+        migrations.CreateModel(
+            name='CompraArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('numero_factura', models.CharField(max_length=50, unique=True, verbose_name='Número de Factura')),
+                ('fecha_compra', models.DateTimeField(verbose_name='Fecha de Compra')),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Monto (COP)')),
+                ('descripcion', models.TextField(blank=True, null=True, verbose_name='Descripción')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('completada', 'Completada'), ('cancelada', 'Cancelada')], max_length=20, verbose_name='Estado')),
+                ('fecha_archivo', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Archivo')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compras_archivadas', to='clientes.cliente', verbose_name='Cliente')),
+            ],
+            options={
+                'verbose_name': 'Compra Archivada',
+                'verbose_name_plural': 'Compras Archivadas',
+                'ordering': ['-fecha_compra'],
+                'indexes': [models.Index(fields=['cliente', '-fecha_compra', '-id'], name='clientes_co_cliente_c90a81_idx')],
+            },
+        ),
+        migrations.RunSQL(
+            VISTA_COMPRA_HISTORICA,
+            reverse_sql='DROP VIEW clientes_compra_historica',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0007_archivo_compras'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenBusquedaCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=50, verbose_name='Token')),
+                ('campo', models.CharField(choices=[('documento', 'Número de Documento'), ('nombre', 'Nombre'), ('apellido', 'Apellido'), ('correo', 'Correo'), ('telefono', 'Teléfono')], max_length=20, verbose_name='Campo')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_busqueda', to='clientes.cliente', verbose_name='Cliente')),
+            ],
+            options={
+                'verbose_name': 'Token de Búsqueda',
+                'verbose_name_plural': 'Tokens de Búsqueda',
+                'indexes': [models.Index(fields=['token', 'cliente'], name='clientes_to_token_b2eb2b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+VISTA_COMPRA_HISTORICA = '''
+CREATE VIEW clientes_compra_historica AS
+SELECT id, cliente_id, numero_factura, fecha_compra, monto, descripcion, estado, FALSE AS archivada
+FROM clientes_compra
+UNION ALL
+SELECT id, cliente_id, numero_factura, fecha_compra, monto, descripcion, estado, TRUE AS archivada
+FROM clientes_compraarchivada
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0008_tokens_busqueda'),
+    ]
+
+    # SQLite reconstruye clientes_compra para agregar la columna, lo que
+    # falla si la vista histórica la referencia: se elimina y se recrea
+    operations = [
+        migrations.RunSQL(
+            'DROP VIEW clientes_compra_historica',
+            reverse_sql=VISTA_COMPRA_HISTORICA,
+        ),
+        migrations.AddField(
+            model_name='compra',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(
+                auto_now=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name='Fecha de Actualización'
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            VISTA_COMPRA_HISTORICA,
+            reverse_sql='DROP VIEW clientes_compra_historica',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+# Los clientes y compras existentes entran al registro como altas, para que
+# un sistema nuevo pueda sincronizarse completo leyendo el feed desde 0
+REGISTRAR_EXISTENTES = [
+    "INSERT INTO clientes_cambio (modelo, objeto_id, operacion, fecha) "
+    "SELECT 'cliente', id, 'creado', CURRENT_TIMESTAMP FROM clientes_cliente ORDER BY id",
+    "INSERT INTO clientes_cambio (modelo, objeto_id, operacion, fecha) "
+    "SELECT 'compra', id, 'creado', CURRENT_TIMESTAMP FROM clientes_compra_historica ORDER BY id",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0009_compra_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Fecha de Actualización'),
+        ),
+        migrations.RunSQL(
+            'UPDATE clientes_cliente SET fecha_actualizacion = fecha_registro',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.CreateModel(
+            name='Cambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('cliente', 'Cliente'), ('compra', 'Compra')], max_length=20, verbose_name='Modelo')),
+                ('objeto_id', models.BigIntegerField(verbose_name='Id del Objeto')),
+                ('operacion', models.CharField(choices=[('creado', 'Creado'), ('actualizado', 'Actualizado'), ('eliminado', 'Eliminado')], max_length=20, verbose_name='Operación')),
+                ('fecha', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+            ],
+            options={
+                'verbose_name': 'Cambio',
+                'verbose_name_plural': 'Cambios',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['modelo', 'id'], name='clientes_ca_modelo_e0923a_idx')],
+            },
+        ),
+        migrations.RunSQL(REGISTRAR_EXISTENTES, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0010_cambios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoreporte',
+            name='segmentacion',
+            field=models.BooleanField(default=False, verbose_name='Incluir Segmentación RFM'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0011_trabajoreporte_segmentacion'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='compra',
+            name='compra_completada_fecha_idx',
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+TAMANO_LOTE = 2000
+
+
+def _totales(modelo, cliente_ids):
+    """Compras de `modelo` agrupadas por (cliente, día local, estado)"""
+    return (
+        modelo.objects.filter(cliente_id__in=cliente_ids)
+        .annotate(fecha=TruncDate('fecha_compra'))
+        .values('cliente_id', 'fecha', 'estado')
+        .annotate(cantidad=Count('id'), monto_total=Sum('monto'))
+        .order_by()
+    )
+
+
+def poblar_resumen(apps, schema_editor):
+    """
+    Calcula el resumen diario de las compras, activas y archivadas, que
+    existían antes de que las señales lo mantuvieran. Reemplaza las filas de
+    cada lote de clientes, así que repetirla deja el mismo resultado.
+    """
+    Cliente = apps.get_model('clientes', 'Cliente')
+    Compra = apps.get_model('clientes', 'Compra')
+    CompraArchivada = apps.get_model('clientes', 'CompraArchivada')
+    ResumenCompraDiaria = apps.get_model('clientes', 'ResumenCompraDiaria')
+
+    cliente_ids = list(Cliente.objects.order_by('id').values_list('id', flat=True))
+    for inicio in range(0, len(cliente_ids), TAMANO_LOTE):
+        lote = cliente_ids[inicio:inicio + TAMANO_LOTE]
+        totales = {}
+        # Un mismo día puede tener compras a ambos lados de la fecha de corte
+        for modelo in (Compra, CompraArchivada):
+            for fila in _totales(modelo, lote):
+                clave = (fila['cliente_id'], fila['fecha'], fila['estado'])
+                cantidad, monto_total = totales.get(clave, (0, 0))
+                totales[clave] = (cantidad + fila['cantidad'], monto_total + fila['monto_total'])
+
+        ResumenCompraDiaria.objects.filter(cliente_id__in=lote).delete()
+        ResumenCompraDiaria.objects.bulk_create(
+            [
+                ResumenCompraDiaria(
+                    cliente_id=cliente_id, fecha=fecha, estado=estado,
+                    cantidad=cantidad, monto_total=monto_total,
+                )
+                for (cliente_id, fecha, estado), (cantidad, monto_total) in totales.items()
+            ],
+            batch_size=TAMANO_LOTE,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0012_quitar_indice_compras_completadas'),
+    ]
+
+    operations = [
+        migrations.RunPython(poblar_resumen, reverse_code=migrations.RunPython.noop),
+    ]
@@ -1,7 +1,17 @@
 from django.db import models
+from django.db.models import DecimalField, OuterRef, PositiveIntegerField, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import EmailValidator
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
+
+
+ESTADOS_COMPRA = [
+    ('pendiente', 'Pendiente'),
+    ('completada', 'Completada'),
+    ('cancelada', 'Cancelada'),
+]
 
 
 class TipoDocumento(models.Model):
@@ -20,6 +30,42 @@ class TipoDocumento(models.Model):
         return self.nombre
 
 
+class ClienteQuerySet(models.QuerySet):
+    def con_totales_compras(self):
+        """
+        Anota `total_compras_completadas` y `monto_compras_completadas` leyendo
+        el resumen diario en subconsultas, dentro de la misma consulta del cliente
+        """
+        resumen = ResumenCompraDiaria.objects.filter(
+            cliente=OuterRef('pk'),
+            estado='completada'
+        ).order_by().values('cliente')
+        
+        return self.annotate(
+            total_compras_completadas=Coalesce(
+                Subquery(resumen.annotate(total=Sum('cantidad')).values('total')),
+                Value(0),
+                output_field=PositiveIntegerField()
+            ),
+            monto_compras_completadas=Coalesce(
+                Subquery(resumen.annotate(total=Sum('monto_total')).values('total')),
+                Value(Decimal('0')),
+                output_field=DecimalField(max_digits=18, decimal_places=2)
+            )
+        )
+    
+    def para_busqueda(self):
+        """
+        Consulta de búsqueda: el cliente con su tipo de documento y los
+        totales anotados, más una consulta para las compras prefetch. Las
+        compras se leen de CompraHistorica, como los totales del resumen,
+        para incluir también las archivadas
+        """
+        return self.select_related('tipo_documento').con_totales_compras().prefetch_related(
+            models.Prefetch('compras_historicas', queryset=CompraHistorica.objects.order_by('-fecha_compra'))
+        )
+
+
 class Cliente(models.Model):
     """Modelo para información básica del cliente"""
     tipo_documento = models.ForeignKey(
@@ -38,13 +84,19 @@ class Cliente(models.Model):
     )
     telefono = models.CharField(max_length=20, verbose_name="Teléfono")
     fecha_registro = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Registro")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Fecha de Actualización")
     activo = models.BooleanField(default=True, verbose_name="Activo")
     
+    objects = ClienteQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['apellido', 'nombre']
         unique_together = [['tipo_documento', 'numero_documento']]
+        indexes = [
+            models.Index(fields=['apellido', 'nombre', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.nombre} {self.apellido} - {self.numero_documento}"
@@ -72,24 +124,274 @@ class Compra(models.Model):
     descripcion = models.TextField(blank=True, null=True, verbose_name="Descripción")
     estado = models.CharField(
         max_length=20,
-        choices=[
-            ('pendiente', 'Pendiente'),
-            ('completada', 'Completada'),
-            ('cancelada', 'Cancelada'),
-        ],
+        choices=ESTADOS_COMPRA,
         default='completada',
         verbose_name="Estado"
     )
+    # Marca de los cambios para el refresco incremental del snapshot columnar
+    # y para los sistemas externos (ver también Cambio)
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Fecha de Actualización")
     
     class Meta:
         verbose_name = "Compra"
         verbose_name_plural = "Compras"
         ordering = ['-fecha_compra']
         indexes = [
-            models.Index(fields=['cliente', '-fecha_compra']),
+            models.Index(fields=['cliente', '-fecha_compra', '-id']),
             models.Index(fields=['-fecha_compra']),
+            # Reporte de fidelización: filtra por estado y ventana de fechas y
+            # suma monto por cliente sin leer la tabla
+            models.Index(fields=['estado', 'fecha_compra', 'cliente', 'monto']),
+            models.Index(fields=['cliente', 'estado']),
         ]
     
     def __str__(self):
         return f"Factura {self.numero_factura} - {self.cliente.nombre_completo} - ${self.monto:,.2f}"
 
+
+class CompraArchivada(models.Model):
+    """
+    Compras anteriores a la fecha de corte, movidas desde Compra por el
+    comando archivar_compras. Conservan el id original.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(
+        Cliente,
+        on_delete=models.CASCADE,
+        related_name='compras_archivadas',
+        verbose_name="Cliente"
+    )
+    numero_factura = models.CharField(max_length=50, unique=True, verbose_name="Número de Factura")
+    fecha_compra = models.DateTimeField(verbose_name="Fecha de Compra")
+    monto = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Monto (COP)")
+    descripcion = models.TextField(blank=True, null=True, verbose_name="Descripción")
+    estado = models.CharField(max_length=20, choices=ESTADOS_COMPRA, verbose_name="Estado")
+    fecha_archivo = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Archivo")
+    
+    class Meta:
+        verbose_name = "Compra Archivada"
+        verbose_name_plural = "Compras Archivadas"
+        ordering = ['-fecha_compra']
+        indexes = [
+            models.Index(fields=['cliente', '-fecha_compra', '-id']),
+        ]
+    
+    def __str__(self):
+        return f"Factura {self.numero_factura} (archivada)"
+
+
+class CompraHistorica(models.Model):
+    """
+    Vista de solo lectura con las compras activas y las archivadas
+    (UNION ALL de Compra y CompraArchivada, creada en la migración 0007).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(
+        Cliente,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='compras_historicas',
+        verbose_name="Cliente"
+    )
+    numero_factura = models.CharField(max_length=50, verbose_name="Número de Factura")
+    fecha_compra = models.DateTimeField(verbose_name="Fecha de Compra")
+    monto = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Monto (COP)")
+    descripcion = models.TextField(blank=True, null=True, verbose_name="Descripción")
+    estado = models.CharField(max_length=20, choices=ESTADOS_COMPRA, verbose_name="Estado")
+    archivada = models.BooleanField(verbose_name="Archivada")
+    
+    class Meta:
+        managed = False
+        db_table = 'clientes_compra_historica'
+        verbose_name = "Compra Histórica"
+        verbose_name_plural = "Compras Históricas"
+        ordering = ['-fecha_compra']
+    
+    def __str__(self):
+        return f"Factura {self.numero_factura}"
+
+
+class EstadoArchivo(models.Model):
+    """
+    Estado del archivo de compras (una sola fila).
+
+    Las compras con fecha_compra >= fecha_corte están siempre en Compra; las
+    anteriores pueden estar en Compra o en CompraArchivada.
+    """
+    fecha_corte = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Corte")
+    compras_archivadas = models.PositiveBigIntegerField(default=0, verbose_name="Compras Archivadas")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Fecha de Actualización")
+    
+    class Meta:
+        verbose_name = "Estado del Archivo"
+        verbose_name_plural = "Estado del Archivo"
+    
+    def __str__(self):
+        return f"Corte {self.fecha_corte} ({self.compras_archivadas} archivadas)"
+
+
+class ResumenCompraDiaria(models.Model):
+    """
+    Totales diarios de compras por cliente y estado.
+
+    Se mantiene de forma incremental con señales sobre Compra (ver signals.py)
+    y puede reconstruirse con el comando reconstruir_resumen_compras.
+    """
+    cliente = models.ForeignKey(
+        Cliente,
+        on_delete=models.CASCADE,
+        related_name='resumenes_compras',
+        verbose_name="Cliente"
+    )
+    fecha = models.DateField(verbose_name="Fecha")
+    estado = models.CharField(max_length=20, choices=ESTADOS_COMPRA, verbose_name="Estado")
+    cantidad = models.PositiveIntegerField(default=0, verbose_name="Cantidad de Compras")
+    monto_total = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        default=0,
+        verbose_name="Monto Total (COP)"
+    )
+    
+    class Meta:
+        verbose_name = "Resumen Diario de Compras"
+        verbose_name_plural = "Resúmenes Diarios de Compras"
+        ordering = ['cliente', '-fecha']
+        unique_together = [['cliente', 'fecha', 'estado']]
+        indexes = [
+            models.Index(fields=['estado', 'fecha']),
+        ]
+    
+    def __str__(self):
+        return f"{self.cliente_id} - {self.fecha} - {self.estado}: {self.cantidad}"
+
+
+class TrabajoReporte(models.Model):
+    """Trabajo en segundo plano para generar el reporte de fidelización"""
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_EN_PROCESO = 'en_proceso'
+    ESTADO_COMPLETADO = 'completado'
+    ESTADO_FALLIDO = 'fallido'
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=[
+            (ESTADO_PENDIENTE, 'Pendiente'),
+            (ESTADO_EN_PROCESO, 'En Proceso'),
+            (ESTADO_COMPLETADO, 'Completado'),
+            (ESTADO_FALLIDO, 'Fallido'),
+        ],
+        default=ESTADO_PENDIENTE,
+        verbose_name="Estado"
+    )
+    dias = models.PositiveIntegerField(verbose_name="Ventana (días)")
+    monto_minimo = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Monto Mínimo (COP)")
+    segmentacion = models.BooleanField(default=False, verbose_name="Incluir Segmentación RFM")
+    progreso = models.PositiveSmallIntegerField(default=0, verbose_name="Progreso (%)")
+    total_filas = models.PositiveIntegerField(null=True, blank=True, verbose_name="Total de Filas")
+    filas_procesadas = models.PositiveIntegerField(default=0, verbose_name="Filas Procesadas")
+    archivo = models.CharField(max_length=500, blank=True, verbose_name="Archivo")
+    error = models.TextField(blank=True, verbose_name="Error")
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    fecha_inicio = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Inicio")
+    fecha_fin = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Finalización")
+    
+    class Meta:
+        verbose_name = "Trabajo de Reporte"
+        verbose_name_plural = "Trabajos de Reporte"
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion']),
+        ]
+    
+    def __str__(self):
+        return f"Trabajo {self.pk} - {self.estado} ({self.progreso}%)"
+
+
+class VersionDatos(models.Model):
+    """
+    Contador que se incrementa cada vez que cambian los datos de clientes o
+    compras; forma parte de la clave del caché de reportes.
+    """
+    nombre = models.CharField(max_length=50, unique=True, verbose_name="Nombre")
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Versión")
+    
+    class Meta:
+        verbose_name = "Versión de Datos"
+        verbose_name_plural = "Versiones de Datos"
+    
+    def __str__(self):
+        return f"{self.nombre}: {self.version}"
+
+
+class TokenBusquedaCliente(models.Model):
+    """
+    Palabras normalizadas (minúsculas, sin tildes) de los datos del cliente,
+    para buscar por prefijo con un rango sobre el índice de `token`. Se
+    mantiene con señales sobre Cliente (ver busqueda.py).
+    """
+    CAMPOS = [
+        ('documento', 'Número de Documento'),
+        ('nombre', 'Nombre'),
+        ('apellido', 'Apellido'),
+        ('correo', 'Correo'),
+        ('telefono', 'Teléfono'),
+    ]
+    
+    token = models.CharField(max_length=50, verbose_name="Token")
+    cliente = models.ForeignKey(
+        Cliente,
+        on_delete=models.CASCADE,
+        related_name='tokens_busqueda',
+        verbose_name="Cliente"
+    )
+    campo = models.CharField(max_length=20, choices=CAMPOS, verbose_name="Campo")
+    
+    class Meta:
+        verbose_name = "Token de Búsqueda"
+        verbose_name_plural = "Tokens de Búsqueda"
+        indexes = [
+            models.Index(fields=['token', 'cliente']),
+        ]
+    
+    def __str__(self):
+        return f"{self.token} ({self.campo}) -> {self.cliente_id}"
+
+
+class Cambio(models.Model):
+    """
+    Registro de altas, modificaciones y eliminaciones de clientes y compras.
+    El id es la secuencia del feed de cambios (ver cambios.py).
+    """
+    CREADO = 'creado'
+    ACTUALIZADO = 'actualizado'
+    ELIMINADO = 'eliminado'
+    MODELOS = [
+        ('cliente', 'Cliente'),
+        ('compra', 'Compra'),
+    ]
+    
+    modelo = models.CharField(max_length=20, choices=MODELOS, verbose_name="Modelo")
+    objeto_id = models.BigIntegerField(verbose_name="Id del Objeto")
+    operacion = models.CharField(
+        max_length=20,
+        choices=[
+            (CREADO, 'Creado'),
+            (ACTUALIZADO, 'Actualizado'),
+            (ELIMINADO, 'Eliminado'),
+        ],
+        verbose_name="Operación"
+    )
+    fecha = models.DateTimeField(auto_now_add=True, verbose_name="Fecha")
+    
+    class Meta:
+        verbose_name = "Cambio"
+        verbose_name_plural = "Cambios"
+        ordering = ['id']
+        indexes = [
+            # Feed filtrado por modelo: ?modelo=cliente&desde=...
+            models.Index(fields=['modelo', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.id}: {self.modelo} {self.objeto_id} {self.operacion}"
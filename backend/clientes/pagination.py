@@ -0,0 +1,183 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+A diferencia de PageNumberPagination, no ejecuta COUNT(*) ni OFFSET: cada
+página filtra por los valores de ordenamiento del último registro visto,
+así que la página N cuesta lo mismo que la primera siempre que exista un
+índice sobre los campos de `ordering`. El último campo de `ordering` debe
+ser único (normalmente el id) para que el orden sea estable.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginación keyset con cursores opacos en ambas direcciones"""
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE or 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    total_query_param = 'con_total'
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        pagina = self._preparar_pagina(queryset, request)
+        if request.query_params.get(self.total_query_param):
+            self.total = queryset.count()
+        return self._recibir_pagina(list(pagina))
+
+    async def apaginate_queryset(self, queryset, request):
+        """Igual que paginate_queryset, para vistas async con el ORM asíncrono"""
+        pagina = self._preparar_pagina(queryset, request)
+        if request.query_params.get(self.total_query_param):
+            self.total = await queryset.acount()
+        return self._recibir_pagina([registro async for registro in pagina])
+
+    def _preparar_pagina(self, queryset, request):
+        """Lee el cursor y retorna la consulta de la página (sin ejecutarla)"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.total = None
+
+        self.posicion, self.hacia_atras = self.decode_cursor(request, queryset.model)
+        orden = [self._invertir(campo) for campo in self.ordering] if self.hacia_atras else list(self.ordering)
+
+        queryset = queryset.order_by(*orden)
+        if self.posicion is not None:
+            queryset = queryset.filter(self._filtro_despues_de(orden, self.posicion))
+        return queryset[:self.page_size + 1]
+
+    def _recibir_pagina(self, resultados):
+        hay_mas = len(resultados) > self.page_size
+        resultados = resultados[:self.page_size]
+        if self.hacia_atras:
+            resultados.reverse()
+            self.has_next, self.has_previous = self.posicion is not None, hay_mas
+        else:
+            self.has_next, self.has_previous = hay_mas, self.posicion is not None
+
+        self.page = resultados
+        return resultados
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_paginated_response(self, data):
+        return Response(self.datos_paginados(data))
+
+    def datos_paginados(self, data):
+        respuesta = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.total is not None:
+            respuesta['count'] = self.total
+            respuesta.move_to_end('count', last=False)
+        return respuesta
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._enlace(self.page[-1], hacia_atras=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self._enlace(self.page[0], hacia_atras=True)
+
+    def _enlace(self, registro, hacia_atras):
+        valores = [self._valor(registro, campo.lstrip('-')) for campo in self.ordering]
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(valores, hacia_atras))
+
+    @staticmethod
+    def _valor(registro, campo):
+        valor = registro[campo] if isinstance(registro, dict) else getattr(registro, campo)
+        return valor.isoformat() if hasattr(valor, 'isoformat') else force_str(valor)
+
+    @staticmethod
+    def _invertir(campo):
+        return campo[1:] if campo.startswith('-') else f'-{campo}'
+
+    @staticmethod
+    def _filtro_despues_de(orden, posicion):
+        """
+        a >= x AND ((a > x) OR (a = x AND b > y) OR ...) respetando la
+        dirección de cada campo. La cota sobre el primer campo es redundante,
+        pero sin ella el motor recorre el índice desde el principio en lugar
+        de buscar la posición del cursor.
+        """
+        condiciones = []
+        for indice, campo in enumerate(orden):
+            nombre = campo.lstrip('-')
+            operador = 'lt' if campo.startswith('-') else 'gt'
+            iguales = [Q(**{orden[j].lstrip('-'): posicion[orden[j].lstrip('-')]}) for j in range(indice)]
+            condiciones.append(reduce(and_, iguales + [Q(**{f'{nombre}__{operador}': posicion[nombre]})]))
+        primero = orden[0].lstrip('-')
+        cota = Q(**{f"{primero}__{'lte' if orden[0].startswith('-') else 'gte'}": posicion[primero]})
+        return cota & reduce(or_, condiciones)
+
+    def encode_cursor(self, valores, hacia_atras):
+        contenido = json.dumps({'v': valores, 'r': int(hacia_atras)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(contenido.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, modelo):
+        """Retorna ({campo: valor}, hacia_atras) o (None, False) sin cursor"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+
+        try:
+            contenido = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            valores = contenido['v']
+            campos = [campo.lstrip('-') for campo in self.ordering]
+            if len(valores) != len(campos):
+                raise ValueError
+            posicion = {
+                campo: modelo._meta.get_field(campo).to_python(valor)
+                for campo, valor in zip(campos, valores)
+            }
+            return posicion, bool(contenido.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ClienteKeysetPagination(KeysetPagination):
+    """Listado de clientes en el orden del modelo (apellido, nombre)"""
+    ordering = ('apellido', 'nombre', 'id')
+
+
+class CompraKeysetPagination(KeysetPagination):
+    """Historial de compras de la más reciente a la más antigua"""
+    ordering = ('-fecha_compra', '-id')
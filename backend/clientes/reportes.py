@@ -0,0 +1,343 @@
+"""
+Motor de agregación para el reporte de fidelización.
+
+Calcula los totales de compras por cliente en una sola consulta agrupada
+con filtro HAVING, de modo que pueda usarse tanto desde las vistas como
+desde comandos de gestión.
+
+La escritura del libro Excel usa el modo write-only de openpyxl, que
+serializa fila por fila, para mantener la memoria constante sin importar
+cuántos clientes califiquen. A pedido, el libro incluye la segmentación
+RFM de todos los clientes (ver segmentacion.py). Las hojas se dividen para
+no superar el límite de filas de Excel.
+
+Con el snapshot columnar habilitado (ver snapshot.py) los totales se suman
+sobre sus archivos y la base solo se consulta para los datos de contacto
+de los clientes que califican.
+"""
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Case, OuterRef, Subquery, Sum, When
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+
+from .archivo import compras_en_rango
+from .exportacion import leer_booleano
+from .models import Cliente, CompraHistorica
+from .resumen import dias_completos_desde
+from .segmentacion import filas_segmentacion, segmentar
+from .snapshot import SnapshotCompras, a_centavos, compras_completadas_desde, usar_snapshot_por_defecto
+
+DIAS_VENTANA_DEFAULT = 30
+DIAS_VENTANA_MAXIMO = 3650  # diez años; ventanas mayores desbordan las fechas
+MONTO_MINIMO_DEFAULT = Decimal('5000000')  # 5 millones de pesos COP
+TAMANO_LOTE_REPORTE = 2000
+# Excel admite 1.048.576 filas por hoja, incluida la de encabezados
+MAXIMO_FILAS_HOJA = 1048575
+CAMPOS_CLIENTE_REPORTE = [
+    'id',
+    'tipo_documento__nombre',
+    'numero_documento',
+    'nombre',
+    'apellido',
+    'correo',
+    'telefono',
+]
+
+HOJA_REPORTE = 'Clientes Fidelización'
+HOJA_SEGMENTACION = 'Segmentación RFM'
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# (encabezado, ancho de columna)
+COLUMNAS_REPORTE = [
+    ('Tipo Documento', 18),
+    ('Número Documento', 20),
+    ('Nombre', 20),
+    ('Apellido', 20),
+    ('Correo', 30),
+    ('Teléfono', 15),
+    ('Total Compras (COP)', 20),
+]
+
+COLUMNAS_SEGMENTACION = COLUMNAS_REPORTE[:-1] + [
+    ('Recencia (días)', 15),
+    ('Frecuencia', 12),
+    ('Monto (COP)', 20),
+    ('R', 6),
+    ('F', 6),
+    ('M', 6),
+    ('Segmento', 15),
+]
+
+
+def parametros_reporte(parametros):
+    """
+    Lee la ventana en días y el monto mínimo desde los query params. Lanza
+    ValueError si alguno no es válido.
+    """
+    try:
+        dias = int(parametros.get('dias', DIAS_VENTANA_DEFAULT))
+    except (TypeError, ValueError):
+        raise ValueError('El parámetro dias debe ser un número entero')
+    try:
+        monto_minimo = Decimal(parametros.get('monto_minimo', MONTO_MINIMO_DEFAULT))
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError('El parámetro monto_minimo debe ser numérico')
+
+    if dias <= 0:
+        raise ValueError('El parámetro dias debe ser mayor que cero')
+    if dias > DIAS_VENTANA_MAXIMO:
+        raise ValueError(f'El parámetro dias no puede ser mayor que {DIAS_VENTANA_MAXIMO}')
+    if not monto_minimo.is_finite() or monto_minimo < 0:
+        raise ValueError('El parámetro monto_minimo debe ser un número no negativo')
+    return dias, monto_minimo
+
+
+def parametro_segmentacion(parametros):
+    """Lee si el reporte incluye la segmentación RFM (por defecto no)"""
+    return bool(leer_booleano(parametros, 'segmentacion'))
+
+
+def clientes_fidelizacion(dias=DIAS_VENTANA_DEFAULT, monto_minimo=MONTO_MINIMO_DEFAULT,
+                          referencia=None, usar_resumen=None):
+    """
+    Retorna los clientes activos cuyas compras completadas desde
+    `referencia - dias` suman al menos `monto_minimo`, ordenados por total
+    descendente.
+
+    Con `usar_resumen` (por defecto settings.CLIENTES_REPORTE_USAR_RESUMEN)
+    los días completos posteriores al inicio de la ventana se leen del
+    resumen diario y el día del inicio, que solo cuenta en parte, se suma
+    desde las compras; si no, se suman las compras individuales. Ambos
+    caminos retornan las mismas filas.
+
+    Cada fila es un diccionario con los datos del cliente y `total_compras`.
+    """
+    referencia = referencia or timezone.now()
+    if usar_resumen is None:
+        usar_resumen = getattr(settings, 'CLIENTES_REPORTE_USAR_RESUMEN', False)
+    desde = referencia - timedelta(days=dias)
+    # Ventanas anteriores a la fecha de corte leen también las compras archivadas
+    compras = compras_en_rango(desde)
+
+    if usar_resumen:
+        dia_inicio, dia_siguiente = dias_completos_desde(desde)
+        total_dia_inicio = (
+            compras.filter(
+                cliente=OuterRef('pk'),
+                estado='completada',
+                fecha_compra__gte=desde,
+                fecha_compra__lt=dia_siguiente,
+            )
+            .order_by()
+            .values('cliente')
+            .annotate(total=Sum('monto'))
+            .values('total')
+        )
+        clientes = Cliente.objects.filter(
+            activo=True,
+            resumenes_compras__fecha__gte=dia_inicio,
+            resumenes_compras__estado='completada',
+        )
+        # La fila del día de inicio vale lo que suman las compras desde
+        # `desde`; sin compras en la ventana queda en NULL y no suma. La
+        # subconsulta solo se evalúa para las filas de ese día.
+        total_compras = Sum(Case(
+            When(resumenes_compras__fecha__gt=dia_inicio, then='resumenes_compras__monto_total'),
+            default=Subquery(total_dia_inicio),
+        ))
+    else:
+        relacion = 'compras_historicas' if compras.model is CompraHistorica else 'compras'
+        clientes = Cliente.objects.filter(
+            activo=True,
+            **{f'{relacion}__fecha_compra__gte': desde, f'{relacion}__estado': 'completada'}
+        )
+        total_compras = Sum(f'{relacion}__monto')
+
+    return (
+        clientes.values(*CAMPOS_CLIENTE_REPORTE)
+        .annotate(total_compras=total_compras)
+        .filter(total_compras__gte=monto_minimo)
+        .order_by('-total_compras', 'id')
+    )
+
+
+def fidelizacion_snapshot(snapshot, dias=DIAS_VENTANA_DEFAULT, monto_minimo=MONTO_MINIMO_DEFAULT,
+                          referencia=None):
+    """
+    Mismas filas que clientes_fidelizacion (sumando compras individuales),
+    calculadas sobre el snapshot columnar. Retorna una lista.
+
+    Los totales se suman en centavos enteros, así que coinciden exactamente
+    con los de la base.
+    """
+    referencia = referencia or timezone.now()
+    activos = np.asarray(snapshot.clientes()['activo'])
+    cliente_id, _, centavos = compras_completadas_desde(snapshot, referencia - timedelta(days=dias))
+    dentro = cliente_id < len(activos)
+    cliente_id, centavos = cliente_id[dentro], centavos[dentro]
+
+    # np.bincount con pesos suma en float64; np.add.at conserva los enteros
+    totales = np.zeros(len(activos), dtype=np.int64)
+    np.add.at(totales, cliente_id, centavos)
+    con_compras = np.bincount(cliente_id, minlength=len(activos)) > 0
+    elegibles = np.flatnonzero(activos & con_compras & (totales >= a_centavos(Decimal(monto_minimo))))
+    elegibles = elegibles[np.lexsort((elegibles, -totales[elegibles]))]
+
+    filas = []
+    for inicio in range(0, len(elegibles), TAMANO_LOTE_REPORTE):
+        lote = elegibles[inicio:inicio + TAMANO_LOTE_REPORTE].tolist()
+        clientes = {
+            cliente['id']: cliente
+            for cliente in Cliente.objects.filter(id__in=lote).values(*CAMPOS_CLIENTE_REPORTE)
+        }
+        for id_cliente in lote:
+            if id_cliente in clientes:
+                filas.append({
+                    **clientes[id_cliente],
+                    'total_compras': Decimal(int(totales[id_cliente])).scaleb(-2),
+                })
+    return filas
+
+
+def filas_fidelizacion(dias=DIAS_VENTANA_DEFAULT, monto_minimo=MONTO_MINIMO_DEFAULT, usar_snapshot=None):
+    """
+    Filas del reporte: una lista calculada sobre el snapshot si `usar_snapshot`
+    (por defecto settings.CLIENTES_REPORTE_USAR_SNAPSHOT) y hay un snapshot
+    disponible, o el queryset de clientes_fidelizacion
+    """
+    if usar_snapshot is None:
+        usar_snapshot = usar_snapshot_por_defecto()
+    snapshot = SnapshotCompras()
+    if usar_snapshot and snapshot.disponible():
+        return fidelizacion_snapshot(snapshot, dias=dias, monto_minimo=monto_minimo)
+    return clientes_fidelizacion(dias=dias, monto_minimo=monto_minimo)
+
+
+def _hoja_con_encabezados(wb, titulo, columnas):
+    """Crea una hoja write-only con los anchos de columna y la fila de encabezados"""
+    ws = wb.create_sheet(titulo)
+    for indice, (_, ancho) in enumerate(columnas, start=1):
+        ws.column_dimensions[get_column_letter(indice)].width = ancho
+
+    # Estilos para encabezados
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    encabezados = []
+    for titulo_columna, _ in columnas:
+        cell = WriteOnlyCell(ws, value=titulo_columna)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = Alignment(horizontal='center')
+        encabezados.append(cell)
+    ws.append(encabezados)
+    return ws
+
+
+def _valores_reporte(fila):
+    return [
+        fila['tipo_documento__nombre'],
+        fila['numero_documento'],
+        fila['nombre'],
+        fila['apellido'],
+        fila['correo'],
+        fila['telefono'],
+        float(fila['total_compras']),
+    ]
+
+
+def _valores_segmentacion(fila):
+    return [
+        fila['tipo_documento__nombre'],
+        fila['numero_documento'],
+        fila['nombre'],
+        fila['apellido'],
+        fila['correo'],
+        fila['telefono'],
+        fila['recencia'],
+        fila['frecuencia'],
+        fila['monto'],
+        fila['r'],
+        fila['f'],
+        fila['m'],
+        fila['segmento'],
+    ]
+
+
+def escribir_reporte_xlsx(filas, destino, progreso=None, incluir_segmentacion=False):
+    """
+    Escribe las filas del reporte en `destino` (ruta o archivo binario)
+    usando un libro write-only. Retorna el número de filas del reporte.
+
+    Con `incluir_segmentacion` y al menos una fila se agrega la hoja de
+    segmentación RFM de DIAS_RFM_DEFAULT días. Cada hoja tiene como máximo
+    MAXIMO_FILAS_HOJA filas; las siguientes continúan en hojas numeradas.
+
+    Si se indica, `progreso(filas_escritas, total)` se llama cada
+    TAMANO_LOTE_REPORTE filas de cualquier hoja y una vez al final; `total`
+    es None mientras no se conoce el número de filas del libro (cuando
+    `filas` es un iterador).
+    """
+    total = len(filas) if isinstance(filas, list) else None
+    filas = iter(filas)
+    primera = next(filas, None)
+    # La segmentación recorre las compras de un año: solo si el reporte tiene filas
+    segmentacion = segmentar() if incluir_segmentacion and primera is not None else None
+    total_segmentacion = len(segmentacion['cliente_id']) if segmentacion is not None else 0
+    if total is not None:
+        total += total_segmentacion
+
+    wb = Workbook(write_only=True)
+    escritas = 0
+
+    def escribir_hojas(titulo, columnas, valores):
+        nonlocal escritas
+        ws = _hoja_con_encabezados(wb, titulo, columnas)
+        hojas, en_hoja = 1, 0
+        for fila in valores:
+            if en_hoja == MAXIMO_FILAS_HOJA:
+                hojas += 1
+                ws = _hoja_con_encabezados(wb, f'{titulo} ({hojas})', columnas)
+                en_hoja = 0
+            ws.append(fila)
+            en_hoja += 1
+            escritas += 1
+            if progreso and escritas % TAMANO_LOTE_REPORTE == 0:
+                progreso(escritas, total)
+
+    if primera is not None:
+        filas = chain([primera], filas)
+    escribir_hojas(HOJA_REPORTE, COLUMNAS_REPORTE, map(_valores_reporte, filas))
+    total_filas = escritas
+
+    if segmentacion is not None:
+        total = total_filas + total_segmentacion
+        escribir_hojas(
+            HOJA_SEGMENTACION,
+            COLUMNAS_SEGMENTACION,
+            map(_valores_segmentacion, filas_segmentacion(segmentacion))
+        )
+
+    wb.save(destino)
+    if progreso:
+        progreso(escritas, escritas)
+    return total_filas
+
+
+def generar_reporte_xlsx(destino, dias=DIAS_VENTANA_DEFAULT, monto_minimo=MONTO_MINIMO_DEFAULT,
+                         progreso=None, incluir_segmentacion=False):
+    """
+    Consulta los clientes elegibles por lotes y los escribe en `destino`,
+    con la segmentación RFM si se pide `incluir_segmentacion`
+    """
+    filas = filas_fidelizacion(dias=dias, monto_minimo=monto_minimo)
+    if not isinstance(filas, list):
+        filas = filas.iterator(chunk_size=TAMANO_LOTE_REPORTE)
+    return escribir_reporte_xlsx(filas, destino, progreso=progreso, incluir_segmentacion=incluir_segmentacion)
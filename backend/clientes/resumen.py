@@ -0,0 +1,198 @@
+"""
+Mantenimiento de la tabla de resumen diario de compras (ResumenCompraDiaria).
+
+Las señales de signals.py aplican deltas por cada Compra creada, modificada
+o eliminada. Archivar compras no cambia el resumen: incluye las compras
+archivadas. Las escrituras masivas que no disparan señales (bulk_create,
+bulk_update) deben acumular sus deltas con sumar_deltas y aplicarlos con
+aplicar_deltas_resumen, que cuesta lo mismo sin importar el historial de
+los clientes. reconstruir_resumen (comando reconstruir_resumen_compras)
+recalcula desde las compras y queda para reparar el resumen.
+
+El resumen agrupa por día calendario local. Las ventanas de los reportes
+empiezan a una hora cualquiera, así que quienes lo leen toman solo los días
+completos y suman el día parcial inicial desde las compras (ver
+dias_completos_desde).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archivo import compras_en_rango
+from .models import ResumenCompraDiaria
+
+TAMANO_LOTE_RESUMEN = 2000
+
+
+def clave_resumen(cliente_id, fecha_compra, estado):
+    """Clave (cliente, día local, estado) de la fila de resumen de una compra"""
+    return cliente_id, timezone.localdate(fecha_compra), estado
+
+
+def dias_completos_desde(desde):
+    """
+    Divide una ventana que empieza en `desde` para leerla del resumen:
+    retorna (día local de `desde`, inicio del día siguiente). El resumen da
+    los días posteriores completos; el tramo [desde, inicio del día
+    siguiente) se suma desde las compras individuales.
+    """
+    dia = timezone.localdate(desde)
+    return dia, timezone.make_aware(datetime.combine(dia + timedelta(days=1), time.min))
+
+
+def ajustar_resumen(cliente_id, fecha, estado, cantidad, monto):
+    """Suma `cantidad` y `monto` (pueden ser negativos) a la fila del resumen"""
+    filtro = {'cliente_id': cliente_id, 'fecha': fecha, 'estado': estado}
+    actualizadas = ResumenCompraDiaria.objects.filter(**filtro).update(
+        cantidad=F('cantidad') + cantidad,
+        monto_total=F('monto_total') + monto
+    )
+
+    if actualizadas:
+        if cantidad < 0:
+            ResumenCompraDiaria.objects.filter(cantidad__lte=0, **filtro).delete()
+        return
+
+    # Un decremento sin fila previa ocurre al eliminar en cascada un cliente,
+    # cuyo resumen ya fue borrado
+    if cantidad <= 0:
+        return
+
+    try:
+        with transaction.atomic():
+            ResumenCompraDiaria.objects.create(cantidad=cantidad, monto_total=monto, **filtro)
+    except IntegrityError:
+        # Otra transacción creó la fila entre el update y el insert
+        ResumenCompraDiaria.objects.filter(**filtro).update(
+            cantidad=F('cantidad') + cantidad,
+            monto_total=F('monto_total') + monto
+        )
+
+
+def sumar_deltas(deltas, cliente_id, fecha_compra, estado, cantidad, monto):
+    """
+    Acumula en `deltas` {(cliente_id, día, estado): [cantidad, monto]} el
+    cambio de una compra; las compras que salen de una clave restan
+    """
+    acumulado = deltas.setdefault(clave_resumen(cliente_id, fecha_compra, estado), [0, 0])
+    acumulado[0] += cantidad
+    acumulado[1] += monto
+
+
+def aplicar_deltas_resumen(deltas):
+    """
+    Aplica los deltas de sumar_deltas con un número de consultas fijo por
+    lote de claves: las filas existentes se bloquean y se actualizan o se
+    borran si quedan en cero, y las nuevas se crean. Si otra transacción
+    crea alguna de las nuevas a la vez, el lote se ajusta con ajustar_resumen.
+    """
+    claves = [clave for clave, (cantidad, monto) in deltas.items() if cantidad or monto]
+    with transaction.atomic():
+        for lote in _en_lotes(claves):
+            existentes = {
+                (fila.cliente_id, fila.fecha, fila.estado): fila
+                for fila in ResumenCompraDiaria.objects.select_for_update().filter(
+                    cliente_id__in={cliente_id for cliente_id, _, _ in lote},
+                    fecha__in={fecha for _, fecha, _ in lote}
+                )
+            }
+            actualizar, eliminar, crear = [], [], []
+            for clave in lote:
+                cantidad, monto = deltas[clave]
+                fila = existentes.get(clave)
+                if fila is not None:
+                    fila.cantidad += cantidad
+                    fila.monto_total += monto
+                    (actualizar if fila.cantidad > 0 else eliminar).append(fila)
+                elif cantidad > 0:
+                    cliente_id, fecha, estado = clave
+                    crear.append(ResumenCompraDiaria(
+                        cliente_id=cliente_id, fecha=fecha, estado=estado, cantidad=cantidad, monto_total=monto
+                    ))
+
+            ResumenCompraDiaria.objects.bulk_update(actualizar, ['cantidad', 'monto_total'])
+            ResumenCompraDiaria.objects.filter(pk__in=[fila.pk for fila in eliminar]).delete()
+            try:
+                with transaction.atomic():
+                    ResumenCompraDiaria.objects.bulk_create(crear)
+            except IntegrityError:
+                for fila in crear:
+                    ajustar_resumen(fila.cliente_id, fila.fecha, fila.estado, fila.cantidad, fila.monto_total)
+
+
+def _totales_desde_compras(cliente_ids=None):
+    """
+    Agrupa las compras, activas y archivadas, por (cliente, día, estado)
+    directamente en la base de datos
+    """
+    compras = compras_en_rango()
+    if cliente_ids is not None:
+        compras = compras.filter(cliente_id__in=cliente_ids)
+
+    return (
+        compras.annotate(fecha=TruncDate('fecha_compra'))
+        .values('cliente_id', 'fecha', 'estado')
+        .annotate(cantidad=Count('id'), monto_total=Sum('monto'))
+        .order_by()
+    )
+
+
+def _en_lotes(valores, tamano=TAMANO_LOTE_RESUMEN):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio:inicio + tamano]
+
+
+def reconstruir_resumen(cliente_ids=None):
+    """
+    Recalcula el resumen desde cero, para todos los clientes o solo para
+    `cliente_ids`. Retorna el número de filas de resumen escritas.
+    """
+    if cliente_ids is None:
+        grupos = [None]
+    else:
+        grupos = _en_lotes(set(cliente_ids))
+
+    total_filas = 0
+    with transaction.atomic():
+        for grupo in grupos:
+            resumenes = ResumenCompraDiaria.objects.all()
+            if grupo is not None:
+                resumenes = resumenes.filter(cliente_id__in=grupo)
+            resumenes.delete()
+
+            lote = []
+            for fila in _totales_desde_compras(grupo).iterator(chunk_size=TAMANO_LOTE_RESUMEN):
+                lote.append(ResumenCompraDiaria(**fila))
+                if len(lote) >= TAMANO_LOTE_RESUMEN:
+                    ResumenCompraDiaria.objects.bulk_create(lote)
+                    total_filas += len(lote)
+                    lote = []
+            if lote:
+                ResumenCompraDiaria.objects.bulk_create(lote)
+                total_filas += len(lote)
+
+    return total_filas
+
+
+def verificar_resumen():
+    """
+    Compara el resumen contra los totales calculados desde las compras.
+    Retorna la lista de claves (cliente_id, fecha, estado) con diferencias.
+    """
+    esperado = {
+        (fila['cliente_id'], fila['fecha'], fila['estado']): (fila['cantidad'], fila['monto_total'])
+        for fila in _totales_desde_compras().iterator(chunk_size=TAMANO_LOTE_RESUMEN)
+    }
+    diferencias = []
+    for fila in ResumenCompraDiaria.objects.values(
+        'cliente_id', 'fecha', 'estado', 'cantidad', 'monto_total'
+    ).iterator(chunk_size=TAMANO_LOTE_RESUMEN):
+        clave = (fila['cliente_id'], fila['fecha'], fila['estado'])
+        if esperado.pop(clave, None) != (fila['cantidad'], fila['monto_total']):
+            diferencias.append(clave)
+    diferencias.extend(esperado)
+    return diferencias
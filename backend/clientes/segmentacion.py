@@ -0,0 +1,289 @@
+"""
+Segmentación RFM (recencia, frecuencia, monto) de todos los clientes.
+
+Las compras completadas de la ventana se leen por lotes como arreglos
+columnares de NumPy (cliente, día, cantidad, monto) y se acumulan por
+cliente con np.add.at y np.maximum.at sobre arreglos indexados por el id
+del cliente. El costo crece linealmente con el número de compras y la
+memoria solo con el número de clientes; el único ordenamiento es el de los
+quintiles, sobre los clientes.
+
+Con el snapshot columnar habilitado (ver snapshot.py) las compras y los
+clientes activos se leen de sus archivos mapeados en memoria en lugar de
+la base.
+
+Cada dimensión se califica de 1 a 5 por quintiles de la base (5 = compra
+más reciente, más compras, mayor monto). El segmento combina R con el
+promedio de F y M.
+"""
+from datetime import timedelta
+from itertools import chain, islice
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archivo import compras_en_rango
+from .models import Cliente, ResumenCompraDiaria
+from .resumen import dias_completos_desde
+from .snapshot import SnapshotCompras, compras_completadas_desde, usar_snapshot_por_defecto
+
+DIAS_RFM_DEFAULT = 365
+DIAS_RFM_MAXIMO = 3650
+TAMANO_LOTE_RFM = 50000
+TAMANO_LOTE_CLIENTES = 2000
+QUINTILES = [0.2, 0.4, 0.6, 0.8]
+LIMITE_CLIENTES_DEFAULT = 100
+LIMITE_CLIENTES_MAXIMO = 1000
+
+# En el orden en que se evalúan las reglas de _segmentos; el último es el de descarte
+SEGMENTOS = ['Campeones', 'Nuevos', 'Leales', 'Potenciales', 'En riesgo', 'Hibernando', 'Perdidos']
+
+
+def parametros_segmentacion(parametros):
+    """
+    Lee la ventana en días, el segmento y el límite de clientes desde los
+    query params. Lanza ValueError si alguno no es válido.
+    """
+    try:
+        dias = int(parametros.get('dias', DIAS_RFM_DEFAULT))
+    except (TypeError, ValueError):
+        raise ValueError('El parámetro dias debe ser un número entero')
+    try:
+        limite = int(parametros.get('limite', LIMITE_CLIENTES_DEFAULT))
+    except (TypeError, ValueError):
+        raise ValueError('El parámetro limite debe ser un número entero')
+
+    if dias <= 0:
+        raise ValueError('El parámetro dias debe ser mayor que cero')
+    if dias > DIAS_RFM_MAXIMO:
+        raise ValueError(f'El parámetro dias no puede ser mayor que {DIAS_RFM_MAXIMO}')
+    segmento = parametros.get('segmento') or None
+    if segmento is not None and segmento not in SEGMENTOS:
+        raise ValueError(f"Segmento no válido. Opciones: {', '.join(SEGMENTOS)}")
+    return dias, segmento, max(1, min(limite, LIMITE_CLIENTES_MAXIMO))
+
+
+def _filas_compras(desde, hasta_cliente_id, hasta=None):
+    """
+    (cliente_id, día, cantidad, monto) de cada compra completada desde
+    `desde` y, si se indica, antes de `hasta`
+    """
+    filas = compras_en_rango(desde).filter(
+        estado='completada', fecha_compra__gte=desde, cliente_id__lte=hasta_cliente_id
+    )
+    if hasta is not None:
+        filas = filas.filter(fecha_compra__lt=hasta)
+    filas = (
+        filas
+        .annotate(dia=TruncDate('fecha_compra'))
+        .values_list('cliente_id', 'dia', 'monto')
+        .order_by()
+        .iterator(chunk_size=TAMANO_LOTE_RFM)
+    )
+    return ((cliente_id, dia.toordinal(), 1, monto) for cliente_id, dia, monto in filas)
+
+
+def _filas_resumen(desde, hasta_cliente_id):
+    """
+    (cliente_id, día, cantidad, monto) de la ventana desde `desde`: los días
+    completos salen del resumen diario y el día parcial de `desde`, de las
+    compras individuales
+    """
+    dia_inicio, dia_siguiente = dias_completos_desde(desde)
+    filas = (
+        ResumenCompraDiaria.objects
+        .filter(estado='completada', fecha__gt=dia_inicio, cliente_id__lte=hasta_cliente_id)
+        .values_list('cliente_id', 'fecha', 'cantidad', 'monto_total')
+        .order_by()
+        .iterator(chunk_size=TAMANO_LOTE_RFM)
+    )
+    return chain(
+        _filas_compras(desde, hasta_cliente_id, hasta=dia_siguiente),
+        ((cliente_id, fecha.toordinal(), cantidad, monto) for cliente_id, fecha, cantidad, monto in filas)
+    )
+
+
+def lotes_columnares(filas, tamano_lote=TAMANO_LOTE_RFM):
+    """Agrupa tuplas (cliente_id, día, cantidad, monto) en lotes de arreglos de NumPy"""
+    filas = iter(filas)
+    while lote := list(islice(filas, tamano_lote)):
+        cliente_id, dia, cantidad, monto = zip(*lote)
+        yield (
+            np.array(cliente_id, dtype=np.int64),
+            np.array(dia, dtype=np.int64),
+            np.array(cantidad, dtype=np.int64),
+            np.array(monto, dtype=np.float64),
+        )
+
+
+def acumular_por_cliente(lotes, tamano):
+    """
+    Frecuencia, monto y último día de compra por cliente, en arreglos de
+    `tamano` posiciones indexados por el id del cliente
+    """
+    frecuencia = np.zeros(tamano, dtype=np.int64)
+    monto = np.zeros(tamano, dtype=np.float64)
+    ultimo_dia = np.zeros(tamano, dtype=np.int64)
+    for cliente_id, dia, cantidad, monto_lote in lotes:
+        np.add.at(frecuencia, cliente_id, cantidad)
+        np.add.at(monto, cliente_id, monto_lote)
+        np.maximum.at(ultimo_dia, cliente_id, dia)
+    return frecuencia, monto, ultimo_dia
+
+
+def _calificar(valores, invertir=False):
+    """Cortes de quintiles y puntaje de 1 a 5; con `invertir` los valores bajos puntúan más"""
+    cortes = np.quantile(valores, QUINTILES)
+    posicion = np.searchsorted(cortes, valores, side='left')
+    puntaje = 5 - posicion if invertir else 1 + posicion
+    return cortes, puntaje.astype(np.int8)
+
+
+def _segmentos(r, f, m):
+    """Índice en SEGMENTOS de cada cliente según sus puntajes"""
+    fm = (f.astype(np.int16) + m + 1) // 2
+    reglas = [
+        (r >= 4) & (fm >= 4),  # Campeones
+        (r >= 4) & (f == 1),   # Nuevos
+        (r >= 3) & (fm >= 3),  # Leales
+        r >= 3,                # Potenciales
+        (r <= 2) & (fm >= 3),  # En riesgo
+        r == 2,                # Hibernando
+    ]
+    return np.select(reglas, range(len(reglas)), default=len(reglas)).astype(np.int8)
+
+
+def _acumulado_snapshot(snapshot, desde):
+    """Frecuencia, monto, último día y clientes activos leídos del snapshot"""
+    activos = np.asarray(snapshot.clientes()['activo'])
+    cliente_id, dia, centavos = compras_completadas_desde(snapshot, desde)
+    monto = centavos / 100
+    # Compras de clientes creados después del último refresco de la dimensión
+    dentro = cliente_id < len(activos)
+    lote = (cliente_id[dentro], dia[dentro], np.ones(int(dentro.sum()), dtype=np.int64), monto[dentro])
+    return (*acumular_por_cliente([lote], len(activos)), activos)
+
+
+def _acumulado_base(desde, usar_resumen):
+    """Frecuencia, monto, último día y clientes activos leídos de la base por lotes"""
+    # Los ids creados durante la lectura quedan fuera de los arreglos
+    maximo_id = Cliente.objects.aggregate(maximo=Max('id'))['maximo'] or 0
+    filas = (_filas_resumen if usar_resumen else _filas_compras)(desde, maximo_id)
+    frecuencia, monto, ultimo_dia = acumular_por_cliente(lotes_columnares(filas), maximo_id + 1)
+
+    activos = np.zeros(maximo_id + 1, dtype=bool)
+    ids_activos = Cliente.objects.filter(activo=True, id__lte=maximo_id).values_list('id', flat=True)
+    activos[np.fromiter(ids_activos.iterator(chunk_size=TAMANO_LOTE_RFM), dtype=np.int64)] = True
+    return frecuencia, monto, ultimo_dia, activos
+
+
+def segmentar(dias=DIAS_RFM_DEFAULT, referencia=None, usar_resumen=None, usar_snapshot=None):
+    """
+    Calcula la segmentación RFM de los clientes activos con compras
+    completadas en los últimos `dias`.
+
+    Con `usar_snapshot` (por defecto settings.CLIENTES_REPORTE_USAR_SNAPSHOT)
+    y un snapshot disponible se lee el snapshot columnar. Si no, con
+    `usar_resumen` (por defecto settings.CLIENTES_REPORTE_USAR_RESUMEN) las
+    compras se leen del resumen diario en lugar de la tabla de compras.
+
+    Retorna un diccionario con arreglos alineados por cliente (`cliente_id`,
+    `recencia` en días, `frecuencia`, `monto`, `r`, `f`, `m`, `segmento`) y
+    los `cortes` de los quintiles.
+    """
+    referencia = referencia or timezone.now()
+    if usar_resumen is None:
+        usar_resumen = getattr(settings, 'CLIENTES_REPORTE_USAR_RESUMEN', False)
+    if usar_snapshot is None:
+        usar_snapshot = usar_snapshot_por_defecto()
+    desde = referencia - timedelta(days=dias)
+
+    snapshot = SnapshotCompras()
+    if usar_snapshot and snapshot.disponible():
+        frecuencia, monto, ultimo_dia, activos = _acumulado_snapshot(snapshot, desde)
+    else:
+        frecuencia, monto, ultimo_dia, activos = _acumulado_base(desde, usar_resumen)
+
+    cliente_id = np.flatnonzero(activos & (frecuencia > 0))
+    resultado = {
+        'fecha_referencia': timezone.localdate(referencia),
+        'dias': dias,
+        'cliente_id': cliente_id,
+        'recencia': timezone.localdate(referencia).toordinal() - ultimo_dia[cliente_id],
+        'frecuencia': frecuencia[cliente_id],
+        'monto': monto[cliente_id],
+        'cortes': {},
+    }
+    if not len(cliente_id):
+        vacio = np.zeros(0, dtype=np.int8)
+        resultado.update(r=vacio, f=vacio, m=vacio, segmento=vacio)
+        return resultado
+
+    for dimension, valores, invertir in (
+        ('r', resultado['recencia'], True),
+        ('f', resultado['frecuencia'], False),
+        ('m', resultado['monto'], False),
+    ):
+        cortes, resultado[dimension] = _calificar(valores, invertir=invertir)
+        resultado['cortes'][dimension] = cortes.tolist()
+    resultado['segmento'] = _segmentos(resultado['r'], resultado['f'], resultado['m'])
+    return resultado
+
+
+def resumen_segmentos(resultado):
+    """Clientes, monto total y promedios de recencia y frecuencia por segmento"""
+    segmento = resultado['segmento']
+    clientes = np.bincount(segmento, minlength=len(SEGMENTOS))
+    monto = np.bincount(segmento, weights=resultado['monto'], minlength=len(SEGMENTOS))
+    recencia = np.bincount(segmento, weights=resultado['recencia'], minlength=len(SEGMENTOS))
+    frecuencia = np.bincount(segmento, weights=resultado['frecuencia'], minlength=len(SEGMENTOS))
+    divisor = np.maximum(clientes, 1)
+    return [
+        {
+            'segmento': nombre,
+            'clientes': int(clientes[indice]),
+            'monto_total': round(float(monto[indice]), 2),
+            'recencia_promedio': round(float(recencia[indice] / divisor[indice]), 1),
+            'frecuencia_promedio': round(float(frecuencia[indice] / divisor[indice]), 2),
+        }
+        for indice, nombre in enumerate(SEGMENTOS)
+    ]
+
+
+def filas_segmentacion(resultado, segmento=None, limite=None, tamano_lote=TAMANO_LOTE_CLIENTES):
+    """
+    Filas por cliente con sus datos y puntajes, ordenadas por monto
+    descendente. Se puede limitar a un `segmento` (nombre) y a `limite` filas.
+    Los datos de los clientes se consultan por lotes.
+    """
+    orden = np.lexsort((resultado['cliente_id'], -resultado['monto']))
+    if segmento is not None:
+        orden = orden[resultado['segmento'][orden] == SEGMENTOS.index(segmento)]
+    if limite is not None:
+        orden = orden[:limite]
+
+    for inicio in range(0, len(orden), tamano_lote):
+        posiciones = orden[inicio:inicio + tamano_lote]
+        clientes = {
+            fila['id']: fila
+            for fila in Cliente.objects.filter(id__in=resultado['cliente_id'][posiciones].tolist()).values(
+                'id', 'tipo_documento__nombre', 'numero_documento', 'nombre', 'apellido', 'correo', 'telefono'
+            )
+        }
+        for posicion in posiciones:
+            cliente = clientes.get(int(resultado['cliente_id'][posicion]))
+            if cliente is None:
+                continue
+            yield {
+                **cliente,
+                'recencia': int(resultado['recencia'][posicion]),
+                'frecuencia': int(resultado['frecuencia'][posicion]),
+                'monto': round(float(resultado['monto'][posicion]), 2),
+                'r': int(resultado['r'][posicion]),
+                'f': int(resultado['f'][posicion]),
+                'm': int(resultado['m'][posicion]),
+                'segmento': SEGMENTOS[resultado['segmento'][posicion]],
+            }
@@ -1,5 +1,10 @@
+from django.conf import settings
+from django.db.models import Sum
 from rest_framework import serializers
-from .models import TipoDocumento, Cliente, Compra
+from rest_framework.reverse import reverse
+from .cache import tipos_documento_activos
+from .models import TipoDocumento, Cambio, Cliente, Compra, TrabajoReporte
+from .reportes import DIAS_VENTANA_DEFAULT, DIAS_VENTANA_MAXIMO, MONTO_MINIMO_DEFAULT
 
 
 class TipoDocumentoSerializer(serializers.ModelSerializer):
@@ -14,9 +19,24 @@ class CompraSerializer(serializers.ModelSerializer):
         fields = ['id', 'numero_factura', 'fecha_compra', 'monto', 'descripcion', 'estado']
 
 
+class TipoDocumentoCacheadoField(serializers.PrimaryKeyRelatedField):
+    """Valida el id de tipo de documento contra el catálogo en caché"""
+    
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            tipo = tipos_documento_activos().get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if tipo is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tipo
+
+
 class ClienteSerializer(serializers.ModelSerializer):
     tipo_documento = TipoDocumentoSerializer(read_only=True)
-    tipo_documento_id = serializers.PrimaryKeyRelatedField(
+    tipo_documento_id = TipoDocumentoCacheadoField(
         queryset=TipoDocumento.objects.filter(activo=True),
         source='tipo_documento',
         write_only=True
@@ -37,10 +57,74 @@ class ClienteSerializer(serializers.ModelSerializer):
             'correo',
             'telefono',
             'fecha_registro',
+            'fecha_actualizacion',
             'activo',
             'compras'
         ]
-        read_only_fields = ['fecha_registro']
+        read_only_fields = ['fecha_registro', 'fecha_actualizacion']
+
+
+def parametro_lista(query_params, nombre):
+    """Lee un query param separado por comas (?fields=a,b) como lista"""
+    valor = query_params.get(nombre, '')
+    return [parte.strip() for parte in valor.split(',') if parte.strip()]
+
+
+class ClienteListaSerializer(serializers.ModelSerializer):
+    """
+    Serializer compacto para el listado de clientes, sin compras anidadas.
+    Con ?fields=id,nombre se limitan los campos y con ?expand=compras se
+    incluyen las compras de cada cliente.
+    """
+    tipo_documento = TipoDocumentoSerializer(read_only=True)
+    nombre_completo = serializers.ReadOnlyField()
+    
+    # Columnas del modelo que necesita cada campo, para usar con only()
+    COLUMNAS = {
+        'id': ['id'],
+        'tipo_documento': ['tipo_documento'],
+        'numero_documento': ['numero_documento'],
+        'nombre': ['nombre'],
+        'apellido': ['apellido'],
+        'nombre_completo': ['nombre', 'apellido'],
+        'correo': ['correo'],
+        'telefono': ['telefono'],
+        'fecha_registro': ['fecha_registro'],
+        'fecha_actualizacion': ['fecha_actualizacion'],
+        'activo': ['activo'],
+    }
+    EXPANDIBLES = ['compras']
+    
+    class Meta:
+        model = Cliente
+        fields = [
+            'id',
+            'tipo_documento',
+            'numero_documento',
+            'nombre',
+            'apellido',
+            'nombre_completo',
+            'correo',
+            'telefono',
+            'fecha_registro',
+            'fecha_actualizacion',
+            'activo'
+        ]
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        
+        expandidos = parametro_lista(request.query_params, 'expand')
+        if 'compras' in expandidos:
+            self.fields['compras'] = CompraSerializer(many=True, read_only=True)
+        
+        campos = parametro_lista(request.query_params, 'fields')
+        if campos:
+            for nombre in set(self.fields) - set(campos) - set(expandidos):
+                self.fields.pop(nombre)
 
 
 class ClienteBusquedaSerializer(serializers.ModelSerializer):
@@ -48,7 +132,8 @@ class ClienteBusquedaSerializer(serializers.ModelSerializer):
     tipo_documento = TipoDocumentoSerializer(read_only=True)
     nombre_completo = serializers.ReadOnlyField()
     total_compras = serializers.SerializerMethodField()
-    compras = CompraSerializer(many=True, read_only=True)
+    # Activas y archivadas; ver Cliente.objects.para_busqueda()
+    compras = CompraSerializer(source='compras_historicas', many=True, read_only=True)
     monto_total_compras = serializers.SerializerMethodField()
     
     class Meta:
@@ -68,15 +153,138 @@ class ClienteBusquedaSerializer(serializers.ModelSerializer):
             'monto_total_compras'
         ]
     
+    def _totales_compras(self, obj):
+        """
+        Cantidad y monto de compras completadas. Usa las anotaciones de
+        Cliente.objects.con_totales_compras() y, si no están, el resumen diario
+        """
+        if hasattr(obj, 'total_compras_completadas'):
+            return {'cantidad': obj.total_compras_completadas, 'monto': obj.monto_compras_completadas}
+        if not hasattr(obj, '_totales_compras'):
+            obj._totales_compras = obj.resumenes_compras.filter(estado='completada').aggregate(
+                cantidad=Sum('cantidad'),
+                monto=Sum('monto_total')
+            )
+        return obj._totales_compras
+    
     def get_total_compras(self, obj):
         """Calcula el total de compras del cliente"""
-        return obj.compras.filter(estado='completada').count()
+        return self._totales_compras(obj)['cantidad'] or 0
     
     def get_monto_total_compras(self, obj):
         """Calcula el monto total de compras completadas"""
-        from django.db.models import Sum
-        total = obj.compras.filter(estado='completada').aggregate(
-            total=Sum('monto')
-        )['total'] or 0
-        return float(total)
+        return float(self._totales_compras(obj)['monto'] or 0)
 
+
+class ClienteAutocompletarSerializer(serializers.ModelSerializer):
+    """Resultado del autocompletado, con el puntaje de relevancia"""
+    tipo_documento = serializers.CharField(source='tipo_documento.codigo', read_only=True)
+    nombre_completo = serializers.ReadOnlyField()
+    puntaje = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Cliente
+        fields = [
+            'id',
+            'tipo_documento',
+            'numero_documento',
+            'nombre_completo',
+            'correo',
+            'telefono',
+            'puntaje'
+        ]
+
+
+class DocumentoClienteSerializer(serializers.Serializer):
+    tipo_documento_id = serializers.IntegerField()
+    numero_documento = serializers.CharField(max_length=50)
+
+
+class BusquedaLoteSerializer(serializers.Serializer):
+    """Entrada de la búsqueda por lote: lista de pares tipo/número de documento"""
+    documentos = serializers.ListField(
+        child=DocumentoClienteSerializer(),
+        allow_empty=False
+    )
+    
+    def validate_documentos(self, documentos):
+        maximo = getattr(settings, 'CLIENTES_BUSCAR_LOTE_MAX', 500)
+        if len(documentos) > maximo:
+            raise serializers.ValidationError(f'Se permiten máximo {maximo} documentos por lote')
+        return documentos
+
+
+class TrabajoReporteSerializer(serializers.ModelSerializer):
+    """Serializer para encolar y consultar trabajos de reporte"""
+    dias = serializers.IntegerField(min_value=1, max_value=DIAS_VENTANA_MAXIMO, default=DIAS_VENTANA_DEFAULT)
+    monto_minimo = serializers.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        min_value=0,
+        default=MONTO_MINIMO_DEFAULT
+    )
+    url_descarga = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = TrabajoReporte
+        fields = [
+            'id',
+            'estado',
+            'dias',
+            'monto_minimo',
+            'segmentacion',
+            'progreso',
+            'total_filas',
+            'filas_procesadas',
+            'error',
+            'fecha_creacion',
+            'fecha_inicio',
+            'fecha_fin',
+            'url_descarga'
+        ]
+        read_only_fields = [
+            'estado',
+            'progreso',
+            'total_filas',
+            'filas_procesadas',
+            'error',
+            'fecha_creacion',
+            'fecha_inicio',
+            'fecha_fin'
+        ]
+    
+    def get_url_descarga(self, obj):
+        if obj.estado != TrabajoReporte.ESTADO_COMPLETADO:
+            return None
+        return reverse(
+            'trabajos-reporte-descargar',
+            kwargs={'pk': obj.pk},
+            request=self.context.get('request')
+        )
+
+
+class CompraCambioSerializer(serializers.ModelSerializer):
+    """Compra activa o archivada tal como se publica en el feed de cambios"""
+    class Meta:
+        model = Compra
+        fields = ['id', 'cliente', 'numero_factura', 'fecha_compra', 'monto', 'descripcion', 'estado']
+
+
+class CambioSerializer(serializers.ModelSerializer):
+    """
+    Cambio del feed con el estado actual del objeto en `datos`, o null si
+    fue eliminado
+    """
+    seq = serializers.IntegerField(source='id', read_only=True)
+    datos = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Cambio
+        fields = ['seq', 'modelo', 'objeto_id', 'operacion', 'fecha', 'datos']
+    
+    def get_datos(self, cambio):
+        if cambio.objeto is None:
+            return None
+        if cambio.modelo == 'cliente':
+            return ClienteListaSerializer(cambio.objeto).data
+        return CompraCambioSerializer(cambio.objeto).data
@@ -0,0 +1,119 @@
+"""
+Señales que mantienen al día las estructuras derivadas de Cliente y Compra
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .archivo import archivando
+from .busqueda import CAMPOS_INDEXADOS, indexar_clientes
+from .cache import cache_local
+from .cambios import MODELO_CAMBIO, registrar_cambios
+from .models import Cambio, Cliente, Compra, CompraArchivada, TipoDocumento
+from .resumen import ajustar_resumen, clave_resumen
+
+
+def _monto(instance):
+    """Monto de la compra como Decimal, aunque se haya asignado como int o str"""
+    return Compra._meta.get_field('monto').to_python(instance.monto)
+
+
+@receiver(pre_save, sender=Compra)
+def capturar_compra_anterior(sender, instance, raw=False, **kwargs):
+    """Guarda los valores previos de la compra para calcular el delta del resumen"""
+    instance._resumen_anterior = None
+    if raw or instance.pk is None:
+        return
+    instance._resumen_anterior = (
+        Compra.objects.filter(pk=instance.pk)
+        .values('cliente_id', 'fecha_compra', 'estado', 'monto')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Compra)
+def actualizar_resumen_compra(sender, instance, raw=False, **kwargs):
+    """Aplica al resumen diario el alta o modificación de una compra"""
+    if raw:
+        return
+
+    nueva = clave_resumen(instance.cliente_id, instance.fecha_compra, instance.estado)
+    anterior = getattr(instance, '_resumen_anterior', None)
+    if anterior is not None:
+        clave_anterior = clave_resumen(
+            anterior['cliente_id'], anterior['fecha_compra'], anterior['estado']
+        )
+        if clave_anterior == nueva and anterior['monto'] == _monto(instance):
+            return
+        ajustar_resumen(*clave_anterior, -1, -anterior['monto'])
+
+    ajustar_resumen(*nueva, 1, _monto(instance))
+
+
+@receiver(post_delete, sender=Compra)
+def descontar_resumen_compra(sender, instance, **kwargs):
+    """Descuenta del resumen diario una compra eliminada"""
+    if archivando():
+        return
+    ajustar_resumen(
+        *clave_resumen(instance.cliente_id, instance.fecha_compra, instance.estado),
+        -1,
+        -_monto(instance)
+    )
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_save, sender=Compra)
+def registrar_cambio_guardado(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Registra el alta o modificación en el feed de cambios; también incrementa
+    la versión de datos, lo que invalida los reportes en caché
+    """
+    if not raw:
+        operacion = Cambio.CREADO if created else Cambio.ACTUALIZADO
+        registrar_cambios(MODELO_CAMBIO[sender], [instance.pk], operacion)
+
+
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Compra)
+@receiver(post_delete, sender=CompraArchivada)
+def registrar_cambio_eliminado(sender, instance, **kwargs):
+    """Deja la marca de eliminación en el feed de cambios e invalida los reportes en caché"""
+    if sender is Compra and archivando():
+        return
+    registrar_cambios(MODELO_CAMBIO[sender], [instance.pk], Cambio.ELIMINADO)
+
+
+@receiver(post_save, sender=TipoDocumento)
+@receiver(post_delete, sender=TipoDocumento)
+def invalidar_cache_catalogo(sender, **kwargs):
+    """Los tipos de documento aparecen en el catálogo y en las respuestas de buscar"""
+    cache_local('catalogo').invalidar()
+    cache_local('buscar').invalidar()
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_cache_buscar_cliente(sender, instance, **kwargs):
+    cache_local('buscar').invalidar_si(lambda datos: datos['id'] == instance.pk)
+
+
+@receiver(post_save, sender=Compra)
+@receiver(post_delete, sender=Compra)
+def invalidar_cache_buscar_compra(sender, instance, **kwargs):
+    """Invalida la respuesta del cliente de la compra y la del anterior si la compra cambió de cliente"""
+    # Buscar lee las compras desde CompraHistorica: archivarlas no cambia la respuesta
+    if archivando():
+        return
+    cliente_ids = {instance.cliente_id}
+    anterior = getattr(instance, '_resumen_anterior', None)
+    if anterior is not None:
+        cliente_ids.add(anterior['cliente_id'])
+    cache_local('buscar').invalidar_si(lambda datos: datos['id'] in cliente_ids)
+
+
+@receiver(post_save, sender=Cliente)
+def indexar_cliente_busqueda(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Regenera los tokens de búsqueda del cliente; al eliminarlo se borran en cascada"""
+    if raw or (update_fields is not None and not set(update_fields) & set(CAMPOS_INDEXADOS)):
+        return
+    indexar_clientes([instance.pk])
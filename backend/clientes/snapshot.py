@@ -0,0 +1,349 @@
+"""
+Snapshot columnar de las compras para los motores de reportes.
+
+Cada columna es un archivo .npy que los reportes abren con
+np.load(mmap_mode='r'): leen las páginas del archivo sin copiarlo a memoria
+y sin consultar las tablas que atienden buscar. Las compras, activas y
+archivadas, se guardan unidas a la dimensión de clientes:
+
+    compras/   id, cliente_id, fecha (segundos UTC), dia (ordinal del día
+               local), centavos (monto en centavos enteros), estado
+               (índice en ESTADOS_COMPRA), vigente
+    clientes/  activo y tipo_documento_id, indexados por el id del cliente
+
+Los archivos de compras se crean con capacidad de sobra. Refrescar agrega
+al final las compras nuevas (id mayor que el último del snapshot), después
+de las filas que los lectores conocen. Las compras modificadas desde el
+refresco anterior (Compra.fecha_actualizacion) y las eliminadas
+(vigente=False) no se escriben sobre los archivos abiertos: se escriben en
+copias de las columnas que cambian, que reemplazan a las originales con
+os.replace. Un lector que ya abrió una columna conserva la versión
+anterior completa. La dimensión de clientes se reescribe completa.
+meta.json se reemplaza al final, así que los lectores solo ven filas
+completas. Un snapshot de otra VERSION_SNAPSHOT se ignora y el siguiente
+refresco lo reconstruye.
+
+Los montos se guardan y se suman como enteros en centavos, de modo que los
+totales y la comparación con el monto mínimo son exactos.
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archivo import compras_en_rango
+from .models import ESTADOS_COMPRA, Cliente, Compra, TipoDocumento
+
+VERSION_SNAPSHOT = 2  # 2: montos en centavos enteros
+TAMANO_LOTE_SNAPSHOT = 50000
+CAPACIDAD_MINIMA = 1024
+# Las compras modificadas justo antes del refresco pueden confirmarse después
+# de leerlas; se vuelven a leer en el siguiente (sobrescribirlas es idempotente)
+MARGEN_ACTUALIZACION = timedelta(minutes=5)
+
+CODIGOS_ESTADO = {estado: codigo for codigo, (estado, _) in enumerate(ESTADOS_COMPRA)}
+
+COLUMNAS_COMPRAS = {
+    'id': np.int64,
+    'cliente_id': np.int64,
+    'fecha': np.int64,
+    'dia': np.int32,
+    'centavos': np.int64,
+    'estado': np.int8,
+    'vigente': np.bool_,
+}
+COLUMNAS_CLIENTES = {
+    'activo': np.bool_,
+    'tipo_documento_id': np.int64,
+}
+
+
+def a_centavos(monto):
+    """Centavos enteros de un monto Decimal; las fracciones de centavo suben"""
+    return math.ceil(monto * 100)
+
+
+def usar_snapshot_por_defecto():
+    """Valor de settings.CLIENTES_REPORTE_USAR_SNAPSHOT"""
+    return getattr(settings, 'CLIENTES_REPORTE_USAR_SNAPSHOT', False)
+
+
+class SnapshotCompras:
+    """Lectura y refresco del snapshot columnar guardado en `directorio`"""
+
+    def __init__(self, directorio=None):
+        self.directorio = Path(directorio or getattr(
+            settings, 'CLIENTES_SNAPSHOT_DIR', settings.BASE_DIR / 'snapshot_compras'
+        ))
+
+    # Lectura
+
+    def meta(self):
+        """Metadatos del snapshot o None si no existe o es de otra versión"""
+        try:
+            meta = json.loads((self.directorio / 'meta.json').read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return meta if meta.get('version') == VERSION_SNAPSHOT else None
+
+    def disponible(self):
+        return self.meta() is not None
+
+    def marca(self):
+        """Identifica el contenido actual del snapshot, para las claves de caché"""
+        meta = self.meta()
+        return meta['actualizado'] if meta else ''
+
+    def compras(self, meta=None):
+        """Columnas de compras mapeadas en memoria, recortadas a las filas válidas"""
+        meta = meta or self.meta()
+        return {
+            nombre: np.load(self._ruta('compras', nombre), mmap_mode='r')[:meta['filas']]
+            for nombre in COLUMNAS_COMPRAS
+        }
+
+    def clientes(self):
+        """Columnas de clientes mapeadas en memoria; la posición es el id del cliente"""
+        return {
+            nombre: np.load(self._ruta('clientes', nombre), mmap_mode='r')
+            for nombre in COLUMNAS_CLIENTES
+        }
+
+    # Refresco
+
+    def actualizar(self, completo=False):
+        """
+        Refresca el snapshot; lo reconstruye si no existe o si `completo`.
+        Retorna un diccionario con las compras nuevas, modificadas y
+        eliminadas y el total de filas.
+        """
+        inicio = timezone.now()
+        meta = None if completo else self.meta()
+        (self.directorio / 'compras').mkdir(parents=True, exist_ok=True)
+        (self.directorio / 'clientes').mkdir(parents=True, exist_ok=True)
+
+        if meta is None:
+            # Sin meta.json los lectores vuelven a la base mientras se reconstruye
+            (self.directorio / 'meta.json').unlink(missing_ok=True)
+            meta = {'filas': 0, 'capacidad': 0, 'ultimo_id': 0, 'ordenado': True}
+            self._asegurar_capacidad(meta, CAPACIDAD_MINIMA)
+            nuevas = self._agregar(meta, compras_en_rango().order_by('id'))
+            modificadas = eliminadas = 0
+        else:
+            ultimo_id = meta['ultimo_id']
+            nuevas = self._agregar(meta, compras_en_rango().filter(id__gt=ultimo_id).order_by('id'))
+            copias = {}
+            modificadas = self._sobrescribir(meta, Compra.objects.filter(
+                id__lte=ultimo_id,
+                fecha_actualizacion__gte=datetime.fromisoformat(meta['marca_actualizacion'])
+            ), copias)
+            eliminadas = self._marcar_eliminadas(meta, copias)
+            self._reemplazar(copias)
+
+        self._escribir_clientes()
+        meta.update(
+            version=VERSION_SNAPSHOT,
+            marca_actualizacion=(inicio - MARGEN_ACTUALIZACION).isoformat(),
+            actualizado=timezone.now().isoformat(),
+            tipos_documento={tipo.pk: tipo.nombre for tipo in TipoDocumento.objects.all()},
+        )
+        self._escribir_meta(meta)
+        return {'nuevas': nuevas, 'modificadas': modificadas, 'eliminadas': eliminadas, 'filas': meta['filas']}
+
+    def verificar(self):
+        """
+        Compara cantidad y monto de las compras vigentes del snapshot con la
+        base. Retorna una lista de diferencias (vacía si coinciden).
+        """
+        meta = self.meta()
+        if meta is None:
+            return ['El snapshot no existe']
+        compras = self.compras(meta)
+        vigentes = np.asarray(compras['vigente'])
+        base = compras_en_rango().aggregate(cantidad=Count('id'), monto=Sum('monto'))
+
+        diferencias = []
+        if int(vigentes.sum()) != base['cantidad']:
+            diferencias.append(f"cantidad: snapshot {int(vigentes.sum())}, base {base['cantidad']}")
+        centavos = int(np.asarray(compras['centavos'])[vigentes].sum())
+        centavos_base = a_centavos(base['monto'] or 0)
+        if centavos != centavos_base:
+            diferencias.append(f'monto: snapshot {centavos / 100:.2f}, base {centavos_base / 100:.2f}')
+        return diferencias
+
+    def _ruta(self, tabla, nombre):
+        return self.directorio / tabla / f'{nombre}.npy'
+
+    def _lotes(self, compras):
+        """Columnas de las compras del queryset, por lotes de TAMANO_LOTE_SNAPSHOT"""
+        filas = (
+            compras.annotate(dia=TruncDate('fecha_compra'))
+            .values_list('id', 'cliente_id', 'fecha_compra', 'dia', 'monto', 'estado')
+            .iterator(chunk_size=TAMANO_LOTE_SNAPSHOT)
+        )
+        while lote := list(islice(filas, TAMANO_LOTE_SNAPSHOT)):
+            ids, cliente_ids, fechas, dias, montos, estados = zip(*lote)
+            yield {
+                'id': np.array(ids, dtype=np.int64),
+                'cliente_id': np.array(cliente_ids, dtype=np.int64),
+                'fecha': np.array([int(fecha.timestamp()) for fecha in fechas], dtype=np.int64),
+                'dia': np.array([dia.toordinal() for dia in dias], dtype=np.int32),
+                'centavos': np.fromiter(map(a_centavos, montos), dtype=np.int64, count=len(lote)),
+                'estado': np.array([CODIGOS_ESTADO[estado] for estado in estados], dtype=np.int8),
+                'vigente': np.ones(len(lote), dtype=np.bool_),
+            }
+
+    def _agregar(self, meta, compras):
+        """Agrega las compras del queryset al final de las columnas. Retorna cuántas agregó"""
+        agregadas = 0
+        for lote in self._lotes(compras):
+            cantidad = len(lote['id'])
+            self._asegurar_capacidad(meta, meta['filas'] + cantidad)
+            for nombre in COLUMNAS_COMPRAS:
+                columna = np.load(self._ruta('compras', nombre), mmap_mode='r+')
+                columna[meta['filas']:meta['filas'] + cantidad] = lote[nombre]
+                columna.flush()
+            if lote['id'][0] <= meta['ultimo_id']:
+                meta['ordenado'] = False
+            meta['ultimo_id'] = max(meta['ultimo_id'], int(lote['id'].max()))
+            meta['filas'] += cantidad
+            agregadas += cantidad
+        return agregadas
+
+    def _asegurar_capacidad(self, meta, filas):
+        """Duplica la capacidad de los archivos hasta que quepan `filas` filas"""
+        if filas <= meta['capacidad']:
+            return
+        capacidad = max(CAPACIDAD_MINIMA, meta['capacidad'] * 2, filas)
+        for nombre, tipo in COLUMNAS_COMPRAS.items():
+            ruta = self._ruta('compras', nombre)
+            temporal = ruta.with_suffix('.tmp.npy')
+            nueva = np.lib.format.open_memmap(temporal, mode='w+', dtype=tipo, shape=(capacidad,))
+            if meta['filas']:
+                nueva[:meta['filas']] = np.load(ruta, mmap_mode='r')[:meta['filas']]
+            nueva.flush()
+            del nueva
+            # Los lectores que ya abrieron el archivo anterior conservan su copia
+            os.replace(temporal, ruta)
+        meta['capacidad'] = capacidad
+
+    def _posiciones(self, meta, ids):
+        """Posición en el snapshot de cada id, o -1 si no está"""
+        ids_snapshot = np.load(self._ruta('compras', 'id'), mmap_mode='r')[:meta['filas']]
+        orden = None if meta['ordenado'] else np.argsort(ids_snapshot, kind='stable')
+        ordenados = ids_snapshot if orden is None else ids_snapshot[orden]
+        posiciones = np.minimum(np.searchsorted(ordenados, ids), max(meta['filas'] - 1, 0))
+        encontrados = (ordenados[posiciones] == ids) if meta['filas'] else np.zeros(len(ids), dtype=bool)
+        if orden is not None:
+            posiciones = orden[posiciones]
+        return np.where(encontrados, posiciones, -1)
+
+    def _copia(self, copias, nombre):
+        """Copia escribible de una columna de compras, creada la primera vez que se pide"""
+        if nombre not in copias:
+            ruta = self._ruta('compras', nombre)
+            temporal = ruta.with_suffix('.tmp.npy')
+            shutil.copyfile(ruta, temporal)
+            copias[nombre] = np.load(temporal, mmap_mode='r+')
+        return copias[nombre]
+
+    def _reemplazar(self, copias):
+        """Reemplaza cada columna por su copia modificada"""
+        while copias:
+            nombre, copia = copias.popitem()
+            copia.flush()
+            temporal = copia.filename
+            del copia
+            os.replace(temporal, self._ruta('compras', nombre))
+
+    def _sobrescribir(self, meta, compras, copias):
+        """
+        Escribe las compras modificadas en copias de las columnas que cambian;
+        las que no estaban (confirmadas después de un refresco con ids mayores)
+        se agregan al final. Retorna cuántas escribió.
+        """
+        ids = np.fromiter(compras.values_list('id', flat=True).order_by('id'), dtype=np.int64)
+        faltantes = ids[self._posiciones(meta, ids) < 0].tolist()
+        # Primero se agregan, sobre los archivos vigentes y después de las filas
+        # publicadas, para que las copias ya las incluyan
+        escritas = self._agregar(meta, Compra.objects.filter(id__in=faltantes).order_by('id'))
+
+        for lote in self._lotes(compras.exclude(id__in=faltantes).order_by('id')):
+            posiciones = self._posiciones(meta, lote['id'])
+            for nombre in COLUMNAS_COMPRAS:
+                actual = np.load(self._ruta('compras', nombre), mmap_mode='r')[posiciones]
+                if not np.array_equal(actual, lote[nombre]):
+                    self._copia(copias, nombre)[posiciones] = lote[nombre]
+            escritas += len(posiciones)
+        return escritas
+
+    def _marcar_eliminadas(self, meta, copias):
+        """
+        Marca vigente=False en las compras del snapshot cuyo id ya no está en
+        la base. Compara los ids: una eliminación y un alta dejan la misma
+        cantidad de compras.
+        """
+        vigente = copias.get('vigente')
+        if vigente is None:
+            vigente = np.load(self._ruta('compras', 'vigente'), mmap_mode='r')
+        vigente = np.asarray(vigente[:meta['filas']])
+        ids_snapshot = np.load(self._ruta('compras', 'id'), mmap_mode='r')[:meta['filas']]
+        ids_base = np.fromiter(
+            compras_en_rango().values_list('id', flat=True).order_by().iterator(chunk_size=TAMANO_LOTE_SNAPSHOT),
+            dtype=np.int64
+        )
+        eliminadas = vigente & ~np.isin(ids_snapshot, ids_base)
+        if eliminadas.any():
+            self._copia(copias, 'vigente')[:meta['filas']][eliminadas] = False
+        return int(eliminadas.sum())
+
+    def _escribir_clientes(self):
+        """Reescribe la dimensión de clientes indexada por id"""
+        filas = np.fromiter(
+            Cliente.objects.values_list('id', *COLUMNAS_CLIENTES)
+            .order_by('id')
+            .iterator(chunk_size=TAMANO_LOTE_SNAPSHOT),
+            dtype=[('id', np.int64), *COLUMNAS_CLIENTES.items()]
+        )
+        tamano = int(filas['id'][-1]) + 1 if len(filas) else 0
+        columnas = {nombre: np.zeros(tamano, dtype=tipo) for nombre, tipo in COLUMNAS_CLIENTES.items()}
+        for nombre, columna in columnas.items():
+            columna[filas['id']] = filas[nombre]
+        for nombre, valores in columnas.items():
+            self._escribir_atomico(self._ruta('clientes', nombre), valores)
+
+    def _escribir_atomico(self, ruta, valores):
+        with tempfile.NamedTemporaryFile(dir=ruta.parent, suffix='.npy', delete=False) as archivo:
+            np.save(archivo, valores)
+        os.replace(archivo.name, ruta)
+
+    def _escribir_meta(self, meta):
+        ruta = self.directorio / 'meta.json'
+        with tempfile.NamedTemporaryFile('w', dir=self.directorio, suffix='.json', delete=False) as archivo:
+            json.dump(meta, archivo)
+        os.replace(archivo.name, ruta)
+
+
+def compras_completadas_desde(snapshot, desde, meta=None):
+    """
+    Columnas (cliente_id, dia, centavos) de las compras vigentes y
+    completadas del snapshot con fecha desde `desde`
+    """
+    compras = snapshot.compras(meta)
+    filtro = (
+        np.asarray(compras['vigente'])
+        & (np.asarray(compras['estado']) == CODIGOS_ESTADO['completada'])
+        & (np.asarray(compras['fecha']) >= int(desde.timestamp()))
+    )
+    return compras['cliente_id'][filtro], compras['dia'][filtro], compras['centavos'][filtro]
+
@@ -0,0 +1,1258 @@
+import csv
+import json
+import re
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Max
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .admin import LIMITE_CONTEO_EXACTO
+from .archivo import fijar_corte
+from .cache import cache_local
+from .exportacion import ENCABEZADOS_CSV, FORMATOS_EXPORTACION, exportar as exportar_clientes, filtrar_clientes
+from .management.commands.verificar_indices import RECORRIDO_COMPLETO, consultas_frecuentes, nombre_indice
+from .middleware import InstrumentacionMiddleware
+from .models import Cambio, Cliente, Compra, CompraArchivada, ResumenCompraDiaria, TipoDocumento
+from .pagination import ClienteKeysetPagination, CompraKeysetPagination
+from .reportes import CONTENT_TYPE_XLSX, HOJA_REPORTE, HOJA_SEGMENTACION, clientes_fidelizacion, fidelizacion_snapshot
+from .resumen import verificar_resumen
+from .segmentacion import segmentar
+from .serializers import ClienteListaSerializer
+from .snapshot import CODIGOS_ESTADO, SnapshotCompras
+from .views import PRESUPUESTO_CONSULTAS_BUSCAR
+
+
+def fecha_local(*partes):
+    """Fecha con hora en la zona horaria del proyecto"""
+    return timezone.make_aware(datetime(*partes))
+
+
+def contenido(respuesta):
+    """Cuerpo completo de una respuesta por streaming, síncrona o asíncrona"""
+    if respuesta.is_async:
+        async def leer():
+            return b''.join([bloque async for bloque in respuesta.streaming_content])
+        return async_to_sync(leer)()
+    return b''.join(respuesta.streaming_content)
+
+
+class DatosClientesMixin:
+    """Crea tipos de documento, clientes y compras para las pruebas"""
+
+    @classmethod
+    def crear_cliente(cls, numero, **campos):
+        campos.setdefault('tipo_documento', cls.cedula)
+        campos.setdefault('nombre', 'Cliente')
+        campos.setdefault('apellido', numero)
+        campos.setdefault('correo', f'cliente{numero}@ejemplo.com')
+        campos.setdefault('telefono', '3000000000')
+        return Cliente.objects.create(numero_documento=numero, **campos)
+
+    @classmethod
+    def crear_compra(cls, cliente, fecha_compra, monto, estado='completada'):
+        cls.facturas = getattr(cls, 'facturas', 0) + 1
+        return Compra.objects.create(
+            cliente=cliente,
+            numero_factura=f'F-{cls.facturas:06d}',
+            fecha_compra=fecha_compra,
+            monto=Decimal(monto),
+            estado=estado
+        )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cedula = TipoDocumento.objects.create(codigo='CC', nombre='Cédula de Ciudadanía')
+
+
+class ResumenVentanaTests(DatosClientesMixin, TestCase):
+    """
+    El resumen diario agrupa por día calendario, pero la ventana empieza a
+    la hora de la referencia: ambos caminos deben dar el mismo resultado
+    """
+    # La ventana de 7 días empieza el 8 de marzo a las 14:00
+    referencia = fecha_local(2024, 3, 15, 14, 0)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Compra antes del inicio de la ventana, el mismo día: no cuenta
+        cls.antes_del_inicio = cls.crear_cliente('1001')
+        cls.crear_compra(cls.antes_del_inicio, fecha_local(2024, 3, 8, 10, 0), '3000000')
+        cls.crear_compra(cls.antes_del_inicio, fecha_local(2024, 3, 10, 9, 0), '3000000')
+        # Compra después del inicio de la ventana, el mismo día: cuenta
+        cls.despues_del_inicio = cls.crear_cliente('1002')
+        cls.crear_compra(cls.despues_del_inicio, fecha_local(2024, 3, 8, 16, 0), '4000000')
+        cls.crear_compra(cls.despues_del_inicio, fecha_local(2024, 3, 12, 11, 0), '2000000')
+        # Solo compró el día de inicio, dentro de la ventana
+        cls.solo_dia_inicio = cls.crear_cliente('1003')
+        cls.crear_compra(cls.solo_dia_inicio, fecha_local(2024, 3, 8, 23, 30), '5000000')
+        cls.crear_compra(cls.solo_dia_inicio, fecha_local(2024, 3, 8, 8, 0), '9000000')
+        # Compras completas dentro de la ventana y una cancelada
+        cls.dentro = cls.crear_cliente('1004')
+        cls.crear_compra(cls.dentro, fecha_local(2024, 3, 14, 12, 0), '7000000')
+        cls.crear_compra(cls.dentro, fecha_local(2024, 3, 13, 12, 0), '9000000', estado='cancelada')
+
+    def fidelizacion(self, usar_resumen, **parametros):
+        return list(clientes_fidelizacion(referencia=self.referencia, usar_resumen=usar_resumen, **parametros))
+
+    def test_fidelizacion_igual_con_y_sin_resumen(self):
+        for dias in (1, 6, 7, 8, 30):
+            with self.subTest(dias=dias):
+                self.assertEqual(
+                    self.fidelizacion(True, dias=dias, monto_minimo=Decimal('0')),
+                    self.fidelizacion(False, dias=dias, monto_minimo=Decimal('0'))
+                )
+
+    def test_fidelizacion_excluye_compras_anteriores_al_inicio(self):
+        filas = self.fidelizacion(True, dias=7, monto_minimo=Decimal('5000000'))
+        self.assertEqual(
+            [(fila['id'], fila['total_compras']) for fila in filas],
+            [
+                (self.dentro.id, Decimal('7000000')),
+                (self.despues_del_inicio.id, Decimal('6000000')),
+                (self.solo_dia_inicio.id, Decimal('5000000')),
+            ]
+        )
+
+    def test_migracion_puebla_el_resumen_de_compras_existentes(self):
+        migracion = import_module('clientes.migrations.0013_poblar_resumen_compras')
+        # Compra archivada el mismo día que una activa
+        fijar_corte(fecha_local(2024, 3, 14, 9, 0))
+        CompraArchivada.objects.create(
+            id=10 ** 6, cliente=self.dentro, numero_factura='F-ARCHIVADA',
+            fecha_compra=fecha_local(2024, 3, 14, 8, 0), monto=Decimal('1000000'), estado='completada'
+        )
+        esperado = self.fidelizacion(False, dias=7, monto_minimo=Decimal('0'))
+        ResumenCompraDiaria.objects.all().delete()
+
+        migracion.poblar_resumen(django_apps, None)
+
+        self.assertEqual(verificar_resumen(), [])
+        self.assertEqual(self.fidelizacion(True, dias=7, monto_minimo=Decimal('0')), esperado)
+
+    def test_segmentacion_igual_con_y_sin_resumen(self):
+        con_resumen = segmentar(dias=7, referencia=self.referencia, usar_resumen=True, usar_snapshot=False)
+        sin_resumen = segmentar(dias=7, referencia=self.referencia, usar_resumen=False, usar_snapshot=False)
+        for campo in ('cliente_id', 'recencia', 'frecuencia', 'monto', 'segmento'):
+            with self.subTest(campo=campo):
+                np.testing.assert_array_equal(con_resumen[campo], sin_resumen[campo])
+        self.assertEqual(
+            dict(zip(sin_resumen['cliente_id'].tolist(), sin_resumen['frecuencia'].tolist())),
+            {self.antes_del_inicio.id: 1, self.despues_del_inicio.id: 2, self.solo_dia_inicio.id: 1, self.dentro.id: 1}
+        )
+
+
+class BuscarClienteTests(DatosClientesMixin, TestCase):
+    """La búsqueda por documento respeta PRESUPUESTO_CONSULTAS_BUSCAR"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pasaporte = TipoDocumento.objects.create(codigo='PA', nombre='Pasaporte')
+        cls.clientes = [cls.crear_cliente(f'2{numero:03d}') for numero in range(5)]
+        for cliente in cls.clientes:
+            cls.crear_compra(cliente, fecha_local(2024, 3, 1, 10, 0), '150000')
+            cls.crear_compra(cliente, fecha_local(2024, 3, 2, 10, 0), '50000', estado='cancelada')
+
+    def setUp(self):
+        cache_local('buscar').invalidar()
+        self.addCleanup(cache_local('buscar').invalidar)
+
+    def buscar(self, cliente):
+        return self.client.get(reverse('clientes-buscar'), {
+            'tipo_documento_id': cliente.tipo_documento_id,
+            'numero_documento': cliente.numero_documento,
+        })
+
+    def buscar_lote(self, documentos):
+        return self.client.post(
+            reverse('clientes-buscar-lote'),
+            {'documentos': documentos},
+            content_type='application/json'
+        )
+
+    def test_buscar_dentro_del_presupuesto(self):
+        with self.assertNumQueries(PRESUPUESTO_CONSULTAS_BUSCAR):
+            respuesta = self.buscar(self.clientes[0])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['id'], self.clientes[0].id)
+        self.assertEqual(respuesta.data['total_compras'], 1)
+        self.assertEqual(respuesta.data['monto_total_compras'], 150000.0)
+        self.assertEqual(len(respuesta.data['compras']), 2)
+
+    def test_buscar_desde_cache_sin_consultas(self):
+        esperado = self.buscar(self.clientes[0]).data
+        with self.assertNumQueries(0):
+            respuesta = self.buscar(self.clientes[0])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data, esperado)
+
+    def test_buscar_invalida_cache_al_modificar_cliente(self):
+        self.buscar(self.clientes[0])
+        Cliente.objects.filter(pk=self.clientes[0].pk).get().save()
+        with self.assertNumQueries(PRESUPUESTO_CONSULTAS_BUSCAR):
+            self.buscar(self.clientes[0])
+
+    def test_buscar_invalida_cache_de_ambos_clientes_al_mover_compra(self):
+        origen, destino = self.clientes[:2]
+        self.buscar(origen)
+        self.buscar(destino)
+        compra = origen.compras.get(estado='completada')
+        compra.cliente = destino
+        compra.save()
+
+        for cliente, total in ((origen, 0), (destino, 2)):
+            with self.subTest(cliente=cliente.numero_documento):
+                with self.assertNumQueries(PRESUPUESTO_CONSULTAS_BUSCAR):
+                    respuesta = self.buscar(cliente)
+                self.assertEqual(respuesta.data['total_compras'], total)
+
+    def test_buscar_no_guarda_respuestas_grandes(self):
+        cache_buscar = cache_local('buscar')
+        self.buscar(self.clientes[0])
+        tamano = cache_buscar.bytes
+        cache_buscar.invalidar()
+        with mock.patch.object(cache_buscar, 'max_bytes_entrada', tamano - 1):
+            self.buscar(self.clientes[0])
+            with self.assertNumQueries(PRESUPUESTO_CONSULTAS_BUSCAR):
+                self.buscar(self.clientes[0])
+        self.assertEqual(cache_buscar.bytes, 0)
+
+    def test_cache_buscar_acotado_por_bytes(self):
+        cache_buscar = cache_local('buscar')
+        self.buscar(self.clientes[0])
+        tamano = cache_buscar.bytes
+        cache_buscar.invalidar()
+        with mock.patch.object(cache_buscar, 'max_bytes', 2 * tamano):
+            for cliente in self.clientes[:3]:
+                self.buscar(cliente)
+            self.assertLessEqual(cache_buscar.bytes, 2 * tamano)
+            # El más antiguo salió del caché; los dos últimos siguen
+            with self.assertNumQueries(0):
+                self.buscar(self.clientes[1])
+                self.buscar(self.clientes[2])
+            with self.assertNumQueries(PRESUPUESTO_CONSULTAS_BUSCAR):
+                self.buscar(self.clientes[0])
+
+    def test_buscar_no_encontrado(self):
+        respuesta = self.client.get(reverse('clientes-buscar'), {
+            'tipo_documento_id': self.pasaporte.id,
+            'numero_documento': self.clientes[0].numero_documento,
+        })
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_buscar_lote_consultas_constantes(self):
+        documentos = [
+            {'tipo_documento_id': cliente.tipo_documento_id, 'numero_documento': cliente.numero_documento}
+            for cliente in self.clientes
+        ]
+        documentos.append({'tipo_documento_id': self.pasaporte.id, 'numero_documento': self.clientes[0].numero_documento})
+        documentos.append({'tipo_documento_id': self.cedula.id, 'numero_documento': '9999'})
+
+        with self.assertNumQueries(PRESUPUESTO_CONSULTAS_BUSCAR):
+            respuesta = self.buscar_lote(documentos[:1])
+        self.assertEqual(respuesta.status_code, 200)
+        with self.assertNumQueries(PRESUPUESTO_CONSULTAS_BUSCAR):
+            respuesta = self.buscar_lote(documentos)
+        self.assertEqual(respuesta.status_code, 200)
+
+        resultados = respuesta.data['resultados']
+        self.assertEqual([resultado['encontrado'] for resultado in resultados], [True] * 5 + [False, False])
+        self.assertEqual(
+            [resultado['cliente']['id'] for resultado in resultados[:5]],
+            [cliente.id for cliente in self.clientes]
+        )
+        self.assertEqual(resultados[0]['cliente'], self.buscar(self.clientes[0]).data)
+
+    def test_buscar_lote_limite_de_documentos(self):
+        documentos = [{'tipo_documento_id': self.cedula.id, 'numero_documento': str(numero)} for numero in range(501)]
+        with self.assertNumQueries(0):
+            respuesta = self.buscar_lote(documentos)
+        self.assertEqual(respuesta.status_code, 400)
+
+
+@override_settings(CLIENTES_INSTRUMENTACION={'ACTIVA': True})
+class InstrumentacionTests(DatosClientesMixin, TestCase):
+    """El middleware mide las solicitudes síncronas y asíncronas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cliente = cls.crear_cliente('9001')
+        cls.crear_compra(cls.cliente, fecha_local(2024, 3, 1, 10, 0), '150000')
+
+    def setUp(self):
+        cache_local('buscar').invalidar()
+        self.addCleanup(cache_local('buscar').invalidar)
+        self.parametros = {
+            'tipo_documento_id': self.cliente.tipo_documento_id,
+            'numero_documento': self.cliente.numero_documento,
+        }
+
+    def assertInstrumentada(self, respuesta, registros, vista):
+        self.assertEqual(respuesta.status_code, 200)
+        metricas = dict(
+            (metrica.split(';')[0], metrica) for metrica in respuesta['Server-Timing'].split(', ')
+        )
+        self.assertIn(f'desc="{PRESUPUESTO_CONSULTAS_BUSCAR} consultas"', metricas['sql'])
+        self.assertIn('vista', metricas)
+        self.assertIn('total', metricas)
+        datos = registros.records[-1].instrumentacion
+        self.assertEqual((datos['vista'], datos['consultas']), (vista, PRESUPUESTO_CONSULTAS_BUSCAR))
+        # Cada métrica se redondea a 2 decimales por separado
+        self.assertLessEqual(datos['sql_ms'] + datos['vista_ms'], datos['total_ms'] + 0.02)
+        return datos
+
+    def test_solicitud_sincrona(self):
+        with self.assertLogs('clientes.instrumentacion', 'INFO') as registros:
+            respuesta = self.client.get(reverse('clientes-buscar'), self.parametros)
+        datos = self.assertInstrumentada(respuesta, registros, 'clientes-buscar')
+        self.assertIsNotNone(datos['render_ms'])
+        self.assertIn('render', respuesta['Server-Timing'])
+
+    async def test_solicitud_asincrona(self):
+        with self.assertLogs('clientes.instrumentacion', 'INFO') as registros:
+            respuesta = await self.async_client.get(reverse('async-clientes-buscar'), self.parametros)
+        datos = self.assertInstrumentada(respuesta, registros, 'async-clientes-buscar')
+        self.assertIsNone(datos['render_ms'])
+
+    def test_cadena_asincrona_sin_adaptar(self):
+        async def vista(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(InstrumentacionMiddleware(vista)))
+        self.assertFalse(iscoroutinefunction(InstrumentacionMiddleware(lambda request: HttpResponse())))
+
+
+class AutocompletarClientesTests(DatosClientesMixin, TestCase):
+    """Los términos se intersecan en la base antes de limitar los candidatos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # 'maria' ordena antes que 'marta': con el límite, el término común
+        # solo alcanza a leer tokens de las Marías
+        for numero in range(10):
+            cls.crear_cliente(f'7{numero:03d}', nombre='María', apellido=f'Gómez {numero}')
+        cls.marta = cls.crear_cliente('7100', nombre='Marta', apellido='Zuluaga')
+        cls.crear_cliente('7101', nombre='Pedro', apellido='Zuluaga', activo=False)
+
+    def autocompletar(self, consulta):
+        respuesta = self.client.get(reverse('clientes-autocompletar'), {'q': consulta})
+        self.assertEqual(respuesta.status_code, 200)
+        return [(resultado['id'], resultado['puntaje']) for resultado in respuesta.data['resultados']]
+
+    @mock.patch('clientes.busqueda.LIMITE_CANDIDATOS', 5)
+    def test_coincidencia_fuera_de_los_candidatos_del_termino_comun(self):
+        self.assertEqual(self.autocompletar('mar zul'), [(self.marta.id, 8)])
+        self.assertEqual(self.autocompletar('zuluaga marta'), [(self.marta.id, 16)])
+
+    @mock.patch('clientes.busqueda.LIMITE_CANDIDATOS', 5)
+    def test_termino_comun_solo_lee_el_limite(self):
+        self.assertEqual(len(self.autocompletar('mar')), 5)
+
+    def test_sin_coincidencia_de_todos_los_terminos(self):
+        self.assertEqual(self.autocompletar('maria zuluaga'), [])
+        self.assertEqual(self.autocompletar('pedro'), [])
+
+
+class IndicesConsultasTests(TestCase):
+    """Cada consulta frecuente usa uno de sus índices según EXPLAIN con estadísticas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_data', clientes=300, compras_por_cliente=20, dias=730, seed=1, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_consultas_frecuentes_usan_su_indice(self):
+        for nombre, queryset, tabla, indices in consultas_frecuentes():
+            with self.subTest(consulta=nombre):
+                plan = queryset.explain()
+                self.assertIsNone(re.search(RECORRIDO_COMPLETO.format(tabla=tabla), plan), plan)
+                self.assertTrue(any(indice in plan for indice in indices), plan)
+
+    def test_fidelizacion_acepta_otro_indice_de_su_conjunto(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX {nombre_indice(Compra, ['cliente', '-fecha_compra', '-id'])}")
+
+        plan = clientes_fidelizacion(usar_resumen=False).explain()
+        self.assertNotIn(nombre_indice(Compra, ['cliente', '-fecha_compra', '-id']), plan)
+        self.assertIsNone(re.search(RECORRIDO_COMPLETO.format(tabla=Compra._meta.db_table), plan), plan)
+        salida = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 consultas sin el índice esperado'):
+            call_command('verificar_indices', stdout=salida, stderr=StringIO())
+        # Solo falla el historial, cuyo único índice diseñado es el eliminado
+        self.assertIn('fidelizacion_compras: OK', salida.getvalue())
+
+    def test_verificar_indices_falla_sin_el_indice_esperado(self):
+        # Sin EXPLAIN previo: SQLite no vuelve a planear una sentencia EXPLAIN
+        # en caché tras cambiar el esquema
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX {nombre_indice(Compra, ['cliente', 'estado'])}")
+        with self.assertRaisesMessage(CommandError, '1 consultas sin el índice esperado'):
+            call_command('verificar_indices', stdout=StringIO(), stderr=StringIO())
+
+
+class AdminConsultasTests(DatosClientesMixin, TestCase):
+    """Los listados y el autocompletado del admin hacen un número fijo de consultas"""
+    # Sesión y usuario de cada solicitud del admin
+    CONSULTAS_SESION = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.administrador = get_user_model().objects.create_superuser('admin', 'admin@ejemplo.com', 'clave')
+        cls.agregar_clientes(3)
+
+    @classmethod
+    def agregar_clientes(cls, cantidad):
+        """Clientes García con una compra en el mes actual"""
+        inicio = Cliente.objects.count()
+        for numero in range(inicio, inicio + cantidad):
+            cliente = cls.crear_cliente(f'3{numero:03d}', apellido='García')
+            cls.crear_compra(cliente, timezone.now(), '100000')
+
+    def setUp(self):
+        self.client.force_login(self.administrador)
+        hoy = timezone.localdate()
+        self.mes_actual = {'fecha_compra__year': hoy.year, 'fecha_compra__month': hoy.month}
+
+    def test_listado_compras_redirige_al_mes_actual(self):
+        url = reverse('admin:clientes_compra_changelist')
+        with self.assertNumQueries(self.CONSULTAS_SESION):
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(
+            respuesta['Location'],
+            f"{url}?fecha_compra__year={self.mes_actual['fecha_compra__year']}"
+            f"&fecha_compra__month={self.mes_actual['fecha_compra__month']}"
+        )
+
+        # Con búsqueda o filtro de fecha no redirige
+        for parametros in ({'q': 'García'}, {'fecha_compra__year': 2024}):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self.client.get(url, parametros).status_code, 200)
+
+    def test_listado_compras_consultas_constantes(self):
+        # Conteo, página (con el cliente por list_select_related) y fechas del date_hierarchy
+        url = reverse('admin:clientes_compra_changelist')
+        for clientes_nuevos in (0, 20):
+            self.agregar_clientes(clientes_nuevos)
+            with self.subTest(compras=Compra.objects.count()):
+                with self.assertNumQueries(self.CONSULTAS_SESION + 3):
+                    respuesta = self.client.get(url, self.mes_actual)
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertEqual(respuesta.context['cl'].result_count, Compra.objects.count())
+
+    def test_listado_clientes_consultas_constantes(self):
+        # Tipos de documento del filtro, conteo acotado y página
+        url = reverse('admin:clientes_cliente_changelist')
+        for clientes_nuevos in (0, 20):
+            self.agregar_clientes(clientes_nuevos)
+            for parametros in ({}, {'q': 'garcia'}):
+                with self.subTest(clientes=Cliente.objects.count(), parametros=parametros):
+                    with CaptureQueriesContext(connection) as consultas:
+                        with self.assertNumQueries(self.CONSULTAS_SESION + 3):
+                            respuesta = self.client.get(url, parametros)
+                    self.assertEqual(respuesta.context['cl'].result_count, Cliente.objects.count())
+                    sql = [consulta['sql'] for consulta in consultas.captured_queries]
+                    self.assertTrue(any(
+                        'COUNT(*)' in consulta and f'LIMIT {LIMITE_CONTEO_EXACTO + 1}' in consulta
+                        for consulta in sql
+                    ))
+                    if parametros:
+                        self.assertTrue(any('clientes_tokenbusquedacliente' in consulta for consulta in sql))
+
+    def test_listado_clientes_usa_conteo_estimado(self):
+        url = reverse('admin:clientes_cliente_changelist')
+        with mock.patch('clientes.admin.LIMITE_CONTEO_EXACTO', 1):
+            # Sin estadísticas el total se queda en el límite más uno
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 2)
+            # Con estadísticas usa las filas estimadas, salvo si el listado está filtrado
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 3)
+            self.assertEqual(self.client.get(url, {'activo__exact': 1}).context['cl'].result_count, 2)
+
+    def test_autocompletar_cliente_consultas_constantes(self):
+        # Conteo y página de resultados, ambos por el índice de búsqueda
+        url = reverse('admin:autocomplete')
+        parametros = {'app_label': 'clientes', 'model_name': 'compra', 'field_name': 'cliente', 'term': 'garcia'}
+        for clientes_nuevos in (0, 30):
+            self.agregar_clientes(clientes_nuevos)
+            with self.subTest(clientes=Cliente.objects.count()):
+                with self.assertNumQueries(self.CONSULTAS_SESION + 2):
+                    respuesta = self.client.get(url, parametros)
+                self.assertEqual(respuesta.status_code, 200)
+                datos = respuesta.json()
+                self.assertEqual(len(datos['results']), min(Cliente.objects.count(), 20))
+                self.assertEqual(datos['pagination']['more'], Cliente.objects.count() > 20)
+
+
+class ArchivoComprasTests(DatosClientesMixin, TestCase):
+    """Archivar mueve compras de tabla sin cambiar el resumen, el feed ni lo que se lee"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cliente = cls.crear_cliente('8001')
+        ahora = timezone.now()
+        cls.antigua = cls.crear_compra(cls.cliente, ahora - timedelta(days=800), '300000')
+        cls.antigua_cancelada = cls.crear_compra(cls.cliente, ahora - timedelta(days=790), '50000', estado='cancelada')
+        cls.reciente = cls.crear_compra(cls.cliente, ahora - timedelta(days=3), '200000')
+
+    def setUp(self):
+        cache_local('buscar').invalidar()
+        self.addCleanup(cache_local('buscar').invalidar)
+
+    def archivar(self):
+        call_command('archivar_compras', dias=730, stdout=StringIO())
+
+    def buscar(self):
+        respuesta = self.client.get(reverse('clientes-buscar'), {
+            'tipo_documento_id': self.cliente.tipo_documento_id,
+            'numero_documento': self.cliente.numero_documento,
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.data
+
+    def test_archivar_mueve_compras_sin_tocar_resumen_ni_feed(self):
+        resumen = list(ResumenCompraDiaria.objects.order_by('id').values())
+        cambios = Cambio.objects.count()
+
+        self.archivar()
+
+        self.assertEqual(list(Compra.objects.values_list('id', flat=True)), [self.reciente.id])
+        self.assertEqual(
+            set(CompraArchivada.objects.values_list('id', flat=True)),
+            {self.antigua.id, self.antigua_cancelada.id}
+        )
+        self.assertEqual(list(ResumenCompraDiaria.objects.order_by('id').values()), resumen)
+        self.assertEqual(verificar_resumen(), [])
+        self.assertEqual(Cambio.objects.count(), cambios)
+
+    def test_eliminar_compra_despues_de_archivar_descuenta_resumen(self):
+        self.archivar()
+        cambios = Cambio.objects.count()
+
+        Compra.objects.get(pk=self.reciente.pk).delete()
+
+        self.assertEqual(verificar_resumen(), [])
+        self.assertEqual(Cambio.objects.count(), cambios + 1)
+        self.assertEqual(Cambio.objects.latest('id').operacion, Cambio.ELIMINADO)
+
+    def test_buscar_lista_compras_archivadas_y_cuadra_con_los_totales(self):
+        antes = self.buscar()
+        self.archivar()
+        cache_local('buscar').invalidar()
+
+        despues = self.buscar()
+        self.assertEqual(despues, antes)
+        self.assertEqual(
+            [compra['id'] for compra in despues['compras']],
+            [self.reciente.id, self.antigua_cancelada.id, self.antigua.id]
+        )
+        completadas = [compra for compra in despues['compras'] if compra['estado'] == 'completada']
+        self.assertEqual(despues['total_compras'], len(completadas))
+        self.assertEqual(despues['monto_total_compras'], sum(float(compra['monto']) for compra in completadas))
+
+    def test_historial_lee_compras_archivadas_solo_si_el_rango_las_incluye(self):
+        self.archivar()
+        url = reverse('clientes-compras', args=[self.cliente.pk])
+
+        respuesta = self.client.get(url)
+        self.assertEqual(
+            [compra['id'] for compra in respuesta.data['results']],
+            [self.reciente.id, self.antigua_cancelada.id, self.antigua.id]
+        )
+        respuesta = self.client.get(url, {'desde': (timezone.localdate() - timedelta(days=30)).isoformat()})
+        self.assertEqual([compra['id'] for compra in respuesta.data['results']], [self.reciente.id])
+
+
+class ImportarComprasTests(DatosClientesMixin, TestCase):
+    """La importación mantiene el resumen diario aplicando solo los deltas del lote"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ana = cls.crear_cliente('4001')
+        cls.luis = cls.crear_cliente('4002')
+        for dia in range(1, 11):
+            cls.crear_compra(cls.ana, fecha_local(2024, 1, dia, 10, 0), '100000')
+        cls.crear_compra(cls.luis, fecha_local(2024, 1, 5, 18, 0), '80000')
+
+    def importar(self, filas, *argumentos):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8') as archivo:
+            escritor = csv.DictWriter(archivo, ['numero_factura', 'numero_documento', 'fecha_compra', 'monto', 'estado'])
+            escritor.writeheader()
+            escritor.writerows(filas)
+            archivo.flush()
+            call_command('importar_compras', archivo.name, *argumentos, stdout=StringIO(), stderr=StringIO())
+
+    def test_importar_compras_nuevas_y_modificadas(self):
+        self.importar([
+            # Nuevas, una el mismo día que una compra existente
+            {'numero_factura': 'N-1', 'numero_documento': '4001', 'fecha_compra': '2024-01-03T15:00:00',
+             'monto': '50000', 'estado': 'completada'},
+            {'numero_factura': 'N-2', 'numero_documento': '4002', 'fecha_compra': '2024-02-01', 'monto': '70000',
+             'estado': 'pendiente'},
+            # Cambia de día, de estado, de monto y de cliente
+            {'numero_factura': 'F-000001', 'numero_documento': '4001', 'fecha_compra': '2024-01-20T10:00:00',
+             'monto': '100000', 'estado': 'completada'},
+            {'numero_factura': 'F-000002', 'numero_documento': '4001', 'fecha_compra': '2024-01-02T10:00:00',
+             'monto': '100000', 'estado': 'cancelada'},
+            {'numero_factura': 'F-000003', 'numero_documento': '4001', 'fecha_compra': '2024-01-03T10:00:00',
+             'monto': '120000', 'estado': 'completada'},
+            {'numero_factura': 'F-000011', 'numero_documento': '4001', 'fecha_compra': '2024-01-05T18:00:00',
+             'monto': '80000', 'estado': 'completada'},
+            # Sin cambios
+            {'numero_factura': 'F-000004', 'numero_documento': '4001', 'fecha_compra': '2024-01-04T10:00:00',
+             'monto': '100000', 'estado': 'completada'},
+        ], '--actualizar')
+
+        self.assertEqual(verificar_resumen(), [])
+        self.assertFalse(ResumenCompraDiaria.objects.filter(cliente=self.luis, fecha=datetime(2024, 1, 5)).exists())
+        self.assertEqual(
+            ResumenCompraDiaria.objects.get(cliente=self.ana, fecha=datetime(2024, 1, 3), estado='completada').monto_total,
+            Decimal('170000')
+        )
+
+    def test_importar_no_reconstruye_el_historial(self):
+        filas = [{'numero_factura': 'N-1', 'numero_documento': '4001', 'fecha_compra': '2024-03-01',
+                  'monto': '50000', 'estado': 'completada'}]
+        with CaptureQueriesContext(connection) as consultas:
+            self.importar(filas)
+        self.assertEqual(verificar_resumen(), [])
+        # Sin DELETE del resumen del cliente ni lectura de sus compras anteriores
+        self.assertFalse(any(
+            consulta['sql'].startswith('DELETE') and 'clientes_resumencompradiaria' in consulta['sql']
+            for consulta in consultas.captured_queries
+        ))
+
+
+class SnapshotComprasTests(DatosClientesMixin, TestCase):
+    """El snapshot suma los montos en centavos enteros, igual que la base"""
+    referencia = fecha_local(2024, 3, 15, 14, 0)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # En float64 estas compras suman 4999999.999999999
+        cls.justo_en_el_minimo = cls.crear_cliente('5001')
+        for monto in ('4999999.70', '0.10', '0.10', '0.10'):
+            cls.crear_compra(cls.justo_en_el_minimo, fecha_local(2024, 3, 10, 12, 0), monto)
+        cls.bajo_el_minimo = cls.crear_cliente('5002')
+        cls.crear_compra(cls.bajo_el_minimo, fecha_local(2024, 3, 11, 12, 0), '4999999.99')
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        configuracion = override_settings(CLIENTES_SNAPSHOT_DIR=directorio.name)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        self.snapshot = SnapshotCompras()
+        self.snapshot.actualizar()
+
+    def test_fidelizacion_snapshot_igual_a_la_base(self):
+        parametros = {'dias': 30, 'monto_minimo': Decimal('5000000'), 'referencia': self.referencia}
+        filas = fidelizacion_snapshot(self.snapshot, **parametros)
+        self.assertEqual(filas, list(clientes_fidelizacion(usar_resumen=False, **parametros)))
+        self.assertEqual(
+            [(fila['id'], fila['total_compras']) for fila in filas],
+            [(self.justo_en_el_minimo.id, Decimal('5000000.00'))]
+        )
+
+    def test_verificar_compara_centavos(self):
+        self.assertEqual(self.snapshot.verificar(), [])
+        Compra.objects.filter(numero_factura='F-000001').update(monto=Decimal('4999999.71'))
+        self.assertEqual(self.snapshot.verificar(), ['monto: snapshot 9999999.99, base 10000000.00'])
+
+    def test_refresco_no_modifica_las_columnas_abiertas(self):
+        leidas = self.snapshot.compras()
+        compra = Compra.objects.get(numero_factura='F-000005')
+        compra.monto = Decimal('1.00')
+        compra.estado = 'cancelada'
+        compra.save()
+        Compra.objects.get(numero_factura='F-000001').delete()
+
+        self.snapshot.actualizar()
+
+        # El lector conserva la versión completa anterior de cada fila
+        self.assertEqual(leidas['centavos'].tolist(), [499999970, 10, 10, 10, 499999999])
+        self.assertEqual(leidas['estado'].tolist(), [CODIGOS_ESTADO['completada']] * 5)
+        self.assertEqual(leidas['vigente'].tolist(), [True] * 5)
+        actuales = self.snapshot.compras()
+        self.assertEqual(actuales['centavos'].tolist(), [499999970, 10, 10, 10, 100])
+        self.assertEqual(actuales['estado'].tolist()[-1], CODIGOS_ESTADO['cancelada'])
+        self.assertEqual(actuales['vigente'].tolist(), [False, True, True, True, True])
+        self.assertEqual(self.snapshot.verificar(), [])
+
+    def test_eliminacion_con_la_misma_cantidad_de_compras(self):
+        # Una compra confirmada tarde, con id menor que el último del snapshot
+        # y fuera del margen de actualización, compensa la eliminada en el conteo
+        tardia = self.crear_compra(self.bajo_el_minimo, fecha_local(2024, 3, 12, 12, 0), '0.10')
+        Compra.objects.filter(pk=tardia.pk).update(fecha_actualizacion=fecha_local(2024, 1, 1))
+        meta = self.snapshot.meta()
+        meta['ultimo_id'] = tardia.pk
+        self.snapshot._escribir_meta(meta)
+        eliminada = Compra.objects.get(numero_factura='F-000002').pk
+        Compra.objects.filter(pk=eliminada).delete()
+
+        self.assertEqual(self.snapshot.actualizar()['eliminadas'], 1)
+        compras = self.snapshot.compras()
+        self.assertEqual(compras['id'][~compras['vigente']].tolist(), [eliminada])
+
+    def test_snapshot_de_otra_version_se_reconstruye(self):
+        meta = self.snapshot.meta()
+        meta['version'] = 1
+        self.snapshot._escribir_meta(meta)
+        self.assertFalse(self.snapshot.disponible())
+        self.assertEqual(self.snapshot.actualizar()['nuevas'], 5)
+        self.assertTrue(self.snapshot.disponible())
+
+
+class ReporteSegmentacionTests(DatosClientesMixin, TestCase):
+    """?segmentacion se interpreta como sí/no en las vistas síncrona y asíncrona"""
+    urls = ('reporte-fidelizacion-generar', 'async-reporte-fidelizacion-generar')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cliente = cls.crear_cliente('6001')
+        cls.crear_compra(cliente, timezone.now() - timedelta(days=1), '6000000')
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        configuracion = override_settings(CLIENTES_CACHE_REPORTES_DIR=directorio.name)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def hojas(self, url, segmentacion):
+        respuesta = self.client.get(reverse(url), {'segmentacion': segmentacion})
+        self.assertEqual(respuesta.status_code, 200)
+        return load_workbook(BytesIO(contenido(respuesta)), read_only=True).sheetnames
+
+    def test_segmentacion_falsa_no_agrega_la_hoja(self):
+        for url in self.urls:
+            for valor in ('0', 'false', 'no', ''):
+                with self.subTest(url=url, segmentacion=valor):
+                    self.assertEqual(self.hojas(url, valor), [HOJA_REPORTE])
+
+    def test_segmentacion_verdadera_agrega_la_hoja(self):
+        for url in self.urls:
+            for valor in ('1', 'true', 'sí'):
+                with self.subTest(url=url, segmentacion=valor):
+                    self.assertEqual(self.hojas(url, valor), [HOJA_REPORTE, HOJA_SEGMENTACION])
+
+    def test_segmentacion_invalida_responde_400(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                respuesta = self.client.get(reverse(url), {'segmentacion': 'tal vez'})
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.json(), {'error': 'El parámetro segmentacion debe ser true o false'})
+
+
+class ListadoClientesCamposTests(DatosClientesMixin, TestCase):
+    """?fields= limita los campos y las columnas leídas; ?expand=compras agrega las compras"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.clientes = [cls.crear_cliente(f'4{numero:03d}') for numero in range(3)]
+        for dia in (1, 3, 2):
+            cls.crear_compra(cls.clientes[0], fecha_local(2024, 5, dia, 10, 0), '1000')
+
+    def listar(self, **parametros):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('clientes-list'), parametros)
+        return respuesta, consultas
+
+    def test_campos_limitan_respuesta_y_columnas(self):
+        respuesta, consultas = self.listar(fields='id,nombre_completo')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            respuesta.data['results'][0],
+            {'id': self.clientes[0].id, 'nombre_completo': self.clientes[0].nombre_completo}
+        )
+        self.assertEqual(len(consultas), 1)
+        sql = consultas[0]['sql']
+        self.assertNotIn('correo', sql)
+        self.assertNotIn('clientes_tipodocumento', sql)
+
+    def test_sin_campos_incluye_todos_sin_compras(self):
+        respuesta, consultas = self.listar()
+        fila = respuesta.data['results'][0]
+        self.assertEqual(list(fila), ClienteListaSerializer.Meta.fields)
+        self.assertEqual(fila['tipo_documento']['codigo'], 'CC')
+        self.assertEqual(len(consultas), 1)
+
+    def test_expandir_compras_con_una_consulta_mas(self):
+        respuesta, consultas = self.listar(fields='id', expand='compras')
+        self.assertEqual(len(consultas), 2)
+        filas = {fila['id']: fila for fila in respuesta.data['results']}
+        self.assertEqual(list(filas[self.clientes[0].id]), ['id', 'compras'])
+        self.assertEqual(
+            [compra['fecha_compra'][:10] for compra in filas[self.clientes[0].id]['compras']],
+            ['2024-05-03', '2024-05-02', '2024-05-01']
+        )
+        self.assertEqual(filas[self.clientes[1].id]['compras'], [])
+
+    def test_campos_y_relaciones_no_validos(self):
+        respuesta, _ = self.listar(fields='id,clave')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data, {'fields': 'Campos no válidos: clave'})
+        respuesta, _ = self.listar(expand='tipo_documento')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data, {'expand': 'Relaciones no válidas: tipo_documento'})
+
+
+class ExportacionMasivaTests(DatosClientesMixin, TestCase):
+    """exportar-todo combina clientes y compras en streaming, con filtros y en cualquier tamaño de lote"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pasaporte = TipoDocumento.objects.create(codigo='PA', nombre='Pasaporte')
+        cls.con_compras = cls.crear_cliente('5001')
+        cls.sin_compras = cls.crear_cliente('5002', tipo_documento=cls.pasaporte)
+        cls.inactivo = cls.crear_cliente('5003', activo=False)
+        for cliente, dia in ((cls.con_compras, 10), (cls.sin_compras, 20), (cls.inactivo, 28)):
+            Cliente.objects.filter(pk=cliente.pk).update(fecha_registro=fecha_local(2024, 2, dia, 9, 0))
+        ahora = timezone.now()
+        cls.compras = [
+            cls.crear_compra(cls.con_compras, ahora - timedelta(days=800), '300000'),
+            cls.crear_compra(cls.con_compras, ahora - timedelta(days=5), '150000', estado='pendiente'),
+            cls.crear_compra(cls.inactivo, ahora - timedelta(days=2), '80000'),
+        ]
+
+    def exportar(self, **parametros):
+        respuesta = self.client.get(reverse('clientes-exportar-todo'), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return respuesta, contenido(respuesta).decode('utf-8')
+
+    def ids_csv(self, texto):
+        filas = list(csv.DictReader(StringIO(texto)))
+        return [(int(fila['cliente_id']), int(fila['compra_id']) if fila['compra_id'] else None) for fila in filas]
+
+    def test_csv_una_fila_por_compra(self):
+        respuesta, texto = self.exportar(formato='csv')
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertRegex(respuesta['Content-Disposition'], r'^attachment; filename="clientes_\d{8}_\d{6}\.csv"$')
+        filas = list(csv.reader(StringIO(texto)))
+        self.assertEqual(filas[0], ENCABEZADOS_CSV)
+        self.assertEqual(self.ids_csv(texto), [
+            (self.con_compras.id, self.compras[0].id),
+            (self.con_compras.id, self.compras[1].id),
+            (self.sin_compras.id, None),
+            (self.inactivo.id, self.compras[2].id),
+        ])
+        fila = dict(zip(ENCABEZADOS_CSV, filas[3]))
+        self.assertEqual(fila['tipo_documento'], 'PA')
+        self.assertEqual(fila['activo'], 'True')
+        self.assertEqual([fila[campo] for campo in ENCABEZADOS_CSV[9:]], [''] * 6)
+
+    def test_ndjson_un_documento_por_cliente(self):
+        respuesta, texto = self.exportar(formato='ndjson')
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        documentos = [json.loads(linea) for linea in texto.splitlines()]
+        self.assertEqual(
+            [(documento['id'], [compra['id'] for compra in documento['compras']]) for documento in documentos],
+            [
+                (self.con_compras.id, [self.compras[0].id, self.compras[1].id]),
+                (self.sin_compras.id, []),
+                (self.inactivo.id, [self.compras[2].id]),
+            ]
+        )
+        self.assertEqual(documentos[1]['tipo_documento'], 'PA')
+        self.assertEqual(documentos[0]['compras'][1]['estado'], 'pendiente')
+        self.assertEqual(documentos[0]['compras'][1]['monto'], '150000.00')
+
+    def test_filtros(self):
+        casos = [
+            ({'activo': 'false'}, [self.inactivo.id]),
+            ({'tipo_documento_id': self.pasaporte.id}, [self.sin_compras.id]),
+            ({'registro_desde': '2024-02-11', 'registro_hasta': '2024-02-20'}, [self.sin_compras.id]),
+        ]
+        for filtros, esperados in casos:
+            with self.subTest(filtros=filtros):
+                _, texto = self.exportar(formato='ndjson', **filtros)
+                self.assertEqual([json.loads(linea)['id'] for linea in texto.splitlines()], esperados)
+
+    def test_parametros_no_validos(self):
+        casos = [
+            ({'formato': 'xml'}, 'Formato no válido. Use: csv, ndjson'),
+            ({'activo': 'quizas'}, 'El parámetro activo debe ser true o false'),
+            ({'tipo_documento_id': 'CC'}, 'El parámetro tipo_documento_id debe ser un número entero'),
+            ({'registro_desde': '10/02/2024'}, 'El parámetro registro_desde debe tener formato AAAA-MM-DD'),
+        ]
+        for parametros, error in casos:
+            with self.subTest(parametros=parametros):
+                respuesta = self.client.get(reverse('clientes-exportar-todo'), parametros)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.data, {'error': error})
+
+    def test_lotes_pequenos_y_compras_archivadas(self):
+        esperado = ''.join(exportar_clientes(filtrar_clientes(), 'csv'))
+        call_command('archivar_compras', dias=730, stdout=StringIO())
+        self.assertTrue(CompraArchivada.objects.filter(pk=self.compras[0].pk).exists())
+
+        for formato in FORMATOS_EXPORTACION:
+            with self.subTest(formato=formato):
+                completo = ''.join(exportar_clientes(filtrar_clientes(), formato))
+                self.assertEqual(''.join(exportar_clientes(filtrar_clientes(), formato, tamano_lote=1)), completo)
+        self.assertEqual(''.join(exportar_clientes(filtrar_clientes(), 'csv', tamano_lote=1)), esperado)
+
+
+class ExportacionClienteTests(DatosClientesMixin, TestCase):
+    """La exportación de un cliente filtra sus compras por un rango de fechas inclusivo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cliente = cls.crear_cliente('5101')
+        cls.compras = [
+            cls.crear_compra(cls.cliente, fecha_local(2024, 2, 29, 23, 59), '1000'),
+            cls.crear_compra(cls.cliente, fecha_local(2024, 3, 1, 0, 0), '2000'),
+            cls.crear_compra(cls.cliente, fecha_local(2024, 3, 15, 12, 0), '3000'),
+            cls.crear_compra(cls.cliente, fecha_local(2024, 3, 31, 23, 59), '4000'),
+            cls.crear_compra(cls.cliente, fecha_local(2024, 4, 1, 0, 0), '5000'),
+        ]
+
+    def exportar(self, **parametros):
+        respuesta = self.client.get(reverse('clientes-exportar', args=[self.cliente.pk]), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return contenido(respuesta).decode('utf-8')
+
+    def facturas_csv(self, texto):
+        filas = list(csv.reader(StringIO(texto)))
+        inicio = filas.index(['Número Factura', 'Fecha', 'Monto', 'Estado']) + 1
+        return [fila[0] for fila in filas[inicio:]]
+
+    def facturas_txt(self, texto):
+        return re.findall(r'^Factura: (.+)$', texto, re.MULTILINE)
+
+    def numeros(self, *posiciones):
+        return [self.compras[posicion].numero_factura for posicion in posiciones]
+
+    def test_rango_inclusivo_en_csv_y_txt(self):
+        rango = {'desde': '2024-03-01', 'hasta': '2024-03-31'}
+        self.assertEqual(self.facturas_csv(self.exportar(formato='csv', **rango)), self.numeros(3, 2, 1))
+        self.assertEqual(self.facturas_txt(self.exportar(formato='txt', **rango)), self.numeros(3, 2, 1))
+
+    def test_rango_abierto_en_un_extremo(self):
+        self.assertEqual(self.facturas_csv(self.exportar(desde='2024-03-31')), self.numeros(4, 3))
+        self.assertEqual(self.facturas_txt(self.exportar(formato='txt', hasta='2024-02-29')), self.numeros(0))
+
+    def test_sin_rango_exporta_todas(self):
+        self.assertEqual(self.facturas_csv(self.exportar()), self.numeros(4, 3, 2, 1, 0))
+
+    def test_fecha_no_valida(self):
+        for parametros in ({'desde': '2024-02-30'}, {'hasta': '31/03/2024'}):
+            with self.subTest(parametros=parametros):
+                respuesta = self.client.get(reverse('clientes-exportar', args=[self.cliente.pk]), parametros)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertIn('debe tener formato AAAA-MM-DD', respuesta.data['error'])
+
+
+class VistasAsincronasTests(DatosClientesMixin, TestCase):
+    """Las vistas async responden lo mismo que sus equivalentes síncronas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cliente = cls.crear_cliente('5201')
+        cls.inactivo = cls.crear_cliente('5202', activo=False)
+        for dia in range(1, 8):
+            cls.crear_compra(cls.cliente, fecha_local(2024, 6, dia, 10, 0), '1000000')
+        cls.crear_compra(cls.cliente, timezone.now() - timedelta(days=1), '6000000')
+
+    def setUp(self):
+        cache_local('buscar').invalidar()
+        self.addCleanup(cache_local('buscar').invalidar)
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        configuracion = override_settings(CLIENTES_CACHE_REPORTES_DIR=directorio.name)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def documento(self, cliente):
+        return {'tipo_documento_id': cliente.tipo_documento_id, 'numero_documento': cliente.numero_documento}
+
+    async def recorrer(self, url, parametros):
+        """Ids de todas las páginas siguiendo `next`"""
+        ids = []
+        respuesta = await self.async_client.get(url, parametros)
+        while True:
+            self.assertEqual(respuesta.status_code, 200)
+            datos = respuesta.json()
+            ids.extend(compra['id'] for compra in datos['results'])
+            if not datos['next']:
+                return ids
+            respuesta = await self.async_client.get(datos['next'])
+
+    async def test_buscar_igual_a_la_vista_sincrona_y_desde_cache(self):
+        esperado = (await sync_to_async(self.client.get)(reverse('clientes-buscar'), self.documento(self.cliente))).json()
+        cache_local('buscar').invalidar()
+
+        respuesta = await self.async_client.get(reverse('async-clientes-buscar'), self.documento(self.cliente))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json(), esperado)
+        # update() no emite señales: el caché sigue con la respuesta anterior
+        await Cliente.objects.filter(pk=self.cliente.pk).aupdate(nombre='Otro')
+        respuesta = await self.async_client.get(reverse('async-clientes-buscar'), self.documento(self.cliente))
+        self.assertEqual(respuesta.json(), esperado)
+
+    async def test_buscar_errores(self):
+        url = reverse('async-clientes-buscar')
+        respuesta = await self.async_client.get(url, {'numero_documento': self.cliente.numero_documento})
+        self.assertEqual(respuesta.status_code, 400)
+        for parametros in (self.documento(self.inactivo), {'tipo_documento_id': 'x', 'numero_documento': '5201'}):
+            with self.subTest(parametros=parametros):
+                respuesta = await self.async_client.get(url, parametros)
+                self.assertEqual(respuesta.status_code, 404)
+        respuesta = await self.async_client.post(url, self.documento(self.cliente))
+        self.assertEqual(respuesta.status_code, 405)
+
+    async def test_compras_paginadas_por_cursor(self):
+        url = reverse('async-clientes-compras', args=[self.cliente.pk])
+        esperado = [
+            compra.id async for compra in Compra.objects.filter(cliente=self.cliente).order_by('-fecha_compra', '-id')
+        ]
+        self.assertEqual(await self.recorrer(url, {'page_size': 3}), esperado)
+        self.assertEqual(
+            await self.recorrer(url, {'page_size': 3, 'desde': '2024-06-02', 'hasta': '2024-06-04'}),
+            esperado[-4:-1]
+        )
+
+    async def test_compras_errores(self):
+        respuesta = await self.async_client.get(reverse('async-clientes-compras', args=[0]))
+        self.assertEqual(respuesta.status_code, 404)
+        respuesta = await self.async_client.get(
+            reverse('async-clientes-compras', args=[self.cliente.pk]), {'desde': '01/06/2024'}
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json(), {'error': 'El parámetro desde debe tener formato AAAA-MM-DD'})
+
+    async def test_reporte_se_genera_y_luego_sale_del_cache(self):
+        url = reverse('async-reporte-fidelizacion-generar')
+        cuerpos = []
+        for resultado in ('MISS', 'HIT'):
+            respuesta = await self.async_client.get(url, {'dias': 30, 'monto_minimo': 5000000})
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(respuesta['X-Cache'], resultado)
+            self.assertEqual(respuesta['Content-Type'], CONTENT_TYPE_XLSX)
+            cuerpo = await sync_to_async(contenido)(respuesta)
+            self.assertEqual(int(respuesta['Content-Length']), len(cuerpo))
+            cuerpos.append(cuerpo)
+        self.assertEqual(cuerpos[0], cuerpos[1])
+        filas = list(load_workbook(BytesIO(cuerpos[0]), read_only=True)[HOJA_REPORTE].values)
+        self.assertIn(self.cliente.numero_documento, filas[1])
+
+    async def test_reporte_sin_clientes_responde_404(self):
+        respuesta = await self.async_client.get(
+            reverse('async-reporte-fidelizacion-generar'), {'dias': 30, 'monto_minimo': 100000000}
+        )
+        self.assertEqual(respuesta.status_code, 404)
+        self.assertEqual(respuesta.json(), {'mensaje': 'No hay clientes que cumplan los criterios de fidelización'})
+
+
+class FeedCambiosTests(DatosClientesMixin, TestCase):
+    """El cursor del feed avanza por secuencia y cada lote trae el último cambio de cada objeto"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.inicio = Cambio.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+
+    def leer(self, **parametros):
+        respuesta = self.client.get(reverse('cambios-list'), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.data
+
+    def recorrer(self, **parametros):
+        """Lotes desde self.inicio hasta que hay_mas sea false"""
+        lotes, cursor = [], self.inicio
+        while True:
+            datos = self.leer(desde=cursor, **parametros)
+            self.assertGreater(datos['cursor'], cursor)
+            lotes.append(datos)
+            cursor = datos['cursor']
+            if not datos['hay_mas']:
+                return lotes
+
+    def test_recorre_todos_los_cambios_en_orden(self):
+        clientes = [self.crear_cliente(f'5300{numero}') for numero in range(5)]
+        secuencias = list(Cambio.objects.filter(id__gt=self.inicio).values_list('id', flat=True))
+
+        lotes = self.recorrer(limite=2)
+        self.assertEqual([len(lote['cambios']) for lote in lotes], [2, 2, 1])
+        cambios = [cambio for lote in lotes for cambio in lote['cambios']]
+        self.assertEqual([cambio['seq'] for cambio in cambios], secuencias)
+        self.assertEqual([cambio['objeto_id'] for cambio in cambios], [cliente.id for cliente in clientes])
+        self.assertEqual(cambios[0]['datos']['numero_documento'], '53000')
+
+        # Sin cambios nuevos el cursor se mantiene
+        final = self.leer(desde=lotes[-1]['cursor'])
+        self.assertEqual((final['cursor'], final['hay_mas'], final['cambios']), (lotes[-1]['cursor'], False, []))
+
+    def test_varios_cambios_del_objeto_se_reducen_al_ultimo(self):
+        cliente = self.crear_cliente('53100')
+        cliente.nombre = 'Renombrado'
+        cliente.save()
+        cliente.save()
+        ultimo = Cambio.objects.latest('id')
+
+        datos = self.leer(desde=self.inicio)
+        self.assertEqual(datos['cursor'], ultimo.id)
+        self.assertEqual(len(datos['cambios']), 1)
+        cambio = datos['cambios'][0]
+        self.assertEqual((cambio['seq'], cambio['operacion']), (ultimo.id, Cambio.ACTUALIZADO))
+        self.assertEqual(cambio['datos']['nombre'], 'Renombrado')
+
+    def test_objeto_eliminado_llega_como_marca(self):
+        cliente = self.crear_cliente('53200')
+        compra = self.crear_compra(cliente, fecha_local(2024, 4, 1, 10, 0), '1000')
+        compra_id = compra.id
+        compra.delete()
+
+        # En un solo lote el alta y la eliminación se reducen a la marca
+        cambios = self.leer(desde=self.inicio, modelo='compra')['cambios']
+        self.assertEqual(
+            [(cambio['objeto_id'], cambio['operacion'], cambio['datos']) for cambio in cambios],
+            [(compra_id, Cambio.ELIMINADO, None)]
+        )
+
+        # Lote a lote, el alta de un objeto que ya no existe se omite pero el cursor avanza
+        lotes = self.recorrer(limite=1, modelo='compra')
+        self.assertEqual([len(lote['cambios']) for lote in lotes], [0, 1])
+        self.assertEqual(lotes[1]['cambios'][0]['operacion'], Cambio.ELIMINADO)
+
+    def test_filtro_por_modelo(self):
+        cliente = self.crear_cliente('53300')
+        compra = self.crear_compra(cliente, fecha_local(2024, 4, 1, 10, 0), '1000')
+        self.crear_cliente('53301')
+
+        datos = self.leer(desde=self.inicio, modelo='compra')
+        self.assertEqual(datos['cursor'], Cambio.objects.filter(modelo='compra').latest('id').id)
+        self.assertEqual([cambio['objeto_id'] for cambio in datos['cambios']], [compra.id])
+        self.assertEqual(datos['cambios'][0]['datos']['cliente'], cliente.id)
+        datos = self.leer(desde=self.inicio, modelo='cliente')
+        self.assertEqual({cambio['modelo'] for cambio in datos['cambios']}, {'cliente'})
+        self.assertEqual(len(datos['cambios']), 2)
+
+    def test_compra_archivada_sigue_en_el_feed(self):
+        cliente = self.crear_cliente('53400')
+        compra = self.crear_compra(cliente, timezone.now() - timedelta(days=800), '1000')
+        call_command('archivar_compras', dias=730, stdout=StringIO())
+        self.assertFalse(Compra.objects.filter(pk=compra.pk).exists())
+
+        cambios = self.leer(desde=self.inicio, modelo='compra')['cambios']
+        self.assertEqual(
+            [(cambio['objeto_id'], cambio['operacion']) for cambio in cambios],
+            [(compra.id, Cambio.CREADO)]
+        )
+        self.assertEqual(cambios[0]['datos']['numero_factura'], compra.numero_factura)
+
+    def test_limite_acotado_y_parametros_no_validos(self):
+        self.crear_cliente('53500')
+        self.crear_cliente('53501')
+        datos = self.leer(desde=self.inicio, limite=0)
+        self.assertEqual((len(datos['cambios']), datos['hay_mas']), (1, True))
+
+        casos = [
+            ({'desde': 'x'}, 'El parámetro desde debe ser un número entero'),
+            ({'desde': -1}, 'El parámetro desde no puede ser negativo'),
+            ({'limite': 'x'}, 'El parámetro limite debe ser un número entero'),
+            ({'modelo': 'pedido'}, 'Modelo no válido. Opciones: cliente, compra'),
+        ]
+        for parametros, error in casos:
+            with self.subTest(parametros=parametros):
+                respuesta = self.client.get(reverse('cambios-list'), parametros)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.data, {'error': error})
+
+
+class PaginacionKeysetTests(DatosClientesMixin, TestCase):
+    """Las páginas del cursor buscan su posición en el índice de ordenamiento"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Apellidos y nombres repetidos para que el desempate llegue al id
+        for numero in range(30):
+            cls.crear_cliente(f'6{numero:03d}', apellido=f'Apellido {numero % 4}', nombre=f'Nombre {numero % 3}')
+        cls.cliente = Cliente.objects.order_by('id').first()
+        for dia in range(1, 21):
+            cls.crear_compra(cls.cliente, fecha_local(2024, 1, dia, 10, 0), '1000')
+
+    def recorrer(self, url, parametros):
+        """Ids de todas las páginas siguiendo `next` y luego `previous` desde la última"""
+        adelante, paginas = [], []
+        respuesta = self.client.get(url, parametros)
+        while True:
+            paginas.append(respuesta.data)
+            adelante.extend(fila['id'] for fila in respuesta.data['results'])
+            if not respuesta.data['next']:
+                break
+            respuesta = self.client.get(respuesta.data['next'])
+        atras = [fila['id'] for fila in paginas[-1]['results']]
+        while respuesta.data['previous']:
+            respuesta = self.client.get(respuesta.data['previous'])
+            atras[:0] = [fila['id'] for fila in respuesta.data['results']]
+        return adelante, atras
+
+    def cursor_en(self, paginador, registro, hacia_atras=False):
+        valores = [paginador._valor(registro, campo.lstrip('-')) for campo in paginador.ordering]
+        return Request(APIRequestFactory().get('/', {'cursor': paginador.encode_cursor(valores, hacia_atras)}))
+
+    def test_recorre_clientes_en_ambas_direcciones(self):
+        esperado = list(Cliente.objects.order_by('apellido', 'nombre', 'id').values_list('id', flat=True))
+        adelante, atras = self.recorrer(reverse('clientes-list'), {'page_size': 7})
+        self.assertEqual(adelante, esperado)
+        self.assertEqual(atras, esperado)
+
+    def test_recorre_compras_en_ambas_direcciones(self):
+        esperado = list(self.cliente.compras.order_by('-fecha_compra', '-id').values_list('id', flat=True))
+        adelante, atras = self.recorrer(reverse('clientes-compras', kwargs={'pk': self.cliente.pk}), {'page_size': 6})
+        self.assertEqual(adelante, esperado)
+        self.assertEqual(atras, esperado)
+
+    def test_cursor_profundo_busca_en_el_indice(self):
+        paginador = ClienteKeysetPagination()
+        profundo = Cliente.objects.order_by('apellido', 'nombre', 'id')[25]
+        indice = nombre_indice(Cliente, ['apellido', 'nombre', 'id'])
+        for hacia_atras, operador in ((False, '>'), (True, '<')):
+            with self.subTest(hacia_atras=hacia_atras):
+                pagina = paginador._preparar_pagina(Cliente.objects.all(), self.cursor_en(paginador, profundo, hacia_atras))
+                self.assertIn(f'SEARCH clientes_cliente USING INDEX {indice} (apellido{operador}?)', pagina.explain())
+
+        paginador = CompraKeysetPagination()
+        compras = Compra.objects.filter(cliente=self.cliente)
+        pagina = paginador._preparar_pagina(compras, self.cursor_en(paginador, compras.order_by('fecha_compra').first()))
+        self.assertIn(
+            f"USING INDEX {nombre_indice(Compra, ['cliente', '-fecha_compra', '-id'])} (cliente_id=? AND fecha_compra<?)",
+            pagina.explain()
+        )
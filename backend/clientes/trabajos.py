@@ -0,0 +1,118 @@
+"""
+Cola de trabajos de reporte respaldada por la tabla TrabajoReporte.
+
+Los trabajos se encolan desde la API y los ejecuta el comando
+procesar_trabajos_reporte, que reclama cada trabajo con un UPDATE
+condicional para que varios procesos puedan compartir la cola sin un
+broker externo.
+"""
+import logging
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import TrabajoReporte
+from .reportes import generar_reporte_xlsx
+
+logger = logging.getLogger(__name__)
+
+
+def directorio_trabajos():
+    """Directorio donde se guardan los archivos generados por los trabajos"""
+    directorio = Path(getattr(settings, 'CLIENTES_TRABAJOS_DIR', settings.BASE_DIR / 'reportes_generados'))
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def tomar_siguiente_trabajo():
+    """Reclama el trabajo pendiente más antiguo; retorna None si no hay"""
+    pendientes = TrabajoReporte.objects.filter(
+        estado=TrabajoReporte.ESTADO_PENDIENTE
+    ).order_by('fecha_creacion', 'id').values_list('id', flat=True)
+
+    for trabajo_id in pendientes[:10]:
+        reclamado = TrabajoReporte.objects.filter(
+            pk=trabajo_id,
+            estado=TrabajoReporte.ESTADO_PENDIENTE
+        ).update(estado=TrabajoReporte.ESTADO_EN_PROCESO, fecha_inicio=timezone.now())
+        if reclamado:
+            return TrabajoReporte.objects.get(pk=trabajo_id)
+    return None
+
+
+def ejecutar_trabajo(trabajo):
+    """Genera el archivo del trabajo actualizando su progreso en la tabla"""
+    trabajos = TrabajoReporte.objects.filter(pk=trabajo.pk)
+    ruta = directorio_trabajos() / f'reporte_fidelizacion_{trabajo.pk}.xlsx'
+
+    def progreso(filas_escritas, total_filas):
+        cambios = {'filas_procesadas': filas_escritas}
+        if total_filas is not None:
+            cambios.update(
+                total_filas=total_filas,
+                progreso=min(99, filas_escritas * 100 // max(total_filas, 1))
+            )
+        trabajos.update(**cambios)
+
+    try:
+        # Las filas se calculan una sola vez; el progreso cuenta las filas
+        # escritas en todas las hojas del libro
+        generar_reporte_xlsx(
+            ruta,
+            dias=trabajo.dias,
+            monto_minimo=trabajo.monto_minimo,
+            progreso=progreso,
+            incluir_segmentacion=trabajo.segmentacion
+        )
+    except Exception as exc:
+        logger.exception('Falló el trabajo de reporte %s', trabajo.pk)
+        ruta.unlink(missing_ok=True)
+        trabajos.update(
+            estado=TrabajoReporte.ESTADO_FALLIDO,
+            error=str(exc),
+            fecha_fin=timezone.now()
+        )
+    else:
+        trabajos.update(
+            estado=TrabajoReporte.ESTADO_COMPLETADO,
+            archivo=str(ruta),
+            progreso=100,
+            fecha_fin=timezone.now()
+        )
+
+    trabajo.refresh_from_db()
+    return trabajo
+
+
+def limpiar_trabajos(retencion_horas=None, tiempo_maximo_minutos=None):
+    """
+    Elimina los trabajos terminados hace más de `retencion_horas` junto con
+    sus archivos, y marca como fallidos los trabajos en proceso que superan
+    `tiempo_maximo_minutos` (por ejemplo, si el proceso worker murió).
+    Retorna el número de trabajos eliminados.
+    """
+    if retencion_horas is None:
+        retencion_horas = getattr(settings, 'CLIENTES_TRABAJOS_RETENCION_HORAS', 24)
+    if tiempo_maximo_minutos is None:
+        tiempo_maximo_minutos = getattr(settings, 'CLIENTES_TRABAJOS_TIEMPO_MAXIMO_MINUTOS', 60)
+    ahora = timezone.now()
+
+    TrabajoReporte.objects.filter(
+        estado=TrabajoReporte.ESTADO_EN_PROCESO,
+        fecha_inicio__lt=ahora - timedelta(minutes=tiempo_maximo_minutos)
+    ).update(
+        estado=TrabajoReporte.ESTADO_FALLIDO,
+        error='El trabajo superó el tiempo máximo de ejecución',
+        fecha_fin=ahora
+    )
+
+    vencidos = TrabajoReporte.objects.filter(
+        estado__in=[TrabajoReporte.ESTADO_COMPLETADO, TrabajoReporte.ESTADO_FALLIDO],
+        fecha_fin__lt=ahora - timedelta(hours=retencion_horas)
+    )
+    for archivo in vencidos.exclude(archivo='').values_list('archivo', flat=True):
+        Path(archivo).unlink(missing_ok=True)
+    eliminados, _ = vencidos.delete()
+    return eliminados
@@ -1,17 +1,30 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import views_async
 from .views import (
     TipoDocumentoViewSet,
     ClienteViewSet,
-    ReporteFidelizacionViewSet
+    ReporteFidelizacionViewSet,
+    TrabajoReporteViewSet,
+    CambioViewSet
 )
 
 router = DefaultRouter()
 router.register(r'tipos-documento', TipoDocumentoViewSet, basename='tipos-documento')
 router.register(r'clientes', ClienteViewSet, basename='clientes')
+router.register(r'reporte-fidelizacion/trabajos', TrabajoReporteViewSet, basename='trabajos-reporte')
 router.register(r'reporte-fidelizacion', ReporteFidelizacionViewSet, basename='reporte-fidelizacion')
+router.register(r'cambios', CambioViewSet, basename='cambios')
 
 urlpatterns = [
+    # Versiones async para servidores ASGI
+    path('async/clientes/buscar/', views_async.buscar, name='async-clientes-buscar'),
+    path('async/clientes/<int:pk>/compras/', views_async.compras, name='async-clientes-compras'),
+    path(
+        'async/reporte-fidelizacion/generar/',
+        views_async.generar_reporte,
+        name='async-reporte-fidelizacion-generar'
+    ),
     path('', include(router.urls)),
 ]
 
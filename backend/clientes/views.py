@@ -1,42 +1,122 @@
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, JsonResponse
-from django.db.models import Sum, Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from datetime import timedelta
+from pathlib import Path
 import csv
-import io
-import pandas as pd
+import os
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 
-from .models import TipoDocumento, Cliente, Compra
+from .busqueda import LIMITE_RESULTADOS_DEFAULT, LIMITE_RESULTADOS_MAXIMO, buscar_clientes
+from .cache import CacheReportes, cache_local, marca_snapshot, version_datos
+from .cambios import leer_cambios, parametros_cambios
+from .exportacion import (
+    FORMATOS_EXPORTACION,
+    Eco,
+    compras_de_cliente,
+    exportar as exportar_clientes,
+    filtrar_clientes,
+    filtrar_compras_cliente,
+    parametros_exportacion,
+    parametros_rango_fechas
+)
+from .models import TipoDocumento, Cliente, Compra, TrabajoReporte
+from .pagination import ClienteKeysetPagination, CompraKeysetPagination
 from .serializers import (
     TipoDocumentoSerializer,
     ClienteSerializer,
+    ClienteListaSerializer,
     ClienteBusquedaSerializer,
-    CompraSerializer
+    ClienteAutocompletarSerializer,
+    BusquedaLoteSerializer,
+    CambioSerializer,
+    CompraSerializer,
+    TrabajoReporteSerializer,
+    parametro_lista
+)
+from .reportes import (
+    CONTENT_TYPE_XLSX,
+    generar_reporte_xlsx,
+    parametro_segmentacion,
+    parametros_reporte
 )
+from .segmentacion import filas_segmentacion, parametros_segmentacion, resumen_segmentos, segmentar
 
 
 class TipoDocumentoViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet para consultar tipos de documento"""
     queryset = TipoDocumento.objects.filter(activo=True)
     serializer_class = TipoDocumentoSerializer
+    
+    def list(self, request, *args, **kwargs):
+        """El catálogo casi nunca cambia, así que la respuesta se sirve del caché local"""
+        datos = cache_local('catalogo').obtener_o_calcular(
+            ('lista', request.build_absolute_uri()),
+            lambda: super(TipoDocumentoViewSet, self).list(request, *args, **kwargs).data
+        )
+        return Response(datos)
+
+
+# Número máximo de consultas SQL de GET /api/clientes/buscar/
+PRESUPUESTO_CONSULTAS_BUSCAR = 2
 
 
 class ClienteViewSet(viewsets.ModelViewSet):
     """ViewSet para gestión de clientes"""
     queryset = Cliente.objects.select_related('tipo_documento').prefetch_related('compras')
     serializer_class = ClienteSerializer
+    pagination_class = ClienteKeysetPagination
     
     def get_serializer_class(self):
         if self.action == 'buscar':
             return ClienteBusquedaSerializer
+        if self.action == 'list':
+            return ClienteListaSerializer
         return ClienteSerializer
     
+    def get_queryset(self):
+        if self.action == 'list':
+            return self._consulta_lista(self.request.query_params)
+        if self.action == 'exportar':
+            # Las compras se leen por lotes al exportar, sin prefetch
+            return Cliente.objects.select_related('tipo_documento')
+        return super().get_queryset()
+    
+    def _consulta_lista(self, query_params):
+        """
+        Ajusta la consulta del listado a ?fields= y ?expand=: solo carga las
+        columnas pedidas y solo hace prefetch de compras si se expanden
+        """
+        campos = parametro_lista(query_params, 'fields')
+        expandidos = parametro_lista(query_params, 'expand')
+        
+        no_validos = set(campos) - set(ClienteListaSerializer.COLUMNAS)
+        if no_validos:
+            raise ValidationError({'fields': f"Campos no válidos: {', '.join(sorted(no_validos))}"})
+        no_validos = set(expandidos) - set(ClienteListaSerializer.EXPANDIBLES)
+        if no_validos:
+            raise ValidationError({'expand': f"Relaciones no válidas: {', '.join(sorted(no_validos))}"})
+        
+        queryset = Cliente.objects.all()
+        if not campos or 'tipo_documento' in campos:
+            queryset = queryset.select_related('tipo_documento')
+        if 'compras' in expandidos:
+            queryset = queryset.prefetch_related(
+                Prefetch('compras', queryset=Compra.objects.order_by('-fecha_compra'))
+            )
+        if campos:
+            # Los campos de ordenamiento siempre se cargan porque los usa el cursor
+            columnas = set(self.pagination_class.ordering)
+            for campo in campos:
+                columnas.update(ClienteListaSerializer.COLUMNAS[campo])
+            queryset = queryset.only(*columnas)
+        return queryset
+    
     @action(detail=False, methods=['get'])
     def buscar(self, request):
         """
@@ -52,74 +132,193 @@ class ClienteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        cache_buscar = cache_local('buscar')
+        clave = (tipo_documento_id, numero_documento)
+        datos = cache_buscar.obtener(clave)
+        if datos is not None:
+            return Response(datos)
+        
         try:
-            from django.db.models import Prefetch
-            cliente = Cliente.objects.select_related('tipo_documento').prefetch_related(
-                Prefetch('compras', queryset=Compra.objects.order_by('-fecha_compra'))
-            ).get(
+            cliente = self._consulta_buscar().get(
                 tipo_documento_id=tipo_documento_id,
                 numero_documento=numero_documento,
                 activo=True
             )
-            serializer = self.get_serializer(cliente)
-            return Response(serializer.data)
-        except Cliente.DoesNotExist:
+            datos = self.get_serializer(cliente).data
+            cache_buscar.guardar(clave, datos)
+            return Response(datos)
+        except (Cliente.DoesNotExist, ValueError):
             return Response(
                 {'error': 'Cliente no encontrado'},
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    @action(detail=False, methods=['post'], url_path='buscar-lote')
+    def buscar_lote(self, request):
+        """
+        Busca varios clientes por tipo y número de documento con un número
+        constante de consultas (PRESUPUESTO_CONSULTAS_BUSCAR)
+        POST /api/clientes/buscar-lote/
+        {"documentos": [{"tipo_documento_id": 1, "numero_documento": "123456789"}, ...]}
+        """
+        entrada = BusquedaLoteSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        documentos = entrada.validated_data['documentos']
+        
+        # numero_documento es único, así que basta un IN y validar el tipo en memoria
+        clientes = {
+            cliente.numero_documento: cliente
+            for cliente in self._consulta_buscar().filter(
+                numero_documento__in={doc['numero_documento'] for doc in documentos},
+                activo=True
+            )
+        }
+        
+        resultados = []
+        for documento in documentos:
+            cliente = clientes.get(documento['numero_documento'])
+            if cliente is not None and cliente.tipo_documento_id != documento['tipo_documento_id']:
+                cliente = None
+            resultados.append({
+                'tipo_documento_id': documento['tipo_documento_id'],
+                'numero_documento': documento['numero_documento'],
+                'encontrado': cliente is not None,
+                'cliente': ClienteBusquedaSerializer(cliente, context=self.get_serializer_context()).data
+                if cliente is not None else None
+            })
+        return Response({'resultados': resultados})
+    
+    @action(detail=False, methods=['get'])
+    def autocompletar(self, request):
+        """
+        Busca clientes activos por el inicio de su nombre, apellido, correo,
+        teléfono o documento, sin distinguir tildes ni mayúsculas, ordenados
+        por relevancia
+        GET /api/clientes/autocompletar/?q=munoz ju&limite=10
+        """
+        try:
+            limite = int(request.query_params.get('limite', LIMITE_RESULTADOS_DEFAULT))
+        except ValueError:
+            return Response(
+                {'error': 'El parámetro limite debe ser un número entero'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limite = max(1, min(limite, LIMITE_RESULTADOS_MAXIMO))
+        
+        clientes = buscar_clientes(request.query_params.get('q', ''), limite)
+        return Response({'resultados': ClienteAutocompletarSerializer(clientes, many=True).data})
+    
+    def _consulta_buscar(self):
+        """Consulta de búsqueda con presupuesto de PRESUPUESTO_CONSULTAS_BUSCAR"""
+        return Cliente.objects.para_busqueda()
+    
+    @action(detail=False, methods=['get'], url_path='exportar-todo')
+    def exportar_todo(self, request):
+        """
+        Exporta todos los clientes con sus compras en streaming
+        GET /api/clientes/exportar-todo/?formato=csv|ndjson&activo=true&tipo_documento_id=1
+            &registro_desde=2024-01-01&registro_hasta=2024-12-31
+        """
+        formato = request.query_params.get('formato', 'csv').lower()
+        if formato not in FORMATOS_EXPORTACION:
+            return Response(
+                {'error': f"Formato no válido. Use: {', '.join(FORMATOS_EXPORTACION)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            filtros = parametros_exportacion(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        content_types = {
+            'csv': 'text/csv; charset=utf-8',
+            'ndjson': 'application/x-ndjson; charset=utf-8',
+        }
+        response = StreamingHttpResponse(
+            exportar_clientes(filtrar_clientes(**filtros), formato),
+            content_type=content_types[formato]
+        )
+        fecha_exportacion = timezone.now().strftime('%Y%m%d_%H%M%S')
+        response['Content-Disposition'] = f'attachment; filename="clientes_{fecha_exportacion}.{formato}"'
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def compras(self, request, pk=None):
+        """
+        Historial de compras del cliente paginado por cursor
+        GET /api/clientes/{id}/compras/?cursor=...&page_size=100&desde=2024-01-01&hasta=2024-12-31
+        """
+        cliente = get_object_or_404(Cliente.objects.only('pk'), pk=pk)
+        try:
+            rango = parametros_rango_fechas(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = CompraKeysetPagination()
+        page = paginator.paginate_queryset(
+            filtrar_compras_cliente(cliente, **rango),
+            request,
+            view=self
+        )
+        serializer = CompraSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    
     @action(detail=True, methods=['get'])
     def exportar(self, request, pk=None):
         """
         Exporta la información del cliente en diferentes formatos
-        GET /api/clientes/{id}/exportar/?formato=csv|excel|txt
+        GET /api/clientes/{id}/exportar/?formato=csv|excel|txt&desde=2024-01-01&hasta=2024-12-31
         """
         cliente = self.get_object()
         formato = request.query_params.get('formato', 'csv').lower()
         
+        try:
+            rango = parametros_rango_fechas(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        compras = compras_de_cliente(cliente, **rango)
+        
         if formato == 'csv':
-            return self._exportar_csv(cliente)
+            return self._exportar_csv(cliente, compras)
         elif formato == 'excel':
-            return self._exportar_excel(cliente)
+            return self._exportar_excel(cliente, compras)
         elif formato == 'txt':
-            return self._exportar_txt(cliente)
+            return self._exportar_txt(cliente, compras)
         else:
             return Response(
                 {'error': 'Formato no válido. Use: csv, excel o txt'},
                 status=status.HTTP_400_BAD_REQUEST
             )
     
-    def _exportar_csv(self, cliente):
-        """Exporta cliente a CSV"""
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="cliente_{cliente.numero_documento}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Campo', 'Valor'])
-        writer.writerow(['Tipo de Documento', cliente.tipo_documento.nombre])
-        writer.writerow(['Número de Documento', cliente.numero_documento])
-        writer.writerow(['Nombre', cliente.nombre])
-        writer.writerow(['Apellido', cliente.apellido])
-        writer.writerow(['Correo', cliente.correo])
-        writer.writerow(['Teléfono', cliente.telefono])
-        writer.writerow(['Fecha de Registro', cliente.fecha_registro.strftime('%Y-%m-%d %H:%M:%S')])
-        
-        # Agregar compras
-        writer.writerow([])
-        writer.writerow(['Compras'])
-        writer.writerow(['Número Factura', 'Fecha', 'Monto', 'Estado'])
-        for compra in cliente.compras.all():
-            writer.writerow([
-                compra.numero_factura,
-                compra.fecha_compra.strftime('%Y-%m-%d'),
-                f"${compra.monto:,.2f}",
-                compra.estado
-            ])
+    def _exportar_csv(self, cliente, compras):
+        """Exporta cliente a CSV en streaming"""
+        def filas():
+            writer = csv.writer(Eco())
+            yield writer.writerow(['Campo', 'Valor'])
+            yield writer.writerow(['Tipo de Documento', cliente.tipo_documento.nombre])
+            yield writer.writerow(['Número de Documento', cliente.numero_documento])
+            yield writer.writerow(['Nombre', cliente.nombre])
+            yield writer.writerow(['Apellido', cliente.apellido])
+            yield writer.writerow(['Correo', cliente.correo])
+            yield writer.writerow(['Teléfono', cliente.telefono])
+            yield writer.writerow(['Fecha de Registro', cliente.fecha_registro.strftime('%Y-%m-%d %H:%M:%S')])
+            
+            # Agregar compras
+            yield writer.writerow([])
+            yield writer.writerow(['Compras'])
+            yield writer.writerow(['Número Factura', 'Fecha', 'Monto', 'Estado'])
+            for compra in compras:
+                yield writer.writerow([
+                    compra.numero_factura,
+                    compra.fecha_compra.strftime('%Y-%m-%d'),
+                    f"${compra.monto:,.2f}",
+                    compra.estado
+                ])
         
+        response = StreamingHttpResponse(filas(), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="cliente_{cliente.numero_documento}.csv"'
         return response
     
-    def _exportar_excel(self, cliente):
+    def _exportar_excel(self, cliente, compras):
         """Exporta cliente a Excel"""
         wb = Workbook()
         ws = wb.active
@@ -148,7 +347,7 @@ class ClienteViewSet(viewsets.ModelViewSet):
             cell.font = header_font
             cell.alignment = Alignment(horizontal='center')
         
-        for compra in cliente.compras.all():
+        for compra in compras:
             ws.append([
                 compra.numero_factura,
                 compra.fecha_compra.strftime('%Y-%m-%d'),
@@ -167,31 +366,33 @@ class ClienteViewSet(viewsets.ModelViewSet):
         wb.save(response)
         return response
     
-    def _exportar_txt(self, cliente):
-        """Exporta cliente a TXT"""
-        output = io.StringIO()
-        output.write("=" * 50 + "\n")
-        output.write("INFORMACIÓN DEL CLIENTE\n")
-        output.write("=" * 50 + "\n\n")
-        output.write(f"Tipo de Documento: {cliente.tipo_documento.nombre}\n")
-        output.write(f"Número de Documento: {cliente.numero_documento}\n")
-        output.write(f"Nombre: {cliente.nombre}\n")
-        output.write(f"Apellido: {cliente.apellido}\n")
-        output.write(f"Correo: {cliente.correo}\n")
-        output.write(f"Teléfono: {cliente.telefono}\n")
-        output.write(f"Fecha de Registro: {cliente.fecha_registro.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-        
-        output.write("=" * 50 + "\n")
-        output.write("COMPRAS\n")
-        output.write("=" * 50 + "\n\n")
-        for compra in cliente.compras.all():
-            output.write(f"Factura: {compra.numero_factura}\n")
-            output.write(f"Fecha: {compra.fecha_compra.strftime('%Y-%m-%d')}\n")
-            output.write(f"Monto: ${compra.monto:,.2f}\n")
-            output.write(f"Estado: {compra.estado}\n")
-            output.write("-" * 50 + "\n")
+    def _exportar_txt(self, cliente, compras):
+        """Exporta cliente a TXT en streaming"""
+        def lineas():
+            yield "=" * 50 + "\n"
+            yield "INFORMACIÓN DEL CLIENTE\n"
+            yield "=" * 50 + "\n\n"
+            yield f"Tipo de Documento: {cliente.tipo_documento.nombre}\n"
+            yield f"Número de Documento: {cliente.numero_documento}\n"
+            yield f"Nombre: {cliente.nombre}\n"
+            yield f"Apellido: {cliente.apellido}\n"
+            yield f"Correo: {cliente.correo}\n"
+            yield f"Teléfono: {cliente.telefono}\n"
+            yield f"Fecha de Registro: {cliente.fecha_registro.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            
+            yield "=" * 50 + "\n"
+            yield "COMPRAS\n"
+            yield "=" * 50 + "\n\n"
+            for compra in compras:
+                yield (
+                    f"Factura: {compra.numero_factura}\n"
+                    f"Fecha: {compra.fecha_compra.strftime('%Y-%m-%d')}\n"
+                    f"Monto: ${compra.monto:,.2f}\n"
+                    f"Estado: {compra.estado}\n"
+                    + "-" * 50 + "\n"
+                )
         
-        response = HttpResponse(output.getvalue(), content_type='text/plain; charset=utf-8')
+        response = StreamingHttpResponse(lineas(), content_type='text/plain; charset=utf-8')
         response['Content-Disposition'] = f'attachment; filename="cliente_{cliente.numero_documento}.txt"'
         return response
 
@@ -203,83 +404,153 @@ class ReporteFidelizacionViewSet(viewsets.ViewSet):
     def generar(self, request):
         """
         Genera reporte en Excel de clientes elegibles para fidelización
-        (compras > 5'000.000 COP en el último mes)
-        GET /api/reporte-fidelizacion/generar/
+        (por defecto compras > 5'000.000 COP en los últimos 30 días); con
+        ?segmentacion=1 incluye la hoja de segmentación RFM
+        GET /api/reporte-fidelizacion/generar/?dias=30&monto_minimo=5000000&segmentacion=1
         """
-        # Calcular fecha del último mes
-        fecha_limite = timezone.now() - timedelta(days=30)
-        monto_minimo = 5000000  # 5 millones de pesos COP
+        try:
+            dias, monto_minimo = parametros_reporte(request.query_params)
+            segmentacion = parametro_segmentacion(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Obtener clientes con compras en el último mes
-        clientes = Cliente.objects.filter(
-            compras__fecha_compra__gte=fecha_limite,
-            compras__estado='completada',
-            activo=True
-        ).distinct()
+        cache_reportes = CacheReportes()
+        clave = cache_reportes.clave_fidelizacion(dias, monto_minimo, segmentacion)
         
-        # Calcular total de compras por cliente en el último mes
-        datos_reporte = []
-        for cliente in clientes:
-            total_compras = Compra.objects.filter(
-                cliente=cliente,
-                fecha_compra__gte=fecha_limite,
-                estado='completada'
-            ).aggregate(total=Sum('monto'))['total'] or 0
+        ruta = cache_reportes.obtener(clave)
+        if ruta is None:
+            archivo = cache_reportes.archivo_temporal()
+            try:
+                with archivo:
+                    total_filas = generar_reporte_xlsx(
+                        archivo,
+                        dias=dias,
+                        monto_minimo=monto_minimo,
+                        incluir_segmentacion=segmentacion
+                    )
+            except Exception:
+                os.unlink(archivo.name)
+                raise
             
-            if total_compras >= monto_minimo:
-                datos_reporte.append({
-                    'Tipo Documento': cliente.tipo_documento.nombre,
-                    'Número Documento': cliente.numero_documento,
-                    'Nombre': cliente.nombre,
-                    'Apellido': cliente.apellido,
-                    'Correo': cliente.correo,
-                    'Teléfono': cliente.telefono,
-                    'Total Compras (COP)': float(total_compras)
-                })
+            if not total_filas:
+                os.unlink(archivo.name)
+                return Response(
+                    {'mensaje': 'No hay clientes que cumplan los criterios de fidelización'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            ruta = cache_reportes.guardar(clave, archivo.name)
+            resultado_cache = 'MISS'
+        else:
+            resultado_cache = 'HIT'
         
-        if not datos_reporte:
-            return Response(
-                {'mensaje': 'No hay clientes que cumplan los criterios de fidelización'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        fecha_reporte = timezone.now().strftime('%Y%m%d_%H%M%S')
+        response = FileResponse(
+            open(ruta, 'rb'),
+            as_attachment=True,
+            filename=f'reporte_fidelizacion_{fecha_reporte}.xlsx',
+            content_type=CONTENT_TYPE_XLSX
+        )
+        response['X-Cache'] = resultado_cache
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def segmentacion(self, request):
+        """
+        Segmentación RFM de los clientes activos con compras en los últimos
+        `dias`: totales por segmento y, con ?segmento=, sus clientes por monto
+        GET /api/reporte-fidelizacion/segmentacion/?dias=365&segmento=Campeones&limite=100
+        """
+        try:
+            dias, segmento, limite = parametros_segmentacion(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Crear DataFrame con pandas
-        df = pd.DataFrame(datos_reporte)
-        df = df.sort_values('Total Compras (COP)', ascending=False)
+        resultado = cache_local('segmentacion').obtener_o_calcular(
+            (dias, timezone.localdate(), version_datos(), marca_snapshot()),
+            lambda: segmentar(dias=dias)
+        )
+        datos = {
+            'fecha_referencia': resultado['fecha_referencia'],
+            'dias': dias,
+            'total_clientes': len(resultado['cliente_id']),
+            'cortes': resultado['cortes'],
+            'segmentos': resumen_segmentos(resultado),
+        }
+        if segmento is not None:
+            datos['clientes'] = list(filas_segmentacion(resultado, segmento=segmento, limite=limite))
+        return Response(datos)
+    
+    @action(detail=False, methods=['get'])
+    def cache(self, request):
+        """
+        Estadísticas del caché de reportes
+        GET /api/reporte-fidelizacion/cache/
+        """
+        return Response(CacheReportes().estadisticas())
+
+
+class TrabajoReporteViewSet(mixins.CreateModelMixin,
+                            mixins.RetrieveModelMixin,
+                            viewsets.GenericViewSet):
+    """
+    ViewSet para generar el reporte de fidelización en segundo plano.
+    Los trabajos los ejecuta el comando procesar_trabajos_reporte.
+    
+    POST /api/reporte-fidelizacion/trabajos/ {"dias": 30, "monto_minimo": 5000000, "segmentacion": true}
+    GET /api/reporte-fidelizacion/trabajos/{id}/
+    GET /api/reporte-fidelizacion/trabajos/{id}/descargar/
+    """
+    queryset = TrabajoReporte.objects.all()
+    serializer_class = TrabajoReporteSerializer
+    
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def descargar(self, request, pk=None):
+        """Descarga el archivo de un trabajo completado"""
+        trabajo = self.get_object()
         
-        # Crear archivo Excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Clientes Fidelización')
-            
-            # Formatear la hoja
-            worksheet = writer.sheets['Clientes Fidelización']
-            
-            # Estilos para encabezados
-            header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            header_font = Font(bold=True, color="FFFFFF")
-            
-            for cell in worksheet[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center')
-            
-            # Ajustar ancho de columnas
-            worksheet.column_dimensions['A'].width = 18
-            worksheet.column_dimensions['B'].width = 20
-            worksheet.column_dimensions['C'].width = 20
-            worksheet.column_dimensions['D'].width = 20
-            worksheet.column_dimensions['E'].width = 30
-            worksheet.column_dimensions['F'].width = 15
-            worksheet.column_dimensions['G'].width = 20
+        if trabajo.estado != TrabajoReporte.ESTADO_COMPLETADO:
+            return Response(
+                {'error': f'El trabajo no está completado (estado: {trabajo.estado})'},
+                status=status.HTTP_409_CONFLICT
+            )
         
-        output.seek(0)
+        ruta = Path(trabajo.archivo)
+        if not ruta.exists():
+            return Response(
+                {'error': 'El archivo del trabajo ya no está disponible'},
+                status=status.HTTP_410_GONE
+            )
         
-        response = HttpResponse(
-            output.read(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return FileResponse(
+            ruta.open('rb'),
+            as_attachment=True,
+            filename=f'reporte_fidelizacion_{trabajo.pk}.xlsx',
+            content_type=CONTENT_TYPE_XLSX
         )
-        fecha_reporte = timezone.now().strftime('%Y%m%d_%H%M%S')
-        response['Content-Disposition'] = f'attachment; filename="reporte_fidelizacion_{fecha_reporte}.xlsx"'
-        return response
 
+
+class CambioViewSet(viewsets.ViewSet):
+    """
+    Feed de cambios de clientes y compras para la sincronización incremental.
+    Se lee desde 0 (o el último cursor guardado) hasta que hay_mas sea false.
+    
+    GET /api/cambios/?desde=0&limite=500&modelo=cliente
+    """
+    
+    def list(self, request):
+        try:
+            desde, limite, modelo = parametros_cambios(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        cambios, cursor, hay_mas = leer_cambios(desde=desde, limite=limite, modelo=modelo)
+        return Response({
+            'cursor': cursor,
+            'hay_mas': hay_mas,
+            'cambios': CambioSerializer(cambios, many=True).data,
+        })
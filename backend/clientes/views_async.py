@@ -0,0 +1,144 @@
+"""
+Vistas asíncronas de los endpoints más concurridos, para servidores ASGI.
+
+Bajo ASGI las vistas síncronas de DRF se ejecutan en el hilo de
+sync_to_async; estas vistas son funciones `async def` de Django que usan el
+ORM asíncrono (aget, acount, async for) y solo salen del event loop para
+el trabajo bloqueante: el reporte de fidelización se genera con el mismo
+generar_reporte_xlsx de la vista síncrona dentro de sync_to_async, que
+escribe las filas por lotes con memoria constante, y el archivo se lee
+en un executor.
+
+Responden lo mismo que sus equivalentes de views.py, con JsonResponse en
+lugar de Response de DRF.
+"""
+import asyncio
+import os
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.request import Request
+
+from .cache import CacheReportes, cache_local
+from .exportacion import filtrar_compras_cliente, parametros_rango_fechas
+from .models import Cliente
+from .pagination import CompraKeysetPagination
+from .reportes import CONTENT_TYPE_XLSX, generar_reporte_xlsx, parametro_segmentacion, parametros_reporte
+from .serializers import ClienteBusquedaSerializer, CompraSerializer
+
+TAMANO_BLOQUE_ARCHIVO = 64 * 1024
+
+
+async def buscar(request):
+    """
+    Busca un cliente por tipo y número de documento
+    GET /api/async/clientes/buscar/?tipo_documento_id=1&numero_documento=123456789
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    tipo_documento_id = request.GET.get('tipo_documento_id')
+    numero_documento = request.GET.get('numero_documento')
+    if not tipo_documento_id or not numero_documento:
+        return JsonResponse({'error': 'Se requiere tipo_documento_id y numero_documento'}, status=400)
+
+    cache_buscar = cache_local('buscar')
+    clave = (tipo_documento_id, numero_documento)
+    datos = cache_buscar.obtener(clave)
+    if datos is not None:
+        return JsonResponse(datos)
+
+    try:
+        cliente = await Cliente.objects.para_busqueda().aget(
+            tipo_documento_id=tipo_documento_id,
+            numero_documento=numero_documento,
+            activo=True
+        )
+    except (Cliente.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Cliente no encontrado'}, status=404)
+
+    datos = ClienteBusquedaSerializer(cliente).data
+    cache_buscar.guardar(clave, datos)
+    return JsonResponse(datos)
+
+
+async def compras(request, pk):
+    """
+    Historial de compras del cliente paginado por cursor
+    GET /api/async/clientes/{id}/compras/?cursor=...&page_size=100&desde=2024-01-01&hasta=2024-12-31
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not await Cliente.objects.filter(pk=pk).aexists():
+        return JsonResponse({'detail': 'No encontrado.'}, status=404)
+    try:
+        rango = parametros_rango_fechas(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    # Elegir entre compras activas o la vista histórica consulta la fecha de corte
+    compras_cliente = await sync_to_async(filtrar_compras_cliente)(pk, **rango)
+    paginator = CompraKeysetPagination()
+    page = await paginator.apaginate_queryset(compras_cliente, Request(request))
+    return JsonResponse(paginator.datos_paginados(CompraSerializer(page, many=True).data))
+
+
+async def generar_reporte(request):
+    """
+    Genera el reporte de fidelización en Excel
+    GET /api/async/reporte-fidelizacion/generar/?dias=30&monto_minimo=5000000&segmentacion=1
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        dias, monto_minimo = parametros_reporte(request.GET)
+        segmentacion = parametro_segmentacion(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    cache_reportes = CacheReportes()
+    clave = await sync_to_async(cache_reportes.clave_fidelizacion)(dias, monto_minimo, segmentacion)
+    ruta = cache_reportes.obtener(clave)
+    if ruta is None:
+        # El mismo generador de la vista síncrona, en el hilo de sync_to_async:
+        # las filas pasan por lotes del cursor a la hoja write-only
+        archivo = cache_reportes.archivo_temporal()
+        try:
+            with archivo:
+                total_filas = await sync_to_async(generar_reporte_xlsx)(
+                    archivo,
+                    dias=dias,
+                    monto_minimo=monto_minimo,
+                    incluir_segmentacion=segmentacion
+                )
+        except Exception:
+            os.unlink(archivo.name)
+            raise
+
+        if not total_filas:
+            os.unlink(archivo.name)
+            return JsonResponse(
+                {'mensaje': 'No hay clientes que cumplan los criterios de fidelización'},
+                status=404
+            )
+        ruta = cache_reportes.guardar(clave, archivo.name)
+        resultado_cache = 'MISS'
+    else:
+        resultado_cache = 'HIT'
+
+    fecha_reporte = timezone.now().strftime('%Y%m%d_%H%M%S')
+    # Abierto aquí para que una expulsión del caché no afecte la descarga en curso
+    archivo = open(ruta, 'rb')
+    response = StreamingHttpResponse(_leer_archivo(archivo), content_type=CONTENT_TYPE_XLSX)
+    response['Content-Disposition'] = f'attachment; filename="reporte_fidelizacion_{fecha_reporte}.xlsx"'
+    response['Content-Length'] = os.fstat(archivo.fileno()).st_size
+    response['X-Cache'] = resultado_cache
+    return response
+
+
+async def _leer_archivo(archivo):
+    """Lee el archivo por bloques en el executor y lo cierra al terminar"""
+    loop = asyncio.get_running_loop()
+    with archivo:
+        while bloque := await loop.run_in_executor(None, archivo.read, TAMANO_BLOQUE_ARCHIVO):
+            yield bloque
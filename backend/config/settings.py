@@ -36,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'clientes.middleware.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -69,12 +70,54 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite por defecto; DB_ENGINE=postgresql selecciona PostgreSQL con los
+# datos de conexión DB_NAME, DB_USER, DB_PASSWORD, DB_HOST y DB_PORT.
+# Las conexiones son persistentes (DB_CONN_MAX_AGE segundos, 0 las cierra en
+# cada solicitud) y se verifican antes de reutilizarse.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'cinte'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # Detrás de PgBouncer en modo transacción los cursores del lado
+            # del servidor (usados por iterator()) no sobreviven entre consultas
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER', '') == '1',
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Segundos que espera el driver por un bloqueo de escritura
+                'timeout': 20,
+            },
+        }
     }
+
+# PRAGMA aplicados a cada conexión SQLite nueva (clientes.db)
+CLIENTES_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -64000,  # negativo = KiB, ~64 MB
+    'mmap_size': 268435456,  # 256 MB
+    'temp_store': 'MEMORY',
 }
 
 
@@ -128,6 +171,52 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 100
 }
 
+# Clientes
+# El reporte de fidelización lee los totales del resumen diario de compras
+# (ResumenCompraDiaria) en lugar de sumar cada compra. El resumen solo aporta
+# los días completos de la ventana; el día parcial inicial se suma desde las
+# compras, así que ambos caminos dan el mismo resultado
+CLIENTES_REPORTE_USAR_RESUMEN = True
+
+# Caché en disco de reportes generados, invalidado por versión de datos
+CLIENTES_CACHE_REPORTES_DIR = BASE_DIR / 'cache_reportes'
+CLIENTES_CACHE_REPORTES_MAX_BYTES = 200 * 1024 * 1024
+
+# Caché local (por proceso) del catálogo de tipos de documento y de buscar.
+# MAX_ENTRADAS acota el tamaño (LRU) y TTL es la expiración en segundos
+CLIENTES_CACHE_LOCAL = {
+    'catalogo': {'MAX_ENTRADAS': 32, 'TTL': 300},
+    'buscar': {'MAX_ENTRADAS': 1000, 'TTL': 60, 'MAX_BYTES': 32 * 1024 * 1024, 'MAX_BYTES_ENTRADA': 256 * 1024},
+    'segmentacion': {'MAX_ENTRADAS': 4, 'TTL': 300},
+}
+
+# Máximo de documentos por solicitud en POST /api/clientes/buscar-lote/
+CLIENTES_BUSCAR_LOTE_MAX = 500
+
+# Trabajos de reporte en segundo plano (comando procesar_trabajos_reporte)
+CLIENTES_TRABAJOS_DIR = BASE_DIR / 'reportes_generados'
+CLIENTES_TRABAJOS_RETENCION_HORAS = 24
+CLIENTES_TRABAJOS_TIEMPO_MAXIMO_MINUTOS = 60
+
+# Horizonte en días del comando archivar_compras: las compras más antiguas se
+# mueven a CompraArchivada
+CLIENTES_ARCHIVO_DIAS = 730
+
+# Snapshot columnar de compras (comando actualizar_snapshot_compras). Con
+# CLIENTES_REPORTE_USAR_SNAPSHOT=1 en el entorno, el reporte de fidelización y la
+# segmentación RFM lo leen en lugar de las tablas de compras
+CLIENTES_SNAPSHOT_DIR = BASE_DIR / 'snapshot_compras'
+CLIENTES_REPORTE_USAR_SNAPSHOT = os.environ.get('CLIENTES_REPORTE_USAR_SNAPSHOT', '') == '1'
+
+# Instrumentación por solicitud (clientes.middleware): consultas SQL, tiempos,
+# encabezado Server-Timing y log de consultas lentas o repetidas (N+1)
+CLIENTES_INSTRUMENTACION = {
+    'ACTIVA': os.environ.get('CLIENTES_INSTRUMENTACION', '') == '1',
+    'CONSULTA_LENTA_MS': 100,
+    'UMBRAL_DUPLICADAS': 5,
+    'SERVER_TIMING': True,
+}
+
 # CORS
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -136,3 +225,19 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'clientes': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}